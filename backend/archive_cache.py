@@ -0,0 +1,121 @@
+import json
+import os
+import re
+import sqlite3
+import time
+import zlib
+from datetime import datetime, timezone
+from typing import Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_URL = re.compile(r"/games/(\d{4})/(\d{2})/?$")
+
+# Games can be added to a month's archive shortly after it ends, so a copy only
+# counts as final when it was fetched this long after the month rolled over.
+CLOSED_GRACE_SECONDS = 2 * 24 * 3600
+
+def archive_month(url: str) -> Optional[str]:
+    """Month of an archive URL as YYYY/MM, which sorts chronologically as a string"""
+    match = ARCHIVE_URL.search(url)
+    return f"{match.group(1)}/{match.group(2)}" if match else None
+
+class ArchiveCache:
+    """Compressed on-disk store of monthly game archives keyed by archive URL.
+
+    Archives of closed months are immutable and served without a network call;
+    the current month keeps its ETag/Last-Modified for conditional revalidation.
+    Total stored size is capped, evicting least recently used archives first.
+    """
+
+    def __init__(self, path: str, max_bytes: int, fresh_seconds: float = 300):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.fresh_seconds = fresh_seconds
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS archives (
+            url TEXT PRIMARY KEY,
+            body BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            etag TEXT,
+            last_modified TEXT,
+            fetched_at REAL NOT NULL,
+            accessed_at REAL NOT NULL
+        )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS archives_accessed ON archives (accessed_at)")
+        self.conn.commit()
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM archives").fetchone()[0]
+
+    @staticmethod
+    def month_end(url: str) -> Optional[float]:
+        """Timestamp at which the archive's month ends, or None for non-archive URLs"""
+        match = ARCHIVE_URL.search(url)
+        if not match:
+            return None
+        year, month = int(match.group(1)), int(match.group(2))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return datetime(year, month, 1, tzinfo=timezone.utc).timestamp()
+
+    def get(self, url: str) -> Optional[Dict]:
+        """Return the cached entry as {data, etag, last_modified, final, fresh}"""
+        row = self.conn.execute(
+            "SELECT body, etag, last_modified, fetched_at FROM archives WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        body, etag, last_modified, fetched_at = row
+        now = time.time()
+        self.conn.execute("UPDATE archives SET accessed_at = ? WHERE url = ?", (now, url))
+        self.conn.commit()
+
+        month_end = self.month_end(url)
+        return {
+            "data": json.loads(zlib.decompress(body)),
+            "etag": etag,
+            "last_modified": last_modified,
+            "final": month_end is not None and fetched_at >= month_end + CLOSED_GRACE_SECONDS,
+            "fresh": now - fetched_at < self.fresh_seconds,
+        }
+
+    def put(self, url: str, data: Dict, etag: Optional[str] = None, last_modified: Optional[str] = None):
+        body = zlib.compress(json.dumps(data, separators=(",", ":")).encode(), 6)
+        now = time.time()
+        previous = self.conn.execute("SELECT size FROM archives WHERE url = ?", (url,)).fetchone()
+        self.conn.execute("""
+        INSERT OR REPLACE INTO archives (url, body, size, etag, last_modified, fetched_at, accessed_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (url, body, len(body), etag, last_modified, now, now))
+        self.total_bytes += len(body) - (previous[0] if previous else 0)
+        self._evict()
+        self.conn.commit()
+
+    def touch(self, url: str):
+        """Mark a cached archive as revalidated (304 Not Modified)"""
+        now = time.time()
+        self.conn.execute("UPDATE archives SET fetched_at = ?, accessed_at = ? WHERE url = ?", (now, now, url))
+        self.conn.commit()
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes:
+            rows = self.conn.execute(
+                "SELECT url, size FROM archives ORDER BY accessed_at LIMIT 100"
+            ).fetchall()
+            if not rows:
+                self.total_bytes = 0
+                return
+            for url, size in rows:
+                self.conn.execute("DELETE FROM archives WHERE url = ?", (url,))
+                self.total_bytes -= size
+                if self.total_bytes <= self.max_bytes:
+                    break
+            logger.debug(f"Archive cache evicted down to {self.total_bytes} bytes")
+
+    def close(self):
+        self.conn.close()
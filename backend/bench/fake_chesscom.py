@@ -0,0 +1,115 @@
+import asyncio
+import random
+import socket
+import threading
+import time
+from typing import Dict, Optional
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from bench.synthetic import SyntheticGraph
+
+class FakeChessCom:
+    """Local stand-in for the chess.com published-data API, backed by a SyntheticGraph.
+
+    Serves /player/{username}, /player/{username}/games/archives and the
+    monthly archives under base_url. Every response is delayed by `latency`
+    seconds (exponentially distributed around it), and a `throttle_rate`
+    fraction of requests is answered 429 with a Retry-After header.
+    """
+
+    def __init__(self, graph: SyntheticGraph, latency: float = 0.0, throttle_rate: float = 0.0,
+                 retry_after: float = 1.0, seed: int = 3):
+        self.graph = graph
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.base_url: Optional[str] = None
+        self.stats = {"requests": 0, "throttled": 0, "not_found": 0, "archives": 0, "profiles": 0}
+        self.app = Starlette(routes=[
+            Route("/pub/player/{username}", self.profile),
+            Route("/pub/player/{username}/games/archives", self.archive_list),
+            Route("/pub/player/{username}/games/{year:int}/{month:int}", self.archive),
+        ])
+        self.server: Optional[uvicorn.Server] = None
+        self.thread: Optional[threading.Thread] = None
+
+    async def _gate(self) -> Optional[JSONResponse]:
+        """Apply injected latency and throttling; returns the 429 response when throttled"""
+        self.stats["requests"] += 1
+        if self.latency:
+            await asyncio.sleep(self.random.expovariate(1 / self.latency))
+        if self.throttle_rate and self.random.random() < self.throttle_rate:
+            self.stats["throttled"] += 1
+            return JSONResponse({"message": "Too many requests"}, status_code=429,
+                                headers={"Retry-After": str(self.retry_after)})
+        return None
+
+    def _not_found(self) -> JSONResponse:
+        self.stats["not_found"] += 1
+        return JSONResponse({"code": 0, "message": "User not found"}, status_code=404)
+
+    async def profile(self, request):
+        throttled = await self._gate()
+        if throttled is not None:
+            return throttled
+        profile = self.graph.profiles.get(request.path_params["username"].lower())
+        if profile is None:
+            return self._not_found()
+        self.stats["profiles"] += 1
+        return JSONResponse(profile)
+
+    async def archive_list(self, request):
+        throttled = await self._gate()
+        if throttled is not None:
+            return throttled
+        username = request.path_params["username"].lower()
+        if username not in self.graph.archives:
+            return self._not_found()
+        return JSONResponse({"archives": [
+            f"{self.base_url}/player/{username}/games/{year}/{month:02d}"
+            for year, month in self.graph.archive_months(username)
+        ]})
+
+    async def archive(self, request):
+        throttled = await self._gate()
+        if throttled is not None:
+            return throttled
+        params = request.path_params
+        username = params["username"].lower()
+        if username not in self.graph.archives:
+            return self._not_found()
+        self.stats["archives"] += 1
+        return JSONResponse({"games": self.graph.archive(username, params["year"], params["month"])})
+
+    def start(self) -> str:
+        """Serve on a free localhost port in a background thread; returns the API base URL"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}/pub"
+
+        config = uvicorn.Config(self.app, log_level="warning", access_log=False, lifespan="off")
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, kwargs={"sockets": [sock]}, daemon=True)
+        self.thread.start()
+        deadline = time.time() + 10
+        while not self.server.started:
+            if time.time() > deadline:
+                raise RuntimeError("fake chess.com server did not start")
+            time.sleep(0.01)
+        return self.base_url
+
+    def stop(self):
+        if self.server is not None:
+            self.server.should_exit = True
+            self.thread.join(timeout=10)
+
+    def reset_stats(self) -> Dict:
+        stats = dict(self.stats)
+        for key in self.stats:
+            self.stats[key] = 0
+        return stats
@@ -0,0 +1,367 @@
+"""Offline benchmarks against a local stand-in for chess.com.
+
+Run from backend/:
+
+    python -m bench.run --players 2000 --pairs 10000 --output bench.json
+
+Scenarios that write to Neo4j need a disposable database (BENCH_NEO4J_URI,
+default bolt://localhost:7687); they are skipped when it is unreachable, and
+a database that already holds players is only wiped with --reset.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+from bench.synthetic import SyntheticGraph
+from bench.fake_chesscom import FakeChessCom
+
+logger = logging.getLogger("bench")
+
+RESULT_VERSION = 1
+
+def percentiles(samples: List[float]) -> Dict:
+    """Latency summary in milliseconds (nearest-rank percentiles)"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def rank(p):
+        return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))] * 1000
+
+    return {
+        "p50": round(rank(50), 3),
+        "p90": round(rank(90), 3),
+        "p99": round(rank(99), 3),
+        "max": round(ordered[-1] * 1000, 3),
+        "mean": round(sum(ordered) / len(ordered) * 1000, 3)
+    }
+
+def result(name: str, ops: int, seconds: float, unit: str, latencies: Optional[List[float]] = None,
+           **extra) -> Dict:
+    return {
+        "scenario": name,
+        "status": "ok",
+        "ops": ops,
+        "unit": unit,
+        "seconds": round(seconds, 4),
+        "throughput": round(ops / seconds, 2) if seconds else None,
+        "latency_ms": percentiles(latencies or []),
+        **extra
+    }
+
+def skipped(name: str, reason: str) -> Dict:
+    return {"scenario": name, "status": "skipped", "reason": reason}
+
+async def timed(call: Callable, latencies: List[float]):
+    start = time.perf_counter()
+    value = await call()
+    latencies.append(time.perf_counter() - start)
+    return value
+
+async def bounded(calls: List[Callable], concurrency: int, latencies: List[float]):
+    """Run the calls with at most `concurrency` in flight, timing each one"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(call):
+        async with semaphore:
+            return await timed(call, latencies)
+
+    return await asyncio.gather(*(run(call) for call in calls))
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=2000, help="synthetic players")
+    parser.add_argument("--pairs", type=int, default=10000, help="distinct player pairs that played")
+    parser.add_argument("--months", type=int, default=12, help="months of game history")
+    parser.add_argument("--games-per-pair", type=float, default=3.0)
+    parser.add_argument("--exponent", type=float, default=0.8, help="power-law exponent of player weights")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.005, help="mean injected server latency (s)")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of requests answered 429")
+    parser.add_argument("--retry-after", type=float, default=0.05, help="Retry-After sent with 429s (s)")
+    parser.add_argument("--rate", type=float, default=500.0, help="client limiter rate (requests/s)")
+    parser.add_argument("--min-rate", type=float, default=50.0, help="floor the limiter backs off to on 429s")
+    parser.add_argument("--lookups", type=int, default=200, help="players sampled for lookup scenarios")
+    parser.add_argument("--ingest-players", type=int, default=20, help="players for the ingest_player scenario")
+    parser.add_argument("--new-games", type=int, default=2000, help="games added before incremental_update")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent API lookups")
+    parser.add_argument("--scenarios", default="all", help="comma separated subset of scenario names")
+    parser.add_argument("--neo4j-uri", default=os.environ.get("BENCH_NEO4J_URI", "bolt://localhost:7687"))
+    parser.add_argument("--neo4j-user", default=os.environ.get("BENCH_NEO4J_USER", "neo4j"))
+    parser.add_argument("--neo4j-password", default=os.environ.get("BENCH_NEO4J_PASSWORD", "password"))
+    parser.add_argument("--reset", action="store_true", help="wipe a non-empty benchmark database")
+    parser.add_argument("--output", help="write the JSON results here (default: stdout)")
+    return parser.parse_args(argv)
+
+def configure_environment(args, base_url: str, workdir: str):
+    """Point the backend's settings at the fake server, a scratch directory and the benchmark database"""
+    os.environ.update({
+        "NEO4J_URI": args.neo4j_uri,
+        "NEO4J_USER": args.neo4j_user,
+        "NEO4J_PASSWORD": args.neo4j_password,
+        "CHESS_API_BASE_URL": base_url,
+        "CHESS_API_HTTP2": "false",
+        "CHESS_API_RATE": str(args.rate),
+        "CHESS_API_MAX_RATE": str(args.rate),
+        "CHESS_API_MIN_RATE": str(args.min_rate),
+        "CHESS_API_BURST": str(max(5, int(args.rate // 10))),
+        "CHESS_API_BACKOFF_BASE": "0.05",
+        "ARCHIVE_CACHE_PATH": os.path.join(workdir, "archives.sqlite3"),
+        "PROGRESS_JOURNAL_PATH": os.path.join(workdir, "progress.sqlite3"),
+        "GRAPH_SNAPSHOT_PATH": os.path.join(workdir, "graph.snapshot"),
+        "PATH_CACHE_ENABLED": "false",
+        "GITHUB_ACTIONS_MODE": "false",
+        "MAX_TOTAL_PLAYERS": str(args.players),
+        "MAX_PLAYERS_PER_LEVEL": str(args.players),
+        "MAX_MONTHS_HISTORICAL": str(args.months),
+    })
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Scenarios without Neo4j
+
+async def scenario_fetch(graph: SyntheticGraph, server: FakeChessCom, args, name: str) -> Dict:
+    """Archive list + every monthly archive for sampled players through chess_api"""
+    from chess_api import get_archive_urls, fetch_archive
+
+    players = graph.sample(args.lookups)
+    latencies: List[float] = []
+    server.reset_stats()
+    start = time.perf_counter()
+
+    async def player(username):
+        urls = await get_archive_urls(username)
+        await bounded([lambda url=url: fetch_archive(url) for url in urls], len(urls) or 1, latencies)
+
+    await asyncio.gather(*(player(username) for username in players))
+    seconds = time.perf_counter() - start
+    return result(name, len(latencies), seconds, "archives", latencies, server=server.reset_stats())
+
+async def scenario_engine(graph: SyntheticGraph, args) -> Dict:
+    """In-process CSR engine: build from the synthetic edges, snapshot round trip, path lookups"""
+    from graph_engine import GraphEngine
+    from snapshot import write_snapshot
+
+    players = [(username, graph.profiles[username]["avatar"], graph.profiles[username]["title"])
+               for username in graph.usernames]
+    edges = [(a, b, {"url": None, "date": None}) for a, b in graph.pairs]
+    start = time.perf_counter()
+    engine = GraphEngine.from_edges(players, edges)
+    build_seconds = time.perf_counter() - start
+
+    path = os.environ["GRAPH_SNAPSHOT_PATH"]
+    write_snapshot(path, engine.usernames, engine.avatars, engine.titles,
+                   engine.offsets, engine.neighbors, engine.edge_ids, engine.games)
+    start = time.perf_counter()
+    mapped = GraphEngine.from_snapshot(path)
+    snapshot_seconds = time.perf_counter() - start
+
+    latencies: List[float] = []
+    found = 0
+    start = time.perf_counter()
+    for username in graph.sample(args.lookups):
+        begin = time.perf_counter()
+        found += mapped.find_path(username) is not None
+        latencies.append(time.perf_counter() - begin)
+    seconds = time.perf_counter() - start
+    return result("engine_find_path", len(latencies), seconds, "lookups", latencies, found=found,
+                  build_seconds=round(build_seconds, 4), snapshot_load_seconds=round(snapshot_seconds, 4))
+
+# Scenarios against Neo4j
+
+def prepare_database(args) -> Optional[str]:
+    """Return a reason to skip the Neo4j scenarios, or None once the database is empty"""
+    from ingest import driver
+    try:
+        driver.verify_connectivity()
+        with driver.session() as session:
+            players = session.run("MATCH (p:Player) RETURN count(p) AS count").single()["count"]
+    except Exception as e:
+        return f"Neo4j at {args.neo4j_uri} is unavailable: {e}"
+    if players and not args.reset:
+        return f"benchmark database holds {players} players; pass --reset to wipe it"
+    wipe_database()
+    return None
+
+def wipe_database():
+    from ingest import driver
+    with driver.session() as session:
+        while session.run("""
+        MATCH (n) WITH n LIMIT 10000
+        DETACH DELETE n
+        RETURN count(n) AS deleted
+        """).single()["deleted"]:
+            pass
+
+async def scenario_ingest_player(graph: SyntheticGraph, args) -> Dict:
+    from ingest import ingest_player
+
+    wipe_database()
+    players = graph.sample(args.ingest_players, seed=4)
+    latencies: List[float] = []
+    start = time.perf_counter()
+    for username in players:
+        await timed(lambda: ingest_player(username, args.months), latencies)
+    seconds = time.perf_counter() - start
+    games = sum(len(games) for username in players for games in graph.archives[username].values())
+    return result("ingest_player", len(players), seconds, "players", latencies, games=games)
+
+async def scenario_historical(graph: SyntheticGraph, args) -> Dict:
+    from enhanced_ingest import EnhancedIngestion, schema_manager
+
+    wipe_database()
+    schema_manager.create_constraints_and_indexes()
+    start = time.perf_counter()
+    await EnhancedIngestion().ingest_historical_data("magnuscarlsen")
+    seconds = time.perf_counter() - start
+    stats = schema_manager.get_database_stats()
+    return result("ingest_historical_data", stats["players"], seconds, "players",
+                  relationships=stats["relationships"], games=stats["total_games"])
+
+async def scenario_incremental(graph: SyntheticGraph, args) -> Dict:
+    from enhanced_ingest import EnhancedIngestion, schema_manager
+    from ingest import driver
+
+    graph.add_recent_games(args.new_games)
+    with driver.session() as session:
+        players = session.run("""
+        MATCH (p:Player)
+        SET p.last_updated = datetime() - duration({days: 31})
+        RETURN count(p) AS count
+        """).single()["count"]
+    start = time.perf_counter()
+    await EnhancedIngestion().incremental_update(months=1)
+    seconds = time.perf_counter() - start
+    stats = schema_manager.get_database_stats()
+    return result("incremental_update", players, seconds, "players", new_games=args.new_games,
+                  games=stats["total_games"])
+
+async def scenario_find_path(graph: SyntheticGraph, args) -> Dict:
+    from graph import find_path
+
+    players = graph.sample(args.lookups, seed=5)
+    latencies: List[float] = []
+    start = time.perf_counter()
+    found = await bounded([lambda username=username: find_path(username) for username in players],
+                          args.concurrency, latencies)
+    seconds = time.perf_counter() - start
+    return result("find_path", len(players), seconds, "lookups", latencies,
+                  found=sum(1 for r in found if r["path"]))
+
+async def scenario_search(graph: SyntheticGraph, args) -> Dict:
+    import httpx
+    from main import app
+
+    rng = random.Random(6)
+    prefixes = [username[:rng.randint(3, len(username))] for username in graph.sample(args.lookups, seed=6)]
+    latencies: List[float] = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        start = time.perf_counter()
+        responses = await bounded(
+            [lambda prefix=prefix: client.get("/players/search", params={"q": prefix}) for prefix in prefixes],
+            args.concurrency, latencies
+        )
+        seconds = time.perf_counter() - start
+    errors = sum(1 for r in responses if r.status_code != 200)
+    return result("players_search", len(prefixes), seconds, "requests", latencies, errors=errors)
+
+SCENARIOS = ["fetch_cold", "fetch_warm", "engine_find_path", "ingest_player",
+             "ingest_historical_data", "incremental_update", "find_path", "players_search"]
+NEO4J_SCENARIOS = SCENARIOS[3:]
+
+async def run(args, graph: SyntheticGraph, server: FakeChessCom) -> List[Dict]:
+    from chess_api import close_client
+    from ingest import async_driver
+
+    selected = SCENARIOS if args.scenarios == "all" else [s for s in args.scenarios.split(",") if s]
+    unknown = set(selected) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    results = []
+    try:
+        if "fetch_cold" in selected:
+            results.append(await scenario_fetch(graph, server, args, "fetch_cold"))
+        if "fetch_warm" in selected:
+            results.append(await scenario_fetch(graph, server, args, "fetch_warm"))
+        if "engine_find_path" in selected:
+            results.append(await scenario_engine(graph, args))
+
+        database = [name for name in NEO4J_SCENARIOS if name in selected]
+        reason = prepare_database(args) if database else None
+        steps = {
+            "ingest_player": scenario_ingest_player,
+            "ingest_historical_data": scenario_historical,
+            "incremental_update": scenario_incremental,
+            "find_path": scenario_find_path,
+            "players_search": scenario_search,
+        }
+        for name in database:
+            if reason is not None:
+                results.append(skipped(name, reason))
+                continue
+            server.reset_stats()
+            outcome = await steps[name](graph, args)
+            outcome["server"] = server.reset_stats()
+            results.append(outcome)
+    finally:
+        await close_client()
+        await async_driver.close()
+    return results
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    logger.setLevel(logging.INFO)
+
+    logger.info(f"Generating {args.players} players / {args.pairs} pairs over {args.months} months")
+    graph = SyntheticGraph(args.players, args.pairs, args.months, args.games_per_pair, args.exponent, args.seed)
+    server = FakeChessCom(graph, args.latency, args.throttle_rate, args.retry_after)
+    base_url = server.start()
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    # The backend modules read their settings when first imported, so this precedes every import of them
+    configure_environment(args, base_url, workdir)
+
+    try:
+        results = asyncio.run(run(args, graph, server))
+    finally:
+        server.stop()
+
+    report = {
+        "version": RESULT_VERSION,
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "config": {key: value for key, value in vars(args).items() if key != "neo4j_password"},
+        "graph": {"players": len(graph.usernames), "pairs": len(graph.pairs), "games": graph.games},
+        "scenarios": results
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    for entry in results:
+        if entry["status"] == "ok":
+            logger.info(f"{entry['scenario']:<24} {entry['throughput']} {entry['unit']}/s "
+                        f"p50={entry['latency_ms'].get('p50')}ms p99={entry['latency_ms'].get('p99')}ms")
+        else:
+            logger.info(f"{entry['scenario']:<24} skipped: {entry['reason']}")
+
+if __name__ == "__main__":
+    main()
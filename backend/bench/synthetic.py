@@ -0,0 +1,122 @@
+import bisect
+import itertools
+import random
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+
+TIME_CONTROLS = [("60", "bullet"), ("180+2", "blitz"), ("300", "blitz"), ("600", "rapid"), ("1/86400", "daily")]
+RESULTS = [("win", "resigned"), ("checkmated", "win"), ("agreed", "agreed"), ("timeout", "win"), ("win", "timeout")]
+
+def month_start(year: int, month: int) -> int:
+    return int(datetime(year, month, 1, tzinfo=timezone.utc).timestamp())
+
+def previous_months(now: datetime, count: int) -> List[Tuple[int, int]]:
+    """The count calendar months ending with now's month, oldest first"""
+    months = []
+    year, month = now.year, now.month
+    for _ in range(count):
+        months.append((year, month))
+        year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+    return months[::-1]
+
+class SyntheticGraph:
+    """Player graph with power-law degrees and a month-by-month game history.
+
+    Player i gets weight (i + 1) ** -exponent and pairs are drawn with
+    probability proportional to the product of their weights (Chung-Lu), so a
+    few players have thousands of opponents and most have a handful. Player 0
+    is magnuscarlsen, the best connected. Each pair plays a geometric number
+    of games spread over the simulated months; every game appears in both
+    players' monthly archives, as on chess.com.
+    """
+
+    def __init__(self, players: int = 2000, pairs: int = 10000, months: int = 12,
+                 games_per_pair: float = 3.0, exponent: float = 0.8, seed: int = 1,
+                 now: datetime = None):
+        self.random = random.Random(seed)
+        self.now = now or datetime.now(timezone.utc)
+        self.months = previous_months(self.now, months)
+        self.usernames = ["magnuscarlsen"] + [f"player{i:06d}" for i in range(1, players)]
+        self.archives: Dict[str, Dict[Tuple[int, int], List[Dict]]] = {u: {} for u in self.usernames}
+        self.profiles = {
+            username: {
+                "username": username,
+                "avatar": f"https://images.example/{username}.png",
+                "title": "GM" if i < max(1, players // 500) else None,
+                "name": username.title(),
+                "country": "https://api.chess.com/pub/country/NO",
+                "joined": 1262304000
+            }
+            for i, username in enumerate(self.usernames)
+        }
+        self._game_ids = itertools.count(1)
+        self.pairs = self._draw_pairs(pairs, exponent)
+        self.games = 0
+        for a, b in self.pairs:
+            count = 1
+            while self.random.random() > 1 / games_per_pair:
+                count += 1
+            for _ in range(count):
+                self._add_game(a, b, self.random.choice(self.months))
+
+    def _draw_pairs(self, count: int, exponent: float) -> List[Tuple[str, str]]:
+        weights = [(i + 1) ** -exponent for i in range(len(self.usernames))]
+        cumulative = list(itertools.accumulate(weights))
+        total = cumulative[-1]
+
+        def draw():
+            return bisect.bisect_left(cumulative, self.random.random() * total)
+
+        pairs = set()
+        attempts = 0
+        while len(pairs) < count and attempts < count * 20:
+            attempts += 1
+            a, b = draw(), draw()
+            if a != b:
+                pairs.add((min(a, b), max(a, b)))
+        return [(self.usernames[a], self.usernames[b]) for a, b in sorted(pairs)]
+
+    def _add_game(self, a: str, b: str, month: Tuple[int, int], end_time: int = None):
+        year, number = month
+        start = month_start(year, number)
+        if end_time is None:
+            end = month_start(*((year + 1, 1) if number == 12 else (year, number + 1)))
+            end = min(end, int(self.now.timestamp()))
+            end_time = self.random.randrange(start, max(start + 1, end))
+        white, black = (a, b) if self.random.random() < 0.5 else (b, a)
+        time_control, time_class = self.random.choice(TIME_CONTROLS)
+        white_result, black_result = self.random.choice(RESULTS)
+        game = {
+            "url": f"https://www.chess.com/game/live/{next(self._game_ids)}",
+            "end_time": end_time,
+            "time_control": time_control,
+            "time_class": time_class,
+            "rated": self.random.random() < 0.8,
+            "white": {"username": white, "rating": 1500, "result": white_result},
+            "black": {"username": black, "rating": 1500, "result": black_result},
+            "pgn": "[Event \"Live Chess\"] 1. e4 e5 2. Nf3 Nc6 *"
+        }
+        for username in (a, b):
+            self.archives[username].setdefault(month, []).append(game)
+        self.games += 1
+
+    def add_recent_games(self, count: int) -> int:
+        """Play count more games in the current month, ending after every existing game"""
+        month = self.months[-1]
+        latest = int(self.now.timestamp())
+        for i in range(count):
+            a, b = self.random.choice(self.pairs)
+            self._add_game(a, b, month, end_time=latest + i + 1)
+        return count
+
+    def archive_months(self, username: str) -> List[Tuple[int, int]]:
+        return sorted(self.archives.get(username, {}))
+
+    def archive(self, username: str, year: int, month: int) -> List[Dict]:
+        games = self.archives.get(username, {}).get((year, month), [])
+        return sorted(games, key=lambda game: game["end_time"])
+
+    def sample(self, count: int, seed: int = 2) -> List[str]:
+        """Players with at least one game, for lookups"""
+        active = [username for username in self.usernames if self.archives[username]]
+        return random.Random(seed).sample(active, min(count, len(active)))
@@ -1,27 +1,254 @@
 import httpx
 import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+from pydantic_settings import BaseSettings
+from archive_cache import ArchiveCache
+from metrics import CACHE_LOOKUPS, CHESS_API_REQUESTS, CHESS_API_RETRIES, CHESS_API_SECONDS
 
-lock = asyncio.Lock()
+class Settings(BaseSettings):
+    chess_api_base_url: str = "https://api.chess.com/pub"   # Pointed at a local stand-in by the benchmarks
+    chess_api_max_concurrency: int = 8      # Requests in flight at once, across all callers
+    chess_api_max_connections: int = 16     # Size of the pooled connection set
+    chess_api_timeout: float = 30.0
+    chess_api_http2: bool = True
+    chess_api_rate: float = 5.0             # Initial requests/second for the shared limiter
+    chess_api_min_rate: float = 0.5
+    chess_api_max_rate: float = 20.0
+    chess_api_burst: int = 5
+    chess_api_max_retries: int = 5          # Retries on 429/5xx/transport errors
+    chess_api_backoff_base: float = 1.0
+    chess_api_backoff_cap: float = 60.0
+    archive_cache_enabled: bool = True
+    archive_cache_path: str = "cache/archives.sqlite3"
+    archive_cache_max_mb: int = 512
+    archive_cache_fresh_seconds: float = 300   # Skip revalidating the current month for this long
 
-BASE = "https://api.chess.com/pub"
+    class Config:
+        env_file = ".env"
+        extra = "ignore"
 
-async def fetch(url):
-    async with lock:
-        async with httpx.AsyncClient() as client:
-            r = await client.get(url)
+settings = Settings()
+
+BASE = settings.chess_api_base_url.rstrip("/")
+
+class RateLimiter:
+    """Token bucket shared by all chess.com calls, tuned AIMD style.
+
+    Each success counts towards an additive rate increase; a 429/5xx halves
+    the rate and, when the server sends Retry-After, blocks every caller
+    until that moment has passed.
+    """
+
+    def __init__(self, rate: float, min_rate: float, max_rate: float, burst: int,
+                 increase_step: float = 0.5, increase_after: int = 20, decrease_factor: float = 0.5):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.increase_step = increase_step
+        self.increase_after = increase_after
+        self.decrease_factor = decrease_factor
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.successes = 0
+
+    def _reserve(self) -> float:
+        """Take one token and return how long the caller must wait for it"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.blocked_until - now)
+
+    async def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def on_success(self):
+        self.successes += 1
+        if self.successes >= self.increase_after:
+            self.rate = min(self.max_rate, self.rate + self.increase_step)
+            self.successes = 0
+
+    def on_throttle(self, retry_after: float = None):
+        self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+        self.successes = 0
+        self.tokens = min(self.tokens, 0.0)
+        if retry_after:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+limiter = RateLimiter(
+    settings.chess_api_rate,
+    settings.chess_api_min_rate,
+    settings.chess_api_max_rate,
+    settings.chess_api_burst,
+)
+
+def _parse_retry_after(value):
+    """Retry-After is either delta-seconds or an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def _backoff(attempt):
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(settings.chess_api_backoff_cap, settings.chess_api_backoff_base * 2 ** attempt))
+
+def _is_retryable(status_code):
+    return status_code == 429 or status_code >= 500
+
+# One long-lived pooled client shared by every caller in the process.
+# Created lazily so it binds to the running event loop, closed by close_client().
+_client = None
+_semaphore = None
+
+_archive_cache = None
+
+def get_archive_cache():
+    global _archive_cache
+    if _archive_cache is None and settings.archive_cache_enabled:
+        _archive_cache = ArchiveCache(
+            settings.archive_cache_path,
+            settings.archive_cache_max_mb * 1024 * 1024,
+            settings.archive_cache_fresh_seconds,
+        )
+    return _archive_cache
+
+def get_client():
+    global _client, _semaphore
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=settings.chess_api_http2,
+            timeout=settings.chess_api_timeout,
+            limits=httpx.Limits(
+                max_connections=settings.chess_api_max_connections,
+                max_keepalive_connections=settings.chess_api_max_connections,
+            ),
+        )
+        _semaphore = asyncio.Semaphore(settings.chess_api_max_concurrency)
+    return _client
+
+async def close_client():
+    """Close the shared client; called from the FastAPI lifespan and the scheduler CLI"""
+    global _client, _semaphore, _archive_cache
+    if _client is not None:
+        await _client.aclose()
+    if _archive_cache is not None:
+        _archive_cache.close()
+    _client = None
+    _semaphore = None
+    _archive_cache = None
+
+async def _get(url, headers=None):
+    client = get_client()
+    for attempt in range(settings.chess_api_max_retries + 1):
+        last_attempt = attempt == settings.chess_api_max_retries
+        await limiter.acquire()
+        try:
+            async with _semaphore:
+                with CHESS_API_SECONDS.time():
+                    r = await client.get(url, headers=headers)
+        except httpx.TransportError:
+            CHESS_API_REQUESTS.inc(status="transport_error")
+            if last_attempt:
+                raise
+            CHESS_API_RETRIES.inc(reason="transport_error")
+            limiter.on_throttle()
+            await asyncio.sleep(_backoff(attempt))
+            continue
+
+        CHESS_API_REQUESTS.inc(status=r.status_code)
+        if _is_retryable(r.status_code) and not last_attempt:
+            CHESS_API_RETRIES.inc(reason=r.status_code)
+            retry_after = _parse_retry_after(r.headers.get("Retry-After"))
+            limiter.on_throttle(retry_after)
+            await asyncio.sleep(retry_after if retry_after is not None else _backoff(attempt))
+            continue
+
+        if r.status_code != 304:
             r.raise_for_status()
-            return r.json()
+        limiter.on_success()
+        return r
+
+async def fetch(url):
+    r = await _get(url)
+    return r.json()
+
+async def fetch_archive(url):
+    """Fetch a monthly games archive, going through the on-disk archive cache"""
+    cache = get_archive_cache()
+    if cache is None:
+        return await fetch(url)
+
+    entry = cache.get(url)
+    if entry and (entry["final"] or entry["fresh"]):
+        CACHE_LOOKUPS.inc(cache="archive", result="hit")
+        return entry["data"]
+
+    headers = {}
+    if entry and entry["etag"]:
+        headers["If-None-Match"] = entry["etag"]
+    if entry and entry["last_modified"]:
+        headers["If-Modified-Since"] = entry["last_modified"]
+
+    r = await _get(url, headers=headers)
+    if r.status_code == 304 and entry:
+        CACHE_LOOKUPS.inc(cache="archive", result="revalidated")
+        cache.touch(url)
+        return entry["data"]
+
+    CACHE_LOOKUPS.inc(cache="archive", result="miss")
+    data = r.json()
+    cache.put(url, data, r.headers.get("ETag"), r.headers.get("Last-Modified"))
+    return data
+
+async def get_archive_urls(username):
+    archives = await fetch(f"{BASE}/player/{username}/games/archives")
+    return archives.get("archives", [])
+
+def reduce_game(game):
+    """Keep only the fields we store from a chess.com game (drops PGN, FEN, clocks...)"""
+    return {
+        "white": game["white"]["username"].lower(),
+        "black": game["black"]["username"].lower(),
+        "url": game.get("url", ""),
+        "end_time": game.get("end_time"),
+        "result": game["white"].get("result", ""),
+        "time_control": game.get("time_control", ""),
+        "time_class": game.get("time_class", ""),
+        "rated": game.get("rated", False)
+    }
 
 async def get_recent_games(username, months=1):
     archives = await fetch(f"{BASE}/player/{username}/games/archives")
     urls = archives["archives"][-months:]
 
     games = []
-    for url in urls:
-        data = await fetch(url)
+    for data in await asyncio.gather(*(fetch_archive(url) for url in urls)):
         games.extend(data["games"])
 
     return games
 
+# In-flight profile lookups, so concurrent callers asking for the same player share one request
+_profile_requests = {}
+
 async def get_player_profile(username):
-    return await fetch(f"{BASE}/player/{username}")
+    username = username.lower()
+    task = _profile_requests.get(username)
+    if task is None:
+        task = asyncio.ensure_future(fetch(f"{BASE}/player/{username}"))
+        _profile_requests[username] = task
+        task.add_done_callback(lambda _: _profile_requests.pop(username, None))
+    return await asyncio.shield(task)
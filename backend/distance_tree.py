@@ -0,0 +1,184 @@
+import time
+from array import array
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+import logging
+from graph_engine import GraphEngine
+from graph_stats import GraphStats
+
+logger = logging.getLogger(__name__)
+
+MAGNUS = "magnuscarlsen"
+
+# Guards the parent walk against chains left inconsistent by a partial write
+MAX_TREE_DEPTH = 32
+
+WRITE_QUERY = """
+UNWIND $rows AS row
+MATCH (p:Player {username: row.username})
+SET p.distance_from_magnus = row.distance,
+    p.parent = row.parent,
+    p.parent_url = row.url,
+    p.parent_date = row.date
+"""
+
+class DistanceTree:
+    """BFS tree rooted at Magnus, stored on the Player nodes.
+
+    Each reachable player carries distance_from_magnus plus a parent pointer
+    (parent, parent_url, parent_date) naming the neighbour one step closer
+    and the game that links them, so a path is a walk up the parent chain
+    (see graph.find_path). Rebuilds reset the per-level GraphStats counters
+    and repairs move players between levels.
+    """
+
+    def __init__(self, driver, root: str = MAGNUS, batch_size: int = 1000):
+        self.driver = driver
+        self.graph_stats = GraphStats(driver)
+        self.root = root
+        self.batch_size = batch_size
+
+    def rebuild(self, engine: Optional[GraphEngine] = None) -> Dict:
+        """Single-source BFS over the whole graph, written back to every Player"""
+        start = time.perf_counter()
+        engine = engine or GraphEngine.load(self.driver)
+        root = engine.ids.get(self.root)
+
+        distance = array("i", [-1]) * len(engine)
+        parent = array("i", [-1]) * len(engine)
+        parent_edge = array("i", [-1]) * len(engine)
+        if root is not None:
+            distance[root] = 0
+            queue = deque([root])
+            while queue:
+                node = queue.popleft()
+                for i in range(engine.offsets[node], engine.offsets[node + 1]):
+                    neighbour = engine.neighbors[i]
+                    if distance[neighbour] == -1:
+                        distance[neighbour] = distance[node] + 1
+                        parent[neighbour] = node
+                        parent_edge[neighbour] = engine.edge_ids[i]
+                        queue.append(neighbour)
+
+        rows = []
+        for node, username in enumerate(engine.usernames):
+            game = engine.games[parent_edge[node]] if parent_edge[node] != -1 else {}
+            rows.append({
+                "username": username,
+                "distance": distance[node] if distance[node] != -1 else None,
+                "parent": engine.usernames[parent[node]] if parent[node] != -1 else None,
+                "url": game.get("url"),
+                "date": game.get("date")
+            })
+        self._write(rows)
+
+        # Exact per-level counters, from the edge game counts already in memory
+        level_players: Dict[Optional[int], int] = {}
+        level_games: Dict[Optional[int], int] = {}
+        for node in range(len(engine)):
+            level = distance[node] if distance[node] != -1 else None
+            games = sum(engine.games[engine.edge_ids[i]].get("games") or 1
+                        for i in range(engine.offsets[node], engine.offsets[node + 1]))
+            level_players[level] = level_players.get(level, 0) + 1
+            level_games[level] = level_games.get(level, 0) + games
+        self.graph_stats.set_levels(level_players, level_games)
+
+        reachable = sum(1 for d in distance if d != -1)
+        seconds = round(time.perf_counter() - start, 2)
+        logger.info(f"Distance tree rebuilt: {reachable}/{len(engine)} players reachable in {seconds:.2f}s")
+        return {
+            "players": len(engine),
+            "reachable": reachable,
+            "levels": {level: count for level, count in sorted(level_players.items()) if level is not None},
+            "seconds": seconds
+        }
+
+    def repair(self, edges: Dict[Tuple[str, str], Dict]) -> int:
+        """Apply newly written edges by relaxing distances outward from their endpoints.
+
+        Insertions can only shorten distances, so this is a decrease-only BFS
+        that touches just the players whose distance improves. Deletions are
+        not handled here; run rebuild() after cleanup.
+        """
+        if not edges:
+            return 0
+
+        endpoints = {username for pair in edges for username in pair}
+        with self.driver.session() as session:
+            result = session.run("""
+            UNWIND $usernames AS username
+            MATCH (p:Player {username: username})
+            RETURN p.username AS username, p.distance_from_magnus AS distance, p.parent AS parent
+            """, usernames=list(endpoints))
+            distances = {}
+            for record in result:
+                # Distances without a parent pointer predate the tree and can't be trusted
+                valid = record["parent"] is not None or record["username"] == self.root
+                distances[record["username"]] = record["distance"] if valid else None
+            distances[self.root] = 0
+
+            updates: Dict[str, Dict] = {}
+            previous: Dict[str, Optional[int]] = {}   # level of each moved player before the repair
+
+            def relax(source: str, target: str, game: Dict) -> bool:
+                if distances.get(source) is None:
+                    return False
+                candidate = distances[source] + 1
+                current = distances.get(target)
+                if current is not None and current <= candidate:
+                    return False
+                previous.setdefault(target, current)
+                distances[target] = candidate
+                updates[target] = {"username": target, "distance": candidate, "parent": source,
+                                   "url": game.get("url"), "date": game.get("date")}
+                return True
+
+            frontier = set()
+            for (a, b), game in edges.items():
+                if relax(a, b, game):
+                    frontier.add(b)
+                if relax(b, a, game):
+                    frontier.add(a)
+
+            while frontier:
+                result = session.run("""
+                UNWIND $usernames AS username
+                MATCH (p:Player {username: username})-[r:PLAYED]-(n:Player)
+                RETURN p.username AS source, n.username AS target, n.distance_from_magnus AS distance,
+                       n.parent AS parent, r.url AS url, r.date AS date
+                """, usernames=list(frontier))
+                next_frontier = set()
+                for record in result:
+                    target = record["target"]
+                    if target not in distances and record["parent"] is not None:
+                        distances[target] = record["distance"]
+                    if relax(record["source"], target, {"url": record["url"], "date": record["date"]}):
+                        next_frontier.add(target)
+                frontier = next_frontier
+
+            games = {}
+            if updates:
+                result = session.run("""
+                UNWIND $usernames AS username
+                MATCH (p:Player {username: username})-[r:PLAYED]-()
+                RETURN p.username AS username, sum(coalesce(r.games, 1)) AS games
+                """, usernames=list(updates))
+                games = {record["username"]: record["games"] for record in result}
+
+        self._write(list(updates.values()))
+        if updates:
+            level_players: Dict[Optional[int], int] = {}
+            level_games: Dict[Optional[int], int] = {}
+            for username, row in updates.items():
+                for level, sign in ((previous[username], -1), (row["distance"], 1)):
+                    level_players[level] = level_players.get(level, 0) + sign
+                    level_games[level] = level_games.get(level, 0) + sign * games.get(username, 0)
+            self.graph_stats.add(players=level_players, level_games=level_games)
+            logger.info(f"Distance tree repaired: {len(updates)} players moved closer")
+        return len(updates)
+
+    def _write(self, rows: List[Dict]):
+        with self.driver.session() as session:
+            for i in range(0, len(rows), self.batch_size):
+                batch = rows[i:i + self.batch_size]
+                session.execute_write(lambda tx: tx.run(WRITE_QUERY, rows=batch).consume())
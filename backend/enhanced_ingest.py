@@ -1,12 +1,19 @@
-from chess_api import get_recent_games, get_player_profile, fetch
+from chess_api import get_player_profile, get_archive_urls, fetch_archive, reduce_game
 from neo4j import GraphDatabase
 from pydantic_settings import BaseSettings
 import httpx
 import asyncio
-from datetime import datetime, timedelta
-from typing import Set, Dict, List, Optional
+from contextlib import aclosing
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Callable, Set, Dict, List, Optional
 import logging
 from schema import SchemaManager
+from writer import GraphWriter
+from distance_tree import DistanceTree
+from path_cache import path_cache
+from progress import ProgressJournal
+from archive_cache import archive_month
+from metrics import CLEANUP_DELETED, span
 
 logger = logging.getLogger(__name__)
 
@@ -18,9 +25,18 @@ class Settings(BaseSettings):
     max_total_players: int = 20000     # Reduced for GitHub Actions
     max_months_historical: int = 36    # 3 years instead of 10 for initial run
     github_actions_mode: bool = True   # Flag for GitHub Actions optimizations
+    write_batch_size: int = 1000       # Rows per UNWIND write transaction
+    distance_tree_enabled: bool = True # Keep the Magnus distance tree repaired as edges arrive
+    discovery_workers: int = 8         # Players expanded concurrently per discovery level
+    discovery_recent_months: int = 0   # Only read this many recent archives for discovery (0 = all)
+    progress_journal_path: str = "cache/progress.sqlite3"  # Checkpoints for `historical --resume`
+    incremental_max_players: int = 5000  # Players refreshed per incremental update
+    incremental_workers: int = 8         # Players refreshed concurrently
+    cleanup_batch_size: int = 1000       # Expired edges deleted per cleanup transaction
 
     class Config:
         env_file = ".env"
+        extra = "ignore"
 
 settings = Settings()
 
@@ -30,83 +46,138 @@ driver = GraphDatabase.driver(
 )
 
 schema_manager = SchemaManager(driver)
+distance_tree = DistanceTree(driver, batch_size=settings.write_batch_size)
+
+# Edges whose latest game is older than the cutoff, found through game_date_index, and
+# the players that would be left without games. Aggregates only, for dry runs.
+CLEANUP_ESTIMATE_QUERY = """
+CALL {
+    MATCH ()-[r:PLAYED]->()
+    WHERE r.date < $cutoff
+    RETURN count(r) AS edges, sum(coalesce(r.games, 1)) AS games
+}
+CALL {
+    MATCH (p:Player)
+    WHERE EXISTS { MATCH (p)-[r:PLAYED]-() WHERE r.date < $cutoff }
+      AND NOT EXISTS { MATCH (p)-[s:PLAYED]-() WHERE NOT coalesce(s.date < $cutoff, false) }
+    RETURN count(p) AS players
+}
+RETURN edges, games, players
+"""
+
+# One batch of expired edges, reported per endpoint with its distance tree level (as
+# in writer.EDGE_QUERY) so the GraphStats level counters can follow.
+# Only players touched by deleted edges can become orphans, so only they are checked.
+CLEANUP_EDGES_QUERY = """
+MATCH (a:Player)-[r:PLAYED]->(b:Player)
+WHERE r.date < $cutoff
+WITH a, b, r LIMIT $limit
+WITH a, b, r, coalesce(r.games, 1) AS games
+DELETE r
+WITH a, b, games
+UNWIND [a, b] AS p
+WITH p, count(*) AS edges, sum(games) AS games
+RETURN p.username AS username,
+       CASE WHEN p.parent IS NOT NULL OR p.distance_from_magnus = 0 THEN p.distance_from_magnus END AS level,
+       edges, games
+"""
+
+CLEANUP_ORPHANS_QUERY = """
+UNWIND $usernames AS username
+MATCH (p:Player {username: username})
+WHERE NOT (p)-[:PLAYED]-()
+WITH p, CASE WHEN p.parent IS NOT NULL OR p.distance_from_magnus = 0 THEN p.distance_from_magnus END AS level
+DELETE p
+RETURN level, count(*) AS players
+"""
 
 class EnhancedIngestion:
     def __init__(self):
         self.processed_players: Set[str] = set()
         self.level_players: Dict[int, Set[str]] = {}
+        self.journal: Optional[ProgressJournal] = None   # Set while a historical import runs
         
-    async def get_player_games_all_time(self, username: str) -> List[Dict]:
-        """Get all available games for a player"""
+    async def iter_player_games_all_time(self, username: str, months: Optional[int] = None,
+                                         after: Optional[str] = None,
+                                         on_archive: Optional[Callable[[str], None]] = None) -> AsyncIterator[Dict]:
+        """Stream all available games for a player, one monthly archive at a time.
+        
+        Each game is reduced to the fields we store as soon as its archive
+        arrives, and the next archive is prefetched while the current one is
+        consumed, so at most two months are held in memory. Pass months to
+        read only the most recent archives, after to skip archives up to and
+        including that URL, and on_archive to hear when an archive's games
+        have all been yielded.
+        """
         try:
-            # Get player profile with archives
-            profile = await get_player_profile(username)
-            logger.info(f"Profile keys for {username}: {list(profile.keys())}")
-            logger.info(f"Full profile data: {profile}")
-            
-            archives = profile.get("archives", [])
-            
-            if not archives:
-                logger.warning(f"No archives found for {username}")
-                # Try the archives endpoint directly
-                try:
-                    archives_url = f"https://api.chess.com/pub/player/{username}/games/archives"
-                    logger.info(f"Trying direct archives URL: {archives_url}")
-                    archives_data = await fetch(archives_url)
-                    archives = archives_data.get("archives", [])
-                    logger.info(f"Direct archives result: {len(archives)} archives found")
-                except Exception as e:
-                    logger.error(f"Direct archives fetch failed: {e}")
-                    return []
-            
-            if not archives:
-                logger.warning(f"Still no archives found for {username}")
-                return []
-            
-            logger.info(f"Found {len(archives)} archives for {username}")
-            games = []
-            
-            # Process archives in batches to avoid rate limiting
-            batch_size = 6 if settings.github_actions_mode else 12  # Smaller batches for GitHub Actions
+            archives = await get_archive_urls(username)
+        except Exception as e:
+            logger.error(f"Archives fetch failed for {username}: {e}")
+            return
+        
+        if not archives:
+            logger.warning(f"No archives found for {username}")
+            return
+        if months:
+            archives = archives[-months:]
+        if after in archives:
+            archives = archives[archives.index(after) + 1:]
+        if not archives:
+            return
+        
+        logger.debug(f"Found {len(archives)} archives for {username}")
+        total = 0
+        pending = asyncio.ensure_future(fetch_archive(archives[0]))  # Served from the archive cache when possible
+        for i, url in enumerate(archives):
+            try:
+                data = await pending
+            except Exception as e:
+                logger.warning(f"Failed to fetch games for {username} from {url}: {e}")
+                data = None
+            pending = asyncio.ensure_future(fetch_archive(archives[i + 1])) if i + 1 < len(archives) else None
             
-            for i in range(0, len(archives), batch_size):
-                batch_urls = archives[i:i+batch_size]
-                logger.info(f"Processing batch {i//batch_size + 1} with {len(batch_urls)} archives")
-                
-                for url in batch_urls:
-                    try:
-                        data = await fetch(url)  # Fetch the specific archive URL
-                        if data and "games" in data:
-                            batch_games = data["games"]
-                            games.extend(batch_games)
-                            logger.info(f"Got {len(batch_games)} games from {url}")
-                        else:
-                            logger.warning(f"No games found in archive: {url}")
-                    except Exception as e:
-                        logger.warning(f"Failed to fetch games for {username} from {url}: {e}")
-                        continue
-                
-                # Add delay between batches to be respectful to the API
-                if i + batch_size < len(archives):
-                    await asyncio.sleep(1)
+            if not data or "games" not in data:
+                continue
             
-            logger.info(f"Total games fetched for {username}: {len(games)}")
-            return games
-        except Exception as e:
-            logger.error(f"Error fetching games for {username}: {e}")
-            return []
+            try:
+                for game in data["games"]:
+                    yield reduce_game(game)
+                    total += 1
+            except BaseException:
+                if pending is not None:
+                    pending.cancel()
+                raise
+            data = None
+            if on_archive is not None:
+                on_archive(url)
+        
+        logger.debug(f"Total games streamed for {username}: {total}")
     
     async def discover_players_recursive(self, start_username: str, max_level: int = 6) -> Dict[int, Set[str]]:
         """Discover players recursively up to max_level from start player"""
         discovered = {0: {start_username.lower()}}
         processed = {start_username.lower()}
+        completed = set()
+        if self.journal is not None:
+            completed = self.journal.completed_levels()
+            journaled = self.journal.discovered()
+            discovered.update({level: journaled.get(level, set()) for level in completed})
+            if 0 not in completed:
+                self.journal.complete_level(0, discovered[0])
+            for level in completed:
+                processed.update(discovered[level])
         
         for level in range(1, max_level + 1):
+            if level in completed:
+                continue
             if not self._should_continue_discovery(discovered):
                 break
-                
-            new_players = await self._discover_level_players(discovered[level - 1], processed)
+            
+            budget = settings.max_total_players - sum(len(players) for players in discovered.values())
+            new_players = await self._discover_level_players(discovered[level - 1], processed, budget, level)
             discovered[level] = new_players
+            if self.journal is not None:
+                self.journal.complete_level(level, new_players)
             
             # Merge new players into processed set
             processed.update(new_players)
@@ -117,46 +188,77 @@ class EnhancedIngestion:
     def _should_continue_discovery(self, discovered: Dict[int, Set[str]]) -> bool:
         """Check if discovery should continue based on storage limits"""
         total_players = sum(len(players) for players in discovered.values())
-        if total_players > settings.max_total_players:
+        if total_players >= settings.max_total_players:
             logger.warning(f"Approaching storage limit: {total_players} players")
             return False
         return True
     
-    async def _discover_level_players(self, previous_level_players: Set[str], processed: Set[str]) -> Set[str]:
-        """Discover new players from a given level"""
+    async def _discover_level_players(self, previous_level_players: Set[str], processed: Set[str],
+                                      budget: int, level: int = 1) -> Set[str]:
+        """Discover new players from a given level.
+        
+        A bounded pool of workers expands the frontier concurrently against a
+        shared visited set, and stops as soon as the level (or total) player
+        limit is reached instead of finishing the level and truncating.
+        """
         new_players = set()
+        frontier = list(previous_level_players)
+        if self.journal is not None:
+            # Pick up a level interrupted part way: keep what was found, skip expanded players
+            new_players = self.journal.discovered().get(level, set()) - processed
+            expanded = self.journal.expanded(level - 1)
+            frontier = [player for player in frontier if player not in expanded]
+        limit = min(settings.max_players_per_level, budget)
+        months = settings.discovery_recent_months or None
         
-        for player in previous_level_players:
-            try:
-                games = await self.get_player_games_all_time(player)
-                opponents = self._extract_opponents_from_games(games, player)
-                
-                for opponent in opponents:
-                    if opponent not in processed:
-                        new_players.add(opponent)
-            
-            except Exception as e:
-                logger.warning(f"Failed to process games for {player}: {e}")
-                continue
+        async def worker():
+            while frontier and len(new_players) < limit:
+                player = frontier.pop()
+                found = set()
+                try:
+                    async with aclosing(self.iter_player_games_all_time(player, months)) as games:
+                        async for game in games:
+                            for opponent in self._opponents(game, player):
+                                if opponent not in processed and opponent not in new_players:
+                                    new_players.add(opponent)
+                                    found.add(opponent)
+                            if len(new_players) >= limit:
+                                return
+                except Exception as e:
+                    logger.warning(f"Failed to process games for {player}: {e}")
+                    continue
+                if self.journal is not None:
+                    self.journal.mark_expanded(level - 1, player, found)
+        
+        await asyncio.gather(*(worker() for _ in range(settings.discovery_workers)))
         
+        # Workers may each add a few opponents past the limit on their last game
+        if len(new_players) > limit:
+            new_players = set(sorted(new_players)[:limit])
         return new_players
     
-    def _extract_opponents_from_games(self, games: List[Dict], current_player: str) -> Set[str]:
-        """Extract unique opponents from games list"""
-        opponents = set()
-        for game in games:
-            white = game["white"]["username"].lower()
-            black = game["black"]["username"].lower()
-            
-            for opponent in [white, black]:
-                if opponent != current_player:
-                    opponents.add(opponent)
-        return opponents
+    def _opponents(self, game: Dict, current_player: str) -> List[str]:
+        """Players in a reduced game record other than current_player"""
+        return [p for p in (game["white"], game["black"]) if p != current_player]
     
-    async def ingest_historical_data(self, start_username: str = "magnuscarlsen"):
-        """One-time import of all historical data"""
-        logger.info("Starting historical data import...")
+    async def ingest_historical_data(self, start_username: str = "magnuscarlsen", resume: bool = False):
+        """One-time import of all historical data.
         
+        Progress is journaled to disk as it happens; with resume=True an
+        unfinished import from the same start player continues where it
+        stopped instead of starting again from scratch.
+        """
+        logger.info("Starting historical data import...")
+        self.journal = ProgressJournal(settings.progress_journal_path)
+        try:
+            self.journal.start(start_username.lower(), resume)
+            await self._ingest_historical_data(start_username)
+            self.journal.finish()
+        finally:
+            self.journal.close()
+            self.journal = None
+    
+    async def _ingest_historical_data(self, start_username: str):
         # Initialize schema
         schema_manager.create_constraints_and_indexes()
         
@@ -173,18 +275,23 @@ class EnhancedIngestion:
             # Keep only the first few levels and limit players per level
             for level in discovered_players:
                 if len(discovered_players[level]) > 200:
-                    discovered_players[level] = set(list(discovered_players[level])[:200])
+                    discovered_players[level] = set(sorted(discovered_players[level])[:200])
         
-        # Ingest players level by level
+        # Ingest players level by level, skipping those a previous run completed
+        ingested = self.journal.ingested()
         processed_count = 0
-        for level, players in discovered_players.items():
+        for level in sorted(discovered_players):
+            players = discovered_players[level]
             logger.info(f"Ingesting level {level} with {len(players)} players")
             
-            for i, player in enumerate(players):
+            for i, player in enumerate(sorted(players)):
                 try:
                     processed_count += 1
-                    logger.info(f"Processing player {processed_count}/{total_players}: {player}")
-                    await self.ingest_player_all_time(player, level)
+                    if player in ingested:
+                        continue
+                    logger.debug(f"Processing player {processed_count}/{total_players}: {player}")
+                    await self.ingest_player_all_time(player, level, repair_tree=False)
+                    self.journal.mark_ingested(player)
                     
                     # GitHub Actions: add progress checkpoint
                     if settings.github_actions_mode and processed_count % 50 == 0:
@@ -194,154 +301,210 @@ class EnhancedIngestion:
                     logger.error(f"Failed to ingest {player}: {e}")
                     continue
         
+        # Replace the discovery levels with exact distances and parent pointers
+        self.rebuild_distance_tree()
+        
         # Update metadata
         self.update_ingestion_metadata("historical", datetime.now() - timedelta(days=settings.max_months_historical * 30))
         logger.info(f"Historical data import completed - processed {processed_count} players")
     
-    async def ingest_player_all_time(self, username: str, distance_from_magnus: Optional[int] = None):
+    async def ingest_player_all_time(self, username: str, distance_from_magnus: Optional[int] = None,
+                                     repair_tree: bool = True):
         """Ingest all-time data for a single player"""
         username = username.lower()
         
         # Get player profile
         try:
             profile = await get_player_profile(username)
-            logger.info(f"Got profile for {username}: {profile.get('name', username)}")
+            logger.debug(f"Got profile for {username}")
         except Exception as e:
             logger.warning(f"Failed to get profile for {username}: {e}")
             profile = {}
         
-        # Get all games
-        logger.info(f"Fetching all games for {username}...")
-        games = await self.get_player_games_all_time(username)
-        logger.info(f"Found {len(games)} games for {username}")
+        # During a historical import, continue after the last archive a previous run wrote
+        last_archive, resumed_count = (None, 0)
+        if self.journal is not None:
+            last_archive, resumed_count = self.journal.archive_checkpoint(username)
+        queued = {}
         
-        if not games:
-            logger.warning(f"No games found for {username}")
-            return
+        latest_end_time = 0
         
-        # Process games and create relationships
-        with driver.session() as session:
-            # Create/update player node
-            session.run("""
-            MERGE (p:Player {username: $username})
-            SET p.avatar = $avatar,
-                p.title = $title,
-                p.name = $name,
-                p.country = $country,
-                p.join_date = $join_date,
-                p.last_updated = datetime(),
-                p.games_played = $games_count,
-                p.distance_from_magnus = $distance
-            """, 
-            username=username,
-            avatar=profile.get("avatar", ""),
-            title=profile.get("title", ""),
-            name=profile.get("name", ""),
-            country=profile.get("country", ""),
-            join_date=profile.get("joined", ""),
-            games_count=len(games),
-            distance=distance_from_magnus
-            )
+        def archive_queued(url: str):
+            queued.update(url=url, games=resumed_count + processed_count)
+            writer.maybe_flush()
+        
+        def checkpoint():
+            # Everything queued up to the last complete archive has now been written
+            if self.journal is not None and queued:
+                self.journal.set_archive_checkpoint(username, queued["url"], queued["games"])
+        
+        # Stream all games straight into the writer
+        logger.debug(f"Fetching all games for {username}...")
+        processed_count = 0
+        with GraphWriter(driver, settings.write_batch_size, on_flush=checkpoint) as writer:
+            async for game in self.iter_player_games_all_time(username, after=last_archive, on_archive=archive_queued):
+                if game["white"] != username and game["black"] != username:
+                    continue
+                if processed_count == 0:
+                    # The player node has to be queued before its first edge
+                    writer.add_player(username, touch=True)
+                self._create_game_relationship(writer, game, username)
+                processed_count += 1
+                latest_end_time = max(latest_end_time, game["end_time"] or 0)
             
-            # Process games in batches
-            processed_count = 0
-            for game in games:
-                white = game["white"]["username"].lower()
-                black = game["black"]["username"].lower()
-                
-                if white == username or black == username:
-                    self._create_game_relationship(session, game, username)
-                    processed_count += 1
+            if processed_count + resumed_count == 0:
+                logger.warning(f"No games found for {username}")
+                return
             
-            logger.info(f"Processed {processed_count} games for {username}")
+            # Create/update player node
+            writer.add_player(username, {
+                "avatar": profile.get("avatar", ""),
+                "title": profile.get("title", ""),
+                "name": profile.get("name", ""),
+                "country": profile.get("country", ""),
+                "join_date": profile.get("joined", ""),
+                "games_played": processed_count + resumed_count,
+                "distance_from_magnus": distance_from_magnus,
+                "profile_updated": datetime.now(timezone.utc) if profile else None
+            }, touch=True)
+            
+            # Later incremental updates only ask for what comes after this point
+            if queued:
+                watermark = {"watermark_archive": archive_month(queued["url"])}
+                if latest_end_time:
+                    watermark["watermark_end_time"] = latest_end_time
+                writer.add_player(username, watermark)
+        
+        logger.info(f"Processed {processed_count} games for {username} ({writer.stats()['rows_per_second']} rows/s)")
+        
+        if repair_tree:
+            self._repair_distance_tree(writer)
+        if path_cache is not None:
+            path_cache.invalidate_players(writer.players_written)
     
-    def _create_game_relationship(self, session, game: Dict, current_player: str):
-        """Create game relationship between two players"""
-        white = game["white"]["username"].lower()
-        black = game["black"]["username"].lower()
+    def _repair_distance_tree(self, writer: GraphWriter):
+        """Propagate distance improvements from the edges a writer just added"""
+        if settings.distance_tree_enabled:
+            with span("tree_repair"):
+                distance_tree.repair(writer.edges_written)
+    
+    def rebuild_distance_tree(self) -> Optional[Dict]:
+        """Full tree rebuild; cached paths may now be longer than needed or gone"""
+        result = distance_tree.rebuild() if settings.distance_tree_enabled else None
+        if path_cache is not None:
+            path_cache.clear()
+        return result
+    
+    def _create_game_relationship(self, writer: GraphWriter, game: Dict, current_player: str):
+        """Queue the relationship for a reduced game record on the writer"""
+        white = game["white"]
+        black = game["black"]
         
         # Create opponent node if it doesn't exist
         opponent = black if white == current_player else white
+        writer.add_player(opponent, touch=True)
         
-        session.run("""
-        MERGE (o:Player {username: $opponent})
-        SET o.last_updated = datetime()
-        """, opponent=opponent)
-        
-        # Create game relationship
-        game_data = {
-            "url": game.get("url", ""),
-            "date": datetime.fromtimestamp(game.get("end_time", 0)) if game.get("end_time") else None,
-            "white": game["white"]["username"].lower(),
-            "black": game["black"]["username"].lower(),
-            "result": game.get("white", {}).get("result", ""),
-            "time_control": game.get("time_control", ""),
-            "rated": game.get("rated", False)
-        }
-        
-        session.run("""
-        MATCH (w:Player {username: $white}), (b:Player {username: $black})
-        MERGE (w)-[r:PLAYED]->(b)
-        SET r.url = $url,
-            r.date = $date,
-            r.result = $result,
-            r.time_control = $time_control,
-            r.rated = $rated
-        """, **game_data)
+        # Fold the game into the pair's aggregated edge
+        writer.add_game(game)
     
     async def incremental_update(self, months: int = 1):
-        """Monthly incremental update of recent games"""
+        """Monthly incremental update of recent games.
+        
+        Players carrying a watermark only fetch archives from their watermark
+        month onwards and only write games that ended after it; players without
+        one fall back to the last `months` archives.
+        """
         logger.info(f"Starting incremental update for {months} months")
         
         # Get all players that need updating
         with driver.session() as session:
             result = session.run("""
             MATCH (p:Player)
-            WHERE p.last_updated < date() - duration({days: 30})
-            RETURN p.username as username
+            WHERE p.last_updated < datetime() - duration({days: 30})
+            RETURN p.username as username,
+                   p.watermark_archive as archive,
+                   p.watermark_end_time as end_time
             ORDER BY p.distance_from_magnus ASC
-            LIMIT 1000
-            """)
+            LIMIT $limit
+            """, limit=settings.incremental_max_players)
             
-            players_to_update = [record["username"] for record in result]
+            players_to_update = [
+                (record["username"], {"archive": record["archive"], "end_time": record["end_time"]})
+                for record in result
+            ]
         
-        # Update each player's recent games
-        for player in players_to_update:
-            try:
-                await self.ingest_recent_games(player, months)
-            except Exception as e:
-                logger.error(f"Failed to update {player}: {e}")
+        # Update each player's recent games with a bounded pool of workers
+        async def worker():
+            while players_to_update:
+                player, watermark = players_to_update.pop()
+                try:
+                    await self.ingest_recent_games(player, months, watermark)
+                except Exception as e:
+                    logger.error(f"Failed to update {player}: {e}")
+        
+        await asyncio.gather(*(worker() for _ in range(settings.incremental_workers)))
         
         self.update_ingestion_metadata("incremental", datetime.now() - timedelta(days=30*months))
         logger.info("Incremental update completed")
     
-    async def ingest_recent_games(self, username: str, months: int):
-        """Ingest only recent games for a player"""
+    def _get_watermark(self, username: str) -> Dict:
+        with driver.session() as session:
+            record = session.run("""
+            MATCH (p:Player {username: $username})
+            RETURN p.watermark_archive as archive, p.watermark_end_time as end_time
+            """, username=username).single()
+        return {"archive": record["archive"], "end_time": record["end_time"]} if record else {}
+    
+    async def ingest_recent_games(self, username: str, months: int, watermark: Optional[Dict] = None):
+        """Ingest games newer than the player's watermark, or the last `months` archives without one"""
         username = username.lower()
         
         try:
-            games = await get_recent_games(username, months)
+            if watermark is None:
+                watermark = self._get_watermark(username)
+            since_month = watermark.get("archive")
+            since_time = watermark.get("end_time") or 0
             
-            with driver.session() as session:
-                for game in games:
-                    self._create_game_relationship(session, game, username)
-                
+            urls = await get_archive_urls(username)
+            if since_month:
+                # The watermark month itself may have grown since it was read
+                urls = [url for url in urls if (archive_month(url) or "") >= since_month]
+            else:
+                urls = urls[-months:]
+            
+            latest_month, latest_time = since_month, since_time
+            with GraphWriter(driver, settings.write_batch_size) as writer:
                 # Update last_updated timestamp
-                session.run("""
-                MATCH (p:Player {username: $username})
-                SET p.last_updated = datetime()
-                """, username=username)
+                writer.add_player(username, touch=True)
+                
+                for url in urls:
+                    data = await fetch_archive(url)
+                    for game in data.get("games", []):
+                        game = reduce_game(game)
+                        if (game["end_time"] or 0) <= since_time:
+                            continue
+                        self._create_game_relationship(writer, game, username)
+                        latest_time = max(latest_time, game["end_time"] or 0)
+                    latest_month = max(latest_month or "", archive_month(url) or "") or None
+                    writer.maybe_flush()
+                
+                writer.add_player(username, {
+                    "watermark_archive": latest_month,
+                    "watermark_end_time": latest_time or None
+                })
+            
+            self._repair_distance_tree(writer)
+            if path_cache is not None:
+                path_cache.invalidate_players(writer.players_written)
         
         except Exception as e:
             logger.error(f"Failed to ingest recent games for {username}: {e}")
     
     def update_ingestion_metadata(self, ingestion_type: str, from_date: datetime):
         """Update metadata about the ingestion process"""
+        # Constant-time counts from the count store, not a scan
+        stats = schema_manager.get_database_stats()
         with driver.session() as session:
-            # Get counts first
-            player_count = session.run("MATCH (p:Player) RETURN count(p) as count").single()["count"]
-            rel_count = session.run("MATCH ()-[r:PLAYED]-() RETURN count(DISTINCT r) as count").single()["count"]
-            
             # Update metadata
             session.run("""
             MERGE (meta:DataMetadata)
@@ -350,40 +513,82 @@ class EnhancedIngestion:
                 meta.ingestion_type = $type,
                 meta.total_players = $player_count,
                 meta.total_relationships = $rel_count
-            """, from_date=from_date, type=ingestion_type, player_count=player_count, rel_count=rel_count)
+            """, from_date=from_date, type=ingestion_type, player_count=stats["players"],
+                rel_count=stats["relationships"])
     
-    def cleanup_old_data(self, max_age_years: int = 5):
-        """Remove players and games older than specified age"""
+    def cleanup_old_data(self, max_age_years: int = 5, batch_size: Optional[int] = None,
+                         dry_run: bool = False) -> Dict:
+        """Remove pairs that have not played within max_age_years, and players left without games.
+
+        Expired edges are deleted in transactions of batch_size edges, each
+        also removing the players it orphaned and updating the GraphStats
+        counters to match, so cleanup never holds one huge transaction while
+        the API is serving. dry_run only reports what would be removed.
+        """
         cutoff_date = datetime.now() - timedelta(days=max_age_years * 365)
+        batch_size = batch_size or settings.cleanup_batch_size
         
         with driver.session() as session:
-            # Remove old game relationships
-            result = session.run("""
-            MATCH ()-[r:PLAYED]-()
-            WHERE r.date < date($cutoff_date)
-            DELETE r
-            RETURN count(r) as deleted_games
-            """, cutoff_date=cutoff_date.date())
-            
-            deleted_games = result.single()["deleted_games"]
-            
-            # Remove players with no games
-            result = session.run("""
-            MATCH (p:Player)
-            WHERE NOT (p)-[:PLAYED]-()
-            DELETE p
-            RETURN count(p) as deleted_players
-            """)
+            if dry_run:
+                estimate = session.execute_read(
+                    lambda tx: tx.run(CLEANUP_ESTIMATE_QUERY, cutoff=cutoff_date).single().data()
+                )
+                estimate = {
+                    "deleted_edges": estimate["edges"],
+                    "deleted_games": estimate["games"] or 0,
+                    "deleted_players": estimate["players"]
+                }
+                logger.info(f"Cleanup dry run (before {cutoff_date.date()}): would remove "
+                            f"{estimate['deleted_edges']} edges ({estimate['deleted_games']} games), "
+                            f"{estimate['deleted_players']} players")
+                return {**estimate, "dry_run": True}
             
-            deleted_players = result.single()["deleted_players"]
+            def delete_batch(tx):
+                ends = [record.data() for record in tx.run(CLEANUP_EDGES_QUERY, cutoff=cutoff_date, limit=batch_size)]
+                orphans = []
+                if ends:
+                    orphans = [record.data() for record in
+                               tx.run(CLEANUP_ORPHANS_QUERY, usernames=[end["username"] for end in ends])]
+                return ends, orphans
             
-            logger.info(f"Cleanup completed: {deleted_games} games, {deleted_players} players removed")
-            
-            return {"deleted_games": deleted_games, "deleted_players": deleted_players}
+            deleted = {"deleted_edges": 0, "deleted_games": 0, "deleted_players": 0}
+            while True:
+                ends, orphans = session.execute_write(delete_batch)
+                if not ends:
+                    break
+                # Every edge was reported once from each end
+                edges = sum(end["edges"] for end in ends) // 2
+                games = sum(end["games"] for end in ends) // 2
+                players = sum(orphan["players"] for orphan in orphans)
+                level_games: Dict[Optional[int], int] = {}
+                for end in ends:
+                    level_games[end["level"]] = level_games.get(end["level"], 0) - end["games"]
+                schema_manager.graph_stats.add(
+                    games=-games,
+                    players={orphan["level"]: -orphan["players"] for orphan in orphans},
+                    level_games=level_games
+                )
+                deleted["deleted_edges"] += edges
+                deleted["deleted_games"] += games
+                deleted["deleted_players"] += players
+                CLEANUP_DELETED.inc(edges, kind="edges")
+                CLEANUP_DELETED.inc(games, kind="games")
+                CLEANUP_DELETED.inc(players, kind="players")
+                logger.info(f"Cleanup progress: {deleted['deleted_edges']} edges "
+                            f"({deleted['deleted_games']} games), {deleted['deleted_players']} players removed")
+        
+        logger.info(f"Cleanup completed: {deleted['deleted_edges']} edges ({deleted['deleted_games']} games), "
+                    f"{deleted['deleted_players']} players removed")
+        
+        # Deleted edges can lengthen distances, which repair() cannot express
+        if deleted["deleted_edges"]:
+            self.rebuild_distance_tree()
+        
+        return deleted
     
-    def monitor_storage_usage(self) -> Dict:
-        """Monitor current storage usage and recommendations"""
-        stats = schema_manager.get_database_stats()
+    def monitor_storage_usage(self, reconcile: bool = False) -> Dict:
+        """Monitor current storage usage and recommendations; reconcile recounts the counters first"""
+        stats = schema_manager.get_database_stats(reconcile=reconcile)
         breakdown = schema_manager.get_storage_breakdown()
         
         # Calculate usage percentage (assuming AuraDB Free limits)
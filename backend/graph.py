@@ -1,35 +1,335 @@
-from ingest import driver
-
-def find_path(username):
-    with driver.session() as session:
-        result = session.run("""
-        MATCH (me:Player {username: $username}),
-              (magnus:Player {username: "magnuscarlsen"})
-        MATCH p = shortestPath((me)-[:PLAYED*..6]-(magnus))
-        RETURN [n IN nodes(p) | {username: n.username, avatar: n.avatar, title: n.title}] AS path,
-               [r IN relationships(p) | {url: r.url, date: r.date}] AS games
-        """, username=username)
-
-        record = result.single()
+import asyncio
+from neo4j import unit_of_work
+from ingest import driver, async_driver, settings, search_indexes
+from distance_tree import MAGNUS, MAX_TREE_DEPTH
+from graph_engine import get_engine
+from target_trees import TargetTrees
+from path_filters import CYPHER_PREDICATE, parse_kind
+from shortest_paths import describe_score, find_all_paths as engine_all_paths, score_key
+from metrics import query, span
+
+# Per-target BFS trees over the in-process engine, for targets other than Magnus too
+target_trees = TargetTrees(
+    max_bytes_per_tree=int(settings.target_tree_max_mb * 2 ** 20),
+    max_bytes=int(settings.target_tree_cache_mb * 2 ** 20),
+    hot_after=settings.target_tree_hot_after
+)
+
+async def read(work, *args, name=None):
+    """Run a transaction function on the async driver, routed to readers and time-limited"""
+    timed = unit_of_work(timeout=settings.neo4j_query_timeout)(work)
+    with query(name or work.__name__.lstrip("_")):
+        async with async_driver.session() as session:
+            return await session.execute_read(timed, *args)
+
+async def read_records(cypher, name, **params):
+    async def work(tx):
+        result = await tx.run(cypher, **params)
+        return [record async for record in result]
+    return await read(work, name=name)
+
+async def _tree_paths(tx, usernames):
+    """Walk the distance tree's parent chains for many players at once, one query per level"""
+    nodes = {}
+    pending = set(usernames)
+    for _ in range(MAX_TREE_DEPTH + 1):
+        if not pending:
+            break
+        result = await tx.run("""
+        UNWIND $usernames AS username
+        MATCH (p:Player {username: username})
+        RETURN p.username AS username, p.avatar AS avatar, p.title AS title,
+               p.distance_from_magnus AS distance, p.parent AS parent,
+               p.parent_url AS url, p.parent_date AS date
+        """, usernames=list(pending))
+        records = [record async for record in result]
+        for record in records:
+            nodes[record["username"]] = record
+        # Chains from different players soon meet, so each ancestor is fetched once
+        pending = {
+            record["parent"] for record in records
+            if record["distance"] is not None and record["parent"] is not None and record["parent"] not in nodes
+        }
+    return {username: _walk_tree(nodes, username) for username in usernames}
+
+def _walk_tree(nodes, username):
+    path, games = [], []
+    current = username
+    for _ in range(MAX_TREE_DEPTH + 1):
+        record = nodes.get(current)
+        if record is None or record["distance"] is None:
+            return None
+
+        path.append({"username": record["username"], "avatar": record["avatar"], "title": record["title"]})
+        if record["username"] == MAGNUS:
+            return {"path": path, "games": games}
+        if record["parent"] is None:
+            return None
+
+        games.append({"url": record["url"], "date": record["date"]})
+        current = record["parent"]
+    return None
+
+async def _tree_path(tx, username):
+    """Walk the distance tree's parent chain up to Magnus inside one read transaction"""
+    return (await _tree_paths(tx, [username]))[username]
+
+async def find_path(username, target=MAGNUS, path_filter=None):
+    username = username.lower()
+    target = target.lower()
+    with span("find_path", username=username, target=target, filtered=bool(path_filter)) as record:
+        if username == target:
+            # shortestPath refuses identical endpoints
+            result = await _player_path(username)
+        elif path_filter:
+            result = await _find_filtered_path(username, target, path_filter)
+        else:
+            result = await _find_path(username, target)
+        record["attributes"]["found"] = result["path"] is not None
+        return result
+
+async def _player_path(username):
+    """The zero-hop path from a player to themselves, as the engine returns it"""
+    records = await read_records("""
+    MATCH (p:Player {username: $username})
+    RETURN p.username AS username, p.avatar AS avatar, p.title AS title
+    """, "player_path", username=username)
+    if not records:
+        return {"path": None, "games": None}
+    return {"path": [dict(records[0])], "games": []}
+
+async def _find_path(username, target):
+    # The stored distance tree only covers Magnus
+    if settings.distance_tree_enabled and target == MAGNUS:
+        result = await read(_tree_path, username)
+        if result is not None:
+            return result
+
+    if settings.graph_engine_enabled:
+        # A rebuild pulls the whole graph through the sync driver, so keep it off the event loop
+        engine = await asyncio.to_thread(get_engine, driver, settings.graph_engine_max_age_seconds,
+                                         settings.graph_snapshot_path)
+        # So is building a BFS tree for a target that just turned hot
+        with span("graph_engine"):
+            result = await asyncio.to_thread(target_trees.find_path, engine, username, target)
+        if result is not None:
+            return result
+
+    # Neo4j remains the source of truth, e.g. for players ingested since the engine was built
+    records = await read_records("""
+    MATCH (me:Player {username: $username}),
+          (target:Player {username: $target})
+    MATCH p = shortestPath((me)-[:PLAYED*..6]-(target))
+    RETURN [n IN nodes(p) | {username: n.username, avatar: n.avatar, title: n.title}] AS path,
+           [r IN relationships(p) | {url: r.url, date: r.date}] AS games
+    """, "shortest_path", username=username, target=target)
+
+    record = records[0] if records else None
+    return {
+        "path": record["path"] if record else None,
+        "games": record["games"] if record else None
+    }
+
+async def _find_filtered_path(username, target, path_filter):
+    """Shortest path using only hops whose pair played a game the filter allows"""
+    if settings.graph_engine_enabled:
+        engine = await asyncio.to_thread(get_engine, driver, settings.graph_engine_max_age_seconds,
+                                         settings.graph_snapshot_path)
+        with span("graph_engine"):
+            result = await asyncio.to_thread(engine.find_path, username, target, 6, path_filter)
+        if result is not None:
+            return result
+
+    records = await read_records(f"""
+    MATCH (me:Player {{username: $username}}),
+          (target:Player {{username: $target}})
+    MATCH p = shortestPath((me)-[:PLAYED*..6]-(target))
+    WHERE all(r IN relationships(p) WHERE {CYPHER_PREDICATE})
+    RETURN [n IN nodes(p) | {{username: n.username, avatar: n.avatar, title: n.title}}] AS path,
+           [r IN relationships(p) | {{url: r.url, date: r.date, kinds: r.kinds}}] AS games
+    """, "filtered_shortest_path", username=username, target=target, **path_filter.cypher_params())
+
+    record = records[0] if records else None
+    if record is None:
+        return {"path": None, "games": None}
+    return {
+        "path": record["path"],
+        "games": [
+            {"url": game["url"], "date": game["date"],
+             "matched": path_filter.describe(parse_kind(kind) for kind in game["kinds"] or [])}
+            for game in record["games"]
+        ]
+    }
+
+async def find_all_paths(username, target=MAGNUS, k=5, rank=None, path_filter=None):
+    """How many shortest paths there are, the first k of them and, with rank, the best one.
+
+    The engine counts them exactly from BFS layer counts. Neo4j's
+    allShortestPaths is the fallback; it stops after all_paths_limit paths,
+    so its count is then a lower bound (count_capped).
+    """
+    username = username.lower()
+    target = target.lower()
+    with span("find_all_paths", username=username, target=target, k=k, rank=rank) as record:
+        result = await _find_all_paths(username, target, k, rank, path_filter)
+        record["attributes"]["count"] = result["count"]
+        return result
+
+async def _find_all_paths(username, target, k, rank, path_filter):
+    if settings.graph_engine_enabled:
+        engine = await asyncio.to_thread(get_engine, driver, settings.graph_engine_max_age_seconds,
+                                         settings.graph_snapshot_path)
+        with span("graph_engine"):
+            result = await asyncio.to_thread(engine_all_paths, engine, username, target, k, rank, path_filter)
+        if result is not None:
+            return result
+
+    if username == target:
+        # allShortestPaths refuses identical endpoints; there is one path, of no hops
+        single = await _player_path(username)
+        if single["path"] is None:
+            return {"count": 0, "count_capped": False, "length": None, "paths": []}
+        result = {"count": 1, "count_capped": False, "length": 0, "paths": [single]}
+        if rank:
+            result["best"] = {**single, "score": describe_score(0, [])}
+        return result
+
+    where = f"WHERE all(r IN relationships(p) WHERE {CYPHER_PREDICATE})" if path_filter else ""
+    records = await read_records(f"""
+    MATCH (me:Player {{username: $username}}),
+          (target:Player {{username: $target}})
+    MATCH p = allShortestPaths((me)-[:PLAYED*..6]-(target))
+    {where}
+    WITH p LIMIT $limit
+    RETURN [n IN nodes(p) | {{username: n.username, avatar: n.avatar, title: n.title}}] AS path,
+           [r IN relationships(p) | {{url: r.url, date: r.date, end_time: r.last_end_time, kinds: r.kinds}}] AS games
+    """, "all_shortest_paths", username=username, target=target, limit=settings.all_paths_limit,
+        **(path_filter.cypher_params() if path_filter else {}))
+
+    def payload(record):
+        games = []
+        for game in record["games"]:
+            games.append({"url": game["url"], "date": game["date"]})
+            if path_filter:
+                games[-1]["matched"] = path_filter.describe(parse_kind(kind) for kind in game["kinds"] or [])
+        return {"path": record["path"], "games": games}
+
+    def titled(record):
+        return sum(1 for node in record["path"][1:-1] if node["title"])
+
+    def end_times(record):
+        return [game["end_time"] for game in record["games"]]
+
+    result = {
+        "count": len(records),
+        "count_capped": len(records) >= settings.all_paths_limit,
+        "length": len(records[0]["games"]) if records else None,
+        "paths": [payload(record) for record in records[:k]]
+    }
+    if rank and records:
+        best = max(records, key=lambda record: score_key(titled(record), end_times(record), rank))
+        result["best"] = {**payload(best), "score": describe_score(titled(best), end_times(best))}
+    return result
+
+async def find_paths(usernames, target=MAGNUS):
+    """Paths for many players, yielded as {username, path, games} as each stage resolves them.
+
+    The stored tree (for Magnus) and the engine answer the whole batch in
+    one pass each; whoever is left goes to Neo4j shortestPath in chunks.
+    """
+    target = target.lower()
+    pending = list(dict.fromkeys(username.lower() for username in usernames))
+    with span("find_paths", players=len(pending), target=target) as record:
+        found = 0
+        if pending and settings.distance_tree_enabled and target == MAGNUS:
+            results = await read(_tree_paths, pending)
+            for username in pending:
+                if results[username] is not None:
+                    found += 1
+                    yield {"username": username, **results[username]}
+            pending = [username for username in pending if results[username] is None]
+
+        if pending and settings.graph_engine_enabled:
+            engine = await asyncio.to_thread(get_engine, driver, settings.graph_engine_max_age_seconds,
+                                             settings.graph_snapshot_path)
+            with span("graph_engine"):
+                results = await asyncio.to_thread(target_trees.find_paths, engine, pending, target)
+            for username in pending:
+                if results[username] is not None:
+                    found += 1
+                    yield {"username": username, **results[username]}
+            pending = [username for username in pending if results[username] is None]
+
+        for i in range(0, len(pending), settings.paths_fallback_chunk):
+            chunk = pending[i:i + settings.paths_fallback_chunk]
+            records = await read_records("""
+            UNWIND $usernames AS username
+            MATCH (me:Player {username: username}), (target:Player {username: $target})
+            WHERE me <> target
+            MATCH p = shortestPath((me)-[:PLAYED*..6]-(target))
+            RETURN username,
+                   [n IN nodes(p) | {username: n.username, avatar: n.avatar, title: n.title}] AS path,
+                   [r IN relationships(p) | {url: r.url, date: r.date}] AS games
+            """, "shortest_paths", usernames=chunk, target=target)
+            results = {record["username"]: record for record in records}
+            for username in chunk:
+                result = results.get(username)
+                found += result is not None
+                yield {
+                    "username": username,
+                    "path": result["path"] if result else None,
+                    "games": result["games"] if result else None
+                }
+        record["attributes"]["found"] = found
+
+async def get_data_metadata():
+    records = await read_records("""
+    MATCH (meta:DataMetadata)
+    RETURN meta.last_refreshed AS last_refreshed,
+           meta.storing_from AS storing_from,
+           meta.months_of_data AS months_of_data
+    """, "data_metadata")
+    
+    if records:
+        record = records[0]
         return {
-            "path": record["path"] if record else None,
-            "games": record["games"] if record else None
+            "last_refreshed": record["last_refreshed"],
+            "storing_from": record["storing_from"], 
+            "months_of_data": record["months_of_data"]
         }
+    return None
+
+async def find_players_by_prefix(prefix, limit=10):
+    """Typeahead lookup, ranked by closeness to Magnus and then activity.
+
+    Usernames are stored lowercased. The in-process SearchIndex ranks every
+    player sharing the prefix while reading a bounded number of entries, and
+    Neo4j is only asked for the profiles of the players it returns. Until the
+    index has been built, the first search_candidates matches in username
+    order are ranked by a Cypher query served by the unique constraint's index.
+    """
+    prefix = prefix.lower()
+    index = search_indexes.current(driver)
+    if index is not None:
+        usernames = index.search(prefix, limit)
+        if not usernames:
+            return []
+        records = await read_records("""
+        UNWIND $usernames AS username
+        MATCH (p:Player {username: username})
+        RETURN p.username AS username, p.avatar AS avatar, p.title AS title,
+               p.distance_from_magnus AS distance
+        """, "player_search_profiles", usernames=usernames)
+        found = {record["username"]: dict(record) for record in records}
+        return [found[username] for username in usernames if username in found]
 
-def get_data_metadata():
-    with driver.session() as session:
-        result = session.run("""
-        MATCH (meta:DataMetadata)
-        RETURN meta.last_refreshed AS last_refreshed,
-               meta.storing_from AS storing_from,
-               meta.months_of_data AS months_of_data
-        """)
-        
-        record = result.single()
-        if record:
-            return {
-                "last_refreshed": record["last_refreshed"],
-                "storing_from": record["storing_from"], 
-                "months_of_data": record["months_of_data"]
-            }
-        return None
+    records = await read_records("""
+    MATCH (p:Player)
+    WHERE p.username STARTS WITH $prefix
+    WITH p ORDER BY p.username LIMIT $candidates
+    RETURN p.username AS username, p.avatar AS avatar, p.title AS title,
+           p.distance_from_magnus AS distance
+    ORDER BY coalesce(p.distance_from_magnus, 1000), coalesce(p.games_played, 0) DESC, p.username
+    LIMIT $limit
+    """, "player_search", prefix=prefix, candidates=settings.search_candidates, limit=limit)
+    return [dict(record) for record in records]
@@ -0,0 +1,407 @@
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Sequence, Tuple
+import logging
+from path_filters import PathFilter, decode_kind, encode_kind
+from snapshot import Snapshot, SnapshotError, write_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Filtered searches read edges bucketed by year (months since FIRST_YEAR // 12)
+BUCKET_MONTHS = 12
+
+def partition_kinds(offsets, neighbors, edge_ids, kind_offsets, kind_codes) -> Dict[int, Tuple]:
+    """Split the adjacency by kind: slot -> (offsets, neighbors, edge_ids, buckets) CSR.
+
+    A slot is a time class and rated combination (class index * 2 + rated,
+    the low bits of a kind code). An edge is listed in a slot once per year
+    bucket in which its pair played a game of that kind, and each player's
+    neighbours are sorted by bucket. Slots with no games are left out.
+    """
+    players = len(offsets) - 1
+    partitions: Dict[int, Tuple] = {}
+    for node in range(players):
+        entries: Dict[int, set] = {}
+        for i in range(offsets[node], offsets[node + 1]):
+            edge, neighbour = edge_ids[i], neighbors[i]
+            for j in range(kind_offsets[edge], kind_offsets[edge + 1]):
+                code = kind_codes[j]
+                entries.setdefault(code & 15, set()).add(((code >> 4) // BUCKET_MONTHS, neighbour, edge))
+        for slot, found in entries.items():
+            if slot not in partitions:
+                partitions[slot] = (array("i", [0]) * (players + 1), array("i"), array("i"), array("B"))
+            part_offsets, part_neighbors, part_edges, part_buckets = partitions[slot]
+            for bucket, neighbour, edge in sorted(found):
+                part_neighbors.append(neighbour)
+                part_edges.append(edge)
+                part_buckets.append(bucket)
+            part_offsets[node + 1] = len(part_neighbors)
+    # Players without edges in a slot end where the previous player did
+    for part_offsets, _, _, _ in partitions.values():
+        for node in range(1, players + 1):
+            if part_offsets[node] < part_offsets[node - 1]:
+                part_offsets[node] = part_offsets[node - 1]
+    return partitions
+
+class FilteredEdges:
+    """The edges a PathFilter admits, read from a GraphEngine's kind partitions.
+
+    Only the slots the filter allows are read, and within each player's range
+    only the year buckets overlapping its months, found by bisection. An
+    entry in a bucket that the month range cuts through has its edge's kinds
+    scanned; every other entry read qualifies as it is. Offers the same
+    adjacent/degree interface as the engine itself.
+    """
+
+    def __init__(self, engine: "GraphEngine", path_filter: PathFilter):
+        mask = path_filter.kind_mask()
+        self.first, self.last = path_filter.month_range()
+        self.kind_offsets, self.kind_codes = engine.kind_offsets, engine.kind_codes
+        self.parts = [(slot,) + engine.kind_partitions[slot]
+                      for slot in sorted(engine.kind_partitions) if mask >> slot & 1]
+        self.lowest = max(self.first, 0) // BUCKET_MONTHS
+        self.highest = min(self.last, 255 * BUCKET_MONTHS) // BUCKET_MONTHS
+        # Buckets partly outside [first, last]
+        self.partial = set()
+        if self.first > 0 and self.first % BUCKET_MONTHS:
+            self.partial.add(self.lowest)
+        if self.last < 255 * BUCKET_MONTHS and self.last % BUCKET_MONTHS != BUCKET_MONTHS - 1:
+            self.partial.add(self.highest)
+
+    def degree(self, node: int) -> int:
+        return sum(offsets[node + 1] - offsets[node] for _, offsets, _, _, _ in self.parts)
+
+    def adjacent(self, node: int) -> List[Tuple[int, int]]:
+        """Distinct (neighbour, edge) pairs joined by an admitted edge"""
+        found: Dict[int, int] = {}
+        lowest, highest, partial = self.lowest, self.highest, self.partial
+        for slot, offsets, neighbors, edge_ids, buckets in self.parts:
+            start, end = offsets[node], offsets[node + 1]
+            if start == end:
+                continue
+            start = bisect_left(buckets, lowest, start, end)
+            end = bisect_right(buckets, highest, start, end)
+            for i in range(start, end):
+                neighbour = neighbors[i]
+                if neighbour in found:
+                    continue
+                if buckets[i] in partial and not self._in_range(edge_ids[i], slot):
+                    continue
+                found[neighbour] = edge_ids[i]
+        return list(found.items())
+
+    def _in_range(self, edge: int, slot: int) -> bool:
+        kind_codes, first, last = self.kind_codes, self.first, self.last
+        for j in range(self.kind_offsets[edge], self.kind_offsets[edge + 1]):
+            code = kind_codes[j]
+            if code & 15 == slot and first <= code >> 4 <= last:
+                return True
+        return False
+
+class GraphEngine:
+    """In-process copy of the PLAYED graph in compressed-sparse-row form.
+
+    Players are interned to integer ids; the neighbours of player i are
+    neighbors[offsets[i]:offsets[i + 1]], and edge_ids holds, in the same
+    positions, the index of the game shown for that pair. Neo4j stays the
+    source of truth: the engine is rebuilt from it (or from a snapshot of it)
+    and callers fall back to Cypher whenever it cannot answer.
+
+    The kinds of games each edge stands for (see path_filters) are packed into
+    kind_codes[kind_offsets[e]:kind_offsets[e + 1]]. Filtered searches read
+    kind_partitions instead of the full adjacency (see partition_kinds and
+    FilteredEdges); they are built once per engine, or mapped from a snapshot.
+    """
+
+    def __init__(self, usernames: Sequence[str], avatars: Sequence, titles: Sequence,
+                 offsets, neighbors, edge_ids, games: Sequence[Dict],
+                 kind_offsets=None, kind_codes=None, kind_partitions: Optional[Dict[int, Tuple]] = None):
+        self.usernames = usernames
+        self.avatars = avatars
+        self.titles = titles
+        self.ids = {username: i for i, username in enumerate(usernames)}
+        self.offsets = offsets
+        self.neighbors = neighbors
+        self.edge_ids = edge_ids
+        self.games = games
+        self.kind_offsets = kind_offsets
+        self.kind_codes = kind_codes
+        if kind_offsets is not None and kind_partitions is None:
+            kind_partitions = partition_kinds(offsets, neighbors, edge_ids, kind_offsets, kind_codes)
+        self.kind_partitions = kind_partitions if kind_offsets is not None else None
+        self.loaded_at = time.time()
+        self.refreshed_at: Optional[float] = None   # DataMetadata.last_refreshed of a snapshot
+
+    @classmethod
+    def from_edges(cls, players: List[Tuple[str, object, object]], edges: List[Tuple[str, str, Dict]]) -> "GraphEngine":
+        """Build from (username, avatar, title) rows and (a, b, game) rows; edges are undirected"""
+        usernames = [p[0] for p in players]
+        avatars = [p[1] for p in players]
+        titles = [p[2] for p in players]
+        ids = {username: i for i, username in enumerate(usernames)}
+
+        # One edge per unordered pair, whichever game is seen first
+        pairs: Dict[Tuple[int, int], int] = {}
+        games: List[Dict] = []
+        for a, b, game in edges:
+            ia, ib = ids.get(a), ids.get(b)
+            if ia is None or ib is None or ia == ib:
+                continue
+            key = (ia, ib) if ia < ib else (ib, ia)
+            if key not in pairs:
+                pairs[key] = len(games)
+                games.append(game)
+
+        kind_offsets = array("i", [0])
+        kind_codes = array("i")
+        for game in games:
+            kind_codes.extend(encode_kind(kind) for kind in game.pop("kinds", None) or ())
+            kind_offsets.append(len(kind_codes))
+
+        degree = array("i", [0]) * (len(usernames) + 1)
+        for ia, ib in pairs:
+            degree[ia] += 1
+            degree[ib] += 1
+
+        offsets = array("i", [0]) * (len(usernames) + 1)
+        for i in range(len(usernames)):
+            offsets[i + 1] = offsets[i] + degree[i]
+
+        neighbors = array("i", [0]) * (2 * len(pairs))
+        edge_ids = array("i", [0]) * (2 * len(pairs))
+        cursor = array("i", offsets)
+        for (ia, ib), edge in pairs.items():
+            neighbors[cursor[ia]] = ib
+            edge_ids[cursor[ia]] = edge
+            cursor[ia] += 1
+            neighbors[cursor[ib]] = ia
+            edge_ids[cursor[ib]] = edge
+            cursor[ib] += 1
+
+        return cls(usernames, avatars, titles, offsets, neighbors, edge_ids, games, kind_offsets, kind_codes)
+
+    @classmethod
+    def load(cls, driver) -> "GraphEngine":
+        """Pull every Player and PLAYED edge out of Neo4j"""
+        start = time.perf_counter()
+        with driver.session() as session:
+            players = [
+                (record["username"], record["avatar"], record["title"])
+                for record in session.run("""
+                MATCH (p:Player)
+                RETURN p.username AS username, p.avatar AS avatar, p.title AS title
+                """)
+            ]
+            edges = [
+                (record["a"], record["b"], {
+                    "url": record["url"],
+                    "date": record["date"],
+                    "end_time": record["end_time"],
+                    "games": record["games"],
+                    "kinds": record["kinds"]
+                })
+                for record in session.run("""
+                MATCH (a:Player)-[r:PLAYED]->(b:Player)
+                RETURN a.username AS a, b.username AS b, r.url AS url, r.date AS date,
+                       r.last_end_time AS end_time, r.games AS games, r.kinds AS kinds
+                """)
+            ]
+        engine = cls.from_edges(players, edges)
+        logger.info(f"Graph engine loaded {len(engine.usernames)} players, "
+                    f"{len(engine.games)} edges in {time.perf_counter() - start:.2f}s")
+        return engine
+
+    @classmethod
+    def from_snapshot(cls, path: str) -> "GraphEngine":
+        """Map a snapshot written by export_snapshot; only the username index is built in memory"""
+        start = time.perf_counter()
+        snapshot = Snapshot(path)
+        engine = cls(
+            snapshot.usernames,
+            snapshot.avatars,
+            snapshot.titles,
+            snapshot.column("offsets", "i"),
+            snapshot.column("nbrs", "i"),
+            snapshot.column("edgeids", "i"),
+            snapshot.games,
+            snapshot.column("kindoffs", "i") if "kindoffs" in snapshot.sections else None,
+            snapshot.column("kinds", "i") if "kinds" in snapshot.sections else None,
+            snapshot.kind_partitions()
+        )
+        # Age the engine from when the snapshot was taken, so an old file is soon rebuilt
+        engine.loaded_at = snapshot.created_at
+        engine.refreshed_at = snapshot.refreshed_at
+        logger.info(f"Graph engine mapped {snapshot.players} players, {snapshot.pairs} edges "
+                    f"from {path} in {time.perf_counter() - start:.3f}s")
+        return engine
+
+    def __len__(self):
+        return len(self.usernames)
+
+    def neighbours(self, node: int):
+        return self.neighbors[self.offsets[node]:self.offsets[node + 1]]
+
+    def degree(self, node: int) -> int:
+        return self.offsets[node + 1] - self.offsets[node]
+
+    def adjacent(self, node: int):
+        """(neighbour, edge) pairs of node"""
+        start, end = self.offsets[node], self.offsets[node + 1]
+        return zip(self.neighbors[start:end], self.edge_ids[start:end])
+
+    def filtered_edges(self, path_filter: PathFilter) -> FilteredEdges:
+        return FilteredEdges(self, path_filter)
+
+    def shortest_path(self, source: int, target: int, max_depth: int = 6,
+                      edges=None) -> Optional[List[Tuple[int, int]]]:
+        """Bidirectional BFS over edges, a FilteredEdges (all of the engine's by default).
+
+        Returns [(node, edge into node)] from source to target, or None.
+        """
+        if source == target:
+            return [(source, -1)]
+
+        if edges is None:
+            edges = self
+        adjacent, degree = edges.adjacent, edges.degree
+        # node -> (previous node, edge) on each side
+        forward = {source: (-1, -1)}
+        backward = {target: (-1, -1)}
+        forward_frontier = [source]
+        backward_frontier = [target]
+        depth = 0
+
+        while forward_frontier and backward_frontier and depth < max_depth:
+            # Expand the side whose frontier has fewer edges to scan
+            forward_cost = sum(degree(n) for n in forward_frontier)
+            backward_cost = sum(degree(n) for n in backward_frontier)
+            if forward_cost <= backward_cost:
+                frontier, seen, other = forward_frontier, forward, backward
+            else:
+                frontier, seen, other = backward_frontier, backward, forward
+
+            depth += 1
+            meeting = -1
+            next_frontier = []
+            for node in frontier:
+                for neighbour, edge in adjacent(node):
+                    if neighbour in seen:
+                        continue
+                    seen[neighbour] = (node, edge)
+                    if neighbour in other:
+                        meeting = neighbour
+                        break
+                    next_frontier.append(neighbour)
+                if meeting != -1:
+                    break
+
+            if meeting != -1:
+                return self._join(forward, backward, meeting)
+
+            if seen is forward:
+                forward_frontier = next_frontier
+            else:
+                backward_frontier = next_frontier
+
+        return None
+
+    @staticmethod
+    def _join(forward: Dict, backward: Dict, meeting: int) -> List[Tuple[int, int]]:
+        head = []
+        node = meeting
+        while node != -1:
+            previous, edge = forward[node]
+            head.append((node, edge))
+            node = previous
+        head.reverse()
+
+        # Walk back towards the target, re-attaching each edge to the node it leads into
+        path = head
+        node = meeting
+        previous, edge = backward[node]
+        while previous != -1:
+            path.append((previous, edge))
+            node = previous
+            previous, edge = backward[node]
+        return path
+
+    def find_path(self, username: str, target: str = "magnuscarlsen", max_depth: int = 6,
+                  path_filter: Optional[PathFilter] = None) -> Optional[Dict]:
+        """Same payload as graph.find_path, or None when the engine cannot answer"""
+        source_id = self.ids.get(username)
+        target_id = self.ids.get(target)
+        if source_id is None or target_id is None:
+            return None
+        if path_filter and self.kind_offsets is None:
+            return None
+
+        edges = self.filtered_edges(path_filter) if path_filter else None
+        hops = self.shortest_path(source_id, target_id, max_depth, edges)
+        return self.path_payload(hops, path_filter) if hops is not None else None
+
+    def path_payload(self, hops: List[Tuple[int, int]], path_filter: Optional[PathFilter] = None) -> Dict:
+        """The find_path response for [(node, edge into node)] hops"""
+        games = []
+        for _, edge in hops[1:]:
+            game = self.games[edge]
+            games.append({"url": game["url"], "date": game["date"]})
+            if path_filter:
+                kinds = self.kind_codes[self.kind_offsets[edge]:self.kind_offsets[edge + 1]]
+                games[-1]["matched"] = path_filter.describe(decode_kind(code) for code in kinds)
+        return {
+            "path": [
+                {"username": self.usernames[node], "avatar": self.avatars[node], "title": self.titles[node]}
+                for node, _ in hops
+            ],
+            "games": games
+        }
+
+def export_snapshot(driver, path: str) -> Dict:
+    """Write the current graph, stamped with DataMetadata.last_refreshed, to a snapshot file"""
+    engine = GraphEngine.load(driver)
+    with driver.session() as session:
+        record = session.run("MATCH (meta:DataMetadata) RETURN meta.last_refreshed AS last_refreshed").single()
+    refreshed = record["last_refreshed"] if record else None
+    refreshed_at = refreshed.to_native().timestamp() if refreshed is not None else None
+
+    size = write_snapshot(path, engine.usernames, engine.avatars, engine.titles,
+                          engine.offsets, engine.neighbors, engine.edge_ids, engine.games, refreshed_at,
+                          engine.kind_offsets, engine.kind_codes, engine.kind_partitions)
+    logger.info(f"Wrote snapshot of {len(engine)} players, {len(engine.games)} edges to {path} ({size} bytes)")
+    return {"path": path, "players": len(engine), "edges": len(engine.games), "bytes": size}
+
+_engine: Optional[GraphEngine] = None
+_engine_lock = threading.Lock()   # Held while the shared engine is being (re)built
+
+def get_engine(driver, max_age_seconds: float, snapshot_path: Optional[str] = None) -> GraphEngine:
+    """Return the shared engine, rebuilding it from Neo4j once it is older than max_age_seconds.
+
+    On first use the engine is mapped from snapshot_path when that file exists,
+    which is much faster than pulling the graph through the driver. Only one
+    caller rebuilds at a time; while it does, other callers keep getting the
+    stale engine rather than waiting (or loading a second copy).
+    """
+    global _engine
+    engine = _engine
+    if engine is not None and time.time() - engine.loaded_at <= max_age_seconds:
+        return engine
+    if engine is not None and not _engine_lock.acquire(blocking=False):
+        return engine
+    if engine is None:
+        _engine_lock.acquire()
+
+    try:
+        # Another caller may have built it while this one waited for the lock
+        if _engine is None and snapshot_path and os.path.exists(snapshot_path):
+            try:
+                _engine = GraphEngine.from_snapshot(snapshot_path)
+            except (OSError, SnapshotError) as e:
+                logger.warning(f"Ignoring graph snapshot {snapshot_path}: {e}")
+        if _engine is None or time.time() - _engine.loaded_at > max_age_seconds:
+            _engine = GraphEngine.load(driver)
+        return _engine
+    finally:
+        _engine_lock.release()
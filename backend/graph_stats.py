@@ -0,0 +1,145 @@
+from typing import Dict, List, Optional
+import logging
+from metrics import query
+
+logger = logging.getLogger(__name__)
+
+# Taking the write lock on the metadata node serialises concurrent counter updates
+LOCK_QUERY = """
+MERGE (meta:DataMetadata)
+SET meta.total_games = coalesce(meta.total_games, 0)
+RETURN meta.total_games AS total_games,
+       coalesce(meta.level_players, []) AS level_players,
+       coalesce(meta.level_games, []) AS level_games,
+       coalesce(meta.unreached_players, 0) AS unreached_players,
+       coalesce(meta.unreached_games, 0) AS unreached_games
+"""
+
+SET_QUERY = """
+MATCH (meta:DataMetadata)
+SET meta += $props
+"""
+
+# Player and PLAYED counts without a label/type predicate are served from the count store
+COUNT_QUERY = """
+CALL { MATCH (p:Player) RETURN count(p) AS players }
+CALL { MATCH ()-[r:PLAYED]->() RETURN count(r) AS relationships }
+OPTIONAL MATCH (meta:DataMetadata)
+RETURN players, relationships, meta.total_games AS total_games,
+       coalesce(meta.level_players, []) AS level_players,
+       coalesce(meta.level_games, []) AS level_games,
+       coalesce(meta.unreached_players, 0) AS unreached_players,
+       coalesce(meta.unreached_games, 0) AS unreached_games
+"""
+
+RECOUNT_LEVELS_QUERY = """
+MATCH (p:Player)
+OPTIONAL MATCH (p)-[r:PLAYED]-()
+WITH p, sum(CASE WHEN r IS NULL THEN 0 ELSE coalesce(r.games, 1) END) AS games
+WITH CASE WHEN p.parent IS NOT NULL OR p.distance_from_magnus = 0 THEN p.distance_from_magnus END AS level,
+     games
+RETURN level, count(*) AS players, sum(games) AS games
+"""
+
+RECOUNT_GAMES_QUERY = """
+MATCH ()-[r:PLAYED]->()
+RETURN sum(coalesce(r.games, 1)) AS total_games
+"""
+
+def _apply(counts: List[int], deltas: Dict[int, int]) -> List[int]:
+    counts = list(counts)
+    for level, delta in deltas.items():
+        if level >= len(counts):
+            counts.extend([0] * (level + 1 - len(counts)))
+        counts[level] += delta
+    return counts
+
+class GraphStats:
+    """Running totals on the DataMetadata node, so monitoring never scans the graph.
+
+    Levels are distances from Magnus in the distance tree; players it has
+    not reached (or with a distance that predates it) count as unreached.
+    level_games sums each player's games, so a game counts once for each of
+    its two players. GraphWriter adds games and new players, DistanceTree
+    moves players between levels and resets them all on rebuild, and
+    reconcile() recounts from scratch.
+    """
+
+    def __init__(self, driver):
+        self.driver = driver
+
+    def add(self, games: int = 0, players: Optional[Dict[Optional[int], int]] = None,
+            level_games: Optional[Dict[Optional[int], int]] = None):
+        """Apply deltas; players and level_games map a level (None = unreached) to a change"""
+        players = {level: delta for level, delta in (players or {}).items() if delta}
+        level_games = {level: delta for level, delta in (level_games or {}).items() if delta}
+        if not games and not players and not level_games:
+            return
+
+        def update(current: Dict) -> Dict:
+            return {
+                "total_games": current["total_games"] + games,
+                "level_players": _apply(current["level_players"],
+                                        {k: v for k, v in players.items() if k is not None}),
+                "level_games": _apply(current["level_games"],
+                                      {k: v for k, v in level_games.items() if k is not None}),
+                "unreached_players": current["unreached_players"] + players.get(None, 0),
+                "unreached_games": current["unreached_games"] + level_games.get(None, 0)
+            }
+        self._update(update)
+
+    def set_levels(self, players: Dict[Optional[int], int], level_games: Dict[Optional[int], int],
+                   total_games: Optional[int] = None):
+        """Replace the per-level counters (and optionally the game total) with exact values"""
+        def update(current: Dict) -> Dict:
+            props = {
+                "level_players": _apply([], {k: v for k, v in players.items() if k is not None}),
+                "level_games": _apply([], {k: v for k, v in level_games.items() if k is not None}),
+                "unreached_players": players.get(None, 0),
+                "unreached_games": level_games.get(None, 0)
+            }
+            if total_games is not None:
+                props["total_games"] = total_games
+            return props
+        self._update(update)
+
+    def _update(self, update):
+        def work(tx):
+            current = tx.run(LOCK_QUERY).single().data()
+            tx.run(SET_QUERY, props=update(current)).consume()
+
+        with query("stats_update"), self.driver.session() as session:
+            session.execute_write(work)
+
+    def read(self) -> Dict:
+        """Counts in constant time: the count store for nodes and edges, counters for the rest"""
+        with query("stats_read"), self.driver.session() as session:
+            record = session.run(COUNT_QUERY).single()
+
+        levels = {}
+        for level, players in enumerate(record["level_players"]):
+            if players:
+                games = record["level_games"][level] if level < len(record["level_games"]) else 0
+                levels[level] = {"players": players, "games": games}
+        if record["unreached_players"]:
+            levels[None] = {"players": record["unreached_players"], "games": record["unreached_games"]}
+
+        return {
+            "players": record["players"],
+            "relationships": record["relationships"],
+            "total_games": record["total_games"],
+            "levels": levels
+        }
+
+    def reconcile(self) -> Dict:
+        """Full recount of the counters (scans every player and edge)"""
+        players, level_games = {}, {}
+        with query("stats_reconcile"), self.driver.session() as session:
+            for record in session.run(RECOUNT_LEVELS_QUERY):
+                players[record["level"]] = record["players"]
+                level_games[record["level"]] = record["games"]
+            total_games = session.run(RECOUNT_GAMES_QUERY).single()["total_games"] or 0
+
+        self.set_levels(players, level_games, total_games)
+        logger.info(f"Reconciled graph statistics: {total_games} games")
+        return self.read()
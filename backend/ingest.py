@@ -1,15 +1,45 @@
-from chess_api import get_recent_games, get_player_profile
-from neo4j import GraphDatabase
+from chess_api import get_recent_games, get_player_profile, reduce_game
+from neo4j import AsyncGraphDatabase, GraphDatabase
 from pydantic_settings import BaseSettings
+from writer import GraphWriter
+from distance_tree import DistanceTree
+from path_cache import path_cache
+from search_index import SearchIndexes
+from metrics import query, span
+from datetime import datetime, timedelta, timezone
+from typing import List
+import asyncio
 import httpx
 
 class Settings(BaseSettings):
     neo4j_uri: str
     neo4j_user: str
     neo4j_password: str
+    neo4j_pool_size: int = 50                # Async driver connections shared by API handlers
+    neo4j_acquisition_timeout: float = 5.0
+    neo4j_query_timeout: float = 10.0        # Server-side limit on API read transactions
+    write_batch_size: int = 1000
+    profile_ttl_hours: int = 168   # Stored profiles newer than this are not fetched again
+    graph_engine_enabled: bool = False       # Answer /path from the in-process CSR engine
+    graph_engine_max_age_seconds: int = 900  # Rebuild the engine from Neo4j after this long
+    graph_snapshot_path: str = "cache/graph.snapshot"  # Cold-start the engine from here (scheduler.py snapshot)
+    distance_tree_enabled: bool = True       # Serve /path from the stored Magnus distance tree
+    search_candidates: int = 200             # Prefix matches ranked by the Cypher search until the index is built
+    search_index_max_age_seconds: int = 600  # Rebuild the in-process search index after this long
+    search_index_min_rebuild_seconds: int = 60  # Earliest rebuild after ingestion adds players
+    path_targets: List[str] = ["magnuscarlsen"]  # Players /path can measure degrees to (JSON list in env)
+    target_tree_hot_after: int = 3           # Requests for a target before the engine keeps a BFS tree for it
+    target_tree_max_mb: float = 32           # Memory cap per target tree (12 bytes per player held)
+    target_tree_cache_mb: float = 256        # Memory cap across all target trees (LRU)
+    paths_max_usernames: int = 500           # Players per POST /paths request
+    paths_max_concurrent: int = 4            # POST /paths requests computed at once (others get 429)
+    paths_fallback_chunk: int = 50           # Players per Neo4j shortestPath query in a batch
+    all_paths_max_k: int = 20                # Paths listed per /path/{username}/all request
+    all_paths_limit: int = 1000              # Paths Neo4j enumerates when the engine cannot count them
 
     class Config:
         env_file = ".env"
+        extra = "ignore"
 
 settings = Settings()
 
@@ -18,7 +48,46 @@ driver = GraphDatabase.driver(
     auth=(settings.neo4j_user, settings.neo4j_password)
 )
 
+# The API's read paths use the async driver so concurrent requests overlap their database waits
+async_driver = AsyncGraphDatabase.driver(
+    settings.neo4j_uri,
+    auth=(settings.neo4j_user, settings.neo4j_password),
+    max_connection_pool_size=settings.neo4j_pool_size,
+    connection_acquisition_timeout=settings.neo4j_acquisition_timeout
+)
+
+distance_tree = DistanceTree(driver, batch_size=settings.write_batch_size)
+
+search_indexes = SearchIndexes(settings.search_index_max_age_seconds, settings.search_index_min_rebuild_seconds)
+
+def players_with_fresh_profiles(usernames):
+    """Return the usernames whose stored profile is newer than the profile TTL"""
+    with query("fresh_profiles"), driver.session() as session:
+        result = session.run("""
+        UNWIND $usernames AS username
+        MATCH (p:Player {username: username})
+        WHERE p.profile_updated > datetime() - duration({hours: $ttl})
+        RETURN p.username AS username
+        """, usernames=list(usernames), ttl=settings.profile_ttl_hours)
+        return {record["username"] for record in result}
+
+async def fetch_profile(username):
+    """Fetch the profile fields we store; an empty dict leaves the stored ones untouched"""
+    try:
+        profile = await get_player_profile(username)
+    except (Exception, httpx.HTTPStatusError):
+        return {}
+    return {
+        "avatar": profile.get("avatar", ""),
+        "title": profile.get("title", ""),
+        "profile_updated": datetime.now(timezone.utc)
+    }
+
 async def ingest_player(username, months=12):
+    with span("ingest_player", username=username, months=months):
+        await _ingest_player(username, months)
+
+async def _ingest_player(username, months):
     games = await get_recent_games(username, months)
     
     # Get unique player usernames from games
@@ -27,66 +96,34 @@ async def ingest_player(username, months=12):
         players.add(g["white"]["username"].lower())
         players.add(g["black"]["username"].lower())
     
-    # Fetch profile data for all players
-    profiles = {}
-    for player in players:
-        try:
-            profile = await get_player_profile(player)
-            profiles[player] = {
-                "avatar": profile.get("avatar", ""),
-                "title": profile.get("title", "")
-            }
-        except (Exception, httpx.HTTPStatusError):
-            profiles[player] = {
-                "avatar": "",
-                "title": ""
-            }
+    # Fetch profile data concurrently (bounded by the shared HTTP limit),
+    # skipping players whose stored profile is still fresh. The driver calls
+    # are synchronous, so they run on a worker thread to keep the API's event
+    # loop serving requests while a background job writes.
+    fresh = await asyncio.to_thread(players_with_fresh_profiles, players)
+    stale = sorted(players - fresh)
+    fetched = await asyncio.gather(*(fetch_profile(player) for player in stale))
+    profiles = dict(zip(stale, fetched))
 
-    # Group games by player pair and keep only the most recent for each pair
-    recent_games = {}
-    for g in games:
-        white = g["white"]["username"].lower()
-        black = g["black"]["username"].lower()
-        pair_key = tuple(sorted([white, black]))
-        
-        date = g.get("end_time") or g.get("last_move_at") or g.get("start_time", "")
-        
-        if pair_key not in recent_games or date > recent_games[pair_key].get("date", ""):
-            recent_games[pair_key] = {
-                "white": white,
-                "black": black,
-                "url": g["url"],
-                "date": date
-            }
+    await asyncio.to_thread(_write_player, players, profiles, games, months)
 
-    with driver.session() as session:
-        for game_data in recent_games.values():
-            white = game_data["white"]
-            black = game_data["black"]
-            url = game_data["url"]
-            date = game_data["date"]
+def _write_player(players, profiles, games, months):
+    """Write phase of ingest_player: graph, tree repair, cache invalidation, metadata"""
+    with GraphWriter(driver, settings.write_batch_size) as writer:
+        for player in players:
+            writer.add_player(player, profiles.get(player))
+        for g in games:
+            writer.add_game(reduce_game(g))
 
-            session.run("""
-            MERGE (w:Player {username: $white})
-            SET w.avatar = $white_avatar, w.title = $white_title
-            MERGE (b:Player {username: $black})
-            SET b.avatar = $black_avatar, b.title = $black_title
-            MERGE (w)-[:PLAYED {url: $url, date: $date}]->(b)
-            MERGE (b)-[:PLAYED {url: $url, date: $date}]->(w)
-            """, 
-            white=white, 
-            black=black, 
-            url=url, 
-            date=date,
-            white_avatar=profiles.get(white, {}).get("avatar", ""),
-            white_title=profiles.get(white, {}).get("title", ""),
-            black_avatar=profiles.get(black, {}).get("avatar", ""),
-            black_title=profiles.get(black, {}).get("title", "")
-            )
+    if settings.distance_tree_enabled:
+        with span("tree_repair"):
+            distance_tree.repair(writer.edges_written)
+    if path_cache is not None:
+        path_cache.invalidate_players(writer.players_written)
+    search_indexes.expire()
 
     # Store metadata about the data ingestion
     with driver.session() as session:
-        from datetime import datetime, timedelta
         twelve_months_ago = datetime.now() - timedelta(days=365)
         
         session.run("""
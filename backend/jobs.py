@@ -0,0 +1,154 @@
+import asyncio
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Optional
+import logging
+from pydantic_settings import BaseSettings
+from metrics import continue_trace, current_trace, span
+
+logger = logging.getLogger(__name__)
+
+class Settings(BaseSettings):
+    ingest_workers: int = 2
+    ingest_queue_size: int = 1000
+    ingest_cooldown_seconds: int = 900   # A user is re-ingested at most this often
+    ingest_job_history: int = 5000       # Finished jobs kept for status lookups
+
+    class Config:
+        env_file = ".env"
+        extra = "ignore"
+
+settings = Settings()
+
+class IngestQueue:
+    """In-process background queue for player ingestion.
+
+    Submitting a username that already has a queued or running job, or whose
+    last job finished within the cooldown, returns that job instead of adding
+    a new one. A fixed pool of worker tasks drains the queue; when it is full
+    the new job is recorded as rejected, so its id still resolves.
+    """
+
+    def __init__(self, ingest: Callable[[str], Awaitable], workers: int, maxsize: int,
+                 cooldown_seconds: float, history: int):
+        self.ingest = ingest
+        self.workers = workers
+        self.maxsize = maxsize
+        self.cooldown_seconds = cooldown_seconds
+        self.history = history
+        self.jobs: Dict[str, Dict] = {}
+        self.latest: Dict[str, str] = {}    # username -> most recent job id
+        self.events: Dict[str, asyncio.Event] = {}
+        self.traces: Dict[str, tuple] = {}   # job id -> span that submitted it
+        self.queue: Optional[asyncio.Queue] = None
+        self.tasks = []
+
+    def start(self):
+        self.queue = asyncio.Queue(self.maxsize)
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def submit(self, username: str) -> Dict:
+        username = username.lower()
+        job = self.jobs.get(self.latest.get(username))
+        if job is not None:
+            if job["status"] in ("queued", "running"):
+                return job
+            if job["status"] == "done" and time.time() - job["finished_at"] < self.cooldown_seconds:
+                return job
+
+        trace = current_trace()
+        job = {
+            "id": uuid.uuid4().hex,
+            "username": username,
+            "trace_id": trace[0] if trace else None,
+            "status": "queued",
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "error": None
+        }
+        try:
+            self.queue.put_nowait(job["id"])
+        except asyncio.QueueFull:
+            # Kept for status lookups, but not as the user's latest job, so the next request retries
+            job["status"] = "rejected"
+            job["error"] = "ingest queue is full"
+            job["finished_at"] = job["created_at"]
+            self.jobs[job["id"]] = job
+            self._prune()
+            return job
+
+        self.jobs[job["id"]] = job
+        self.latest[username] = job["id"]
+        self.events[job["id"]] = asyncio.Event()
+        self.traces[job["id"]] = trace
+        self._prune()
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        return self.jobs.get(job_id)
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[Dict]:
+        """Wait up to timeout seconds for a job to finish and return its current state"""
+        event = self.events.get(job_id)
+        if event is not None and timeout > 0:
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.get(job_id)
+
+    async def _worker(self):
+        while True:
+            job_id = await self.queue.get()
+            job = self.jobs.get(job_id)
+            try:
+                if job is None:
+                    continue
+                job["status"] = "running"
+                job["started_at"] = time.time()
+                # Attach the ingest work to the trace of the request that queued it
+                with continue_trace(self.traces.pop(job_id, None)), span("ingest_job", username=job["username"]):
+                    await self.ingest(job["username"])
+                job["status"] = "done"
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ingest job for {job['username']} failed: {e}")
+                job["status"] = "failed"
+                job["error"] = str(e)
+            finally:
+                if job is not None and job["status"] != "running":
+                    job["finished_at"] = time.time()
+                    event = self.events.pop(job_id, None)
+                    if event is not None:
+                        event.set()
+                self.queue.task_done()
+
+    def _prune(self):
+        """Forget the oldest finished jobs once the history bound is exceeded"""
+        if len(self.jobs) <= self.history:
+            return
+        for job_id in list(self.jobs):
+            if len(self.jobs) <= self.history:
+                break
+            job = self.jobs[job_id]
+            if job["status"] in ("done", "failed", "rejected"):
+                del self.jobs[job_id]
+                if self.latest.get(job["username"]) == job_id:
+                    del self.latest[job["username"]]
+
+def create_ingest_queue(ingest: Callable[[str], Awaitable]) -> IngestQueue:
+    return IngestQueue(
+        ingest,
+        settings.ingest_workers,
+        settings.ingest_queue_size,
+        settings.ingest_cooldown_seconds,
+        settings.ingest_job_history,
+    )
@@ -1,13 +1,164 @@
-from fastapi import FastAPI, Query
-from ingest import ingest_player, driver
-from graph import find_path, get_data_metadata
+import json
+import time
+from contextlib import asynccontextmanager
+from datetime import date
+from typing import List, Optional
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+from ingest import ingest_player, async_driver, settings
+from graph import find_path, find_paths, find_all_paths, get_data_metadata, find_players_by_prefix, target_trees
+from distance_tree import MAGNUS
+from path_filters import PathFilter
+from shortest_paths import RANKS
+from chess_api import close_client
+from path_cache import path_cache
+from jobs import create_ingest_queue
+import metrics
 
-app = FastAPI()
+ingest_queue = create_ingest_queue(ingest_player)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    ingest_queue.start()
+    yield
+    await ingest_queue.stop()
+    await close_client()
+    await async_driver.close()
+
+app = FastAPI(lifespan=lifespan)
+
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    """Per-route latency histogram, and a root span whose trace id is returned as X-Trace-Id"""
+    start = time.perf_counter()
+    status = 500
+    with metrics.span("http", path=request.url.path) as record:
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            response.headers["X-Trace-Id"] = record["trace_id"]
+            return response
+        finally:
+            # Label by route template, not the raw path, to keep label cardinality bounded
+            route = request.scope.get("route")
+            route = route.path if route is not None else "unmatched"
+            record["name"] = f"{request.method} {route}"
+            metrics.HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start, method=request.method, route=route, status=status
+            )
+
+def check_target(target: str) -> str:
+    target = target.lower()
+    if target not in {t.lower() for t in settings.path_targets}:
+        raise HTTPException(status_code=400, detail=f"Unsupported target: {target}")
+    return target
+
+def path_filter_from(time_class: Optional[str], rated: Optional[bool],
+                     since: Optional[date], until: Optional[date]) -> PathFilter:
+    try:
+        return PathFilter(time_class.split(",") if time_class else None, rated, since, until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/path/{username}")
-async def path_to_magnus(username: str):
-    await ingest_player(username)
-    return find_path(username)
+async def path_to_magnus(username: str, target: str = Query(MAGNUS),
+                         time_class: Optional[str] = Query(None, description="e.g. blitz or bullet,blitz"),
+                         rated: Optional[bool] = None,
+                         since: Optional[date] = None, until: Optional[date] = None):
+    """Answer from the current graph and refresh the player in the background.
+
+    With time_class, rated, since or until, every hop must be backed by a game
+    matching them; each hop then reports what its matching games were.
+    """
+    username = username.lower()
+    target = check_target(target)
+    path_filter = path_filter_from(time_class, rated, since, until)
+    if path_filter:
+        # Filtered results are not cached: the key space is large and the engine filters cheaply
+        return {**(await find_path(username, target, path_filter)), "job": ingest_queue.submit(username)}
+
+    if path_cache is not None:
+        cached = path_cache.get(username, target)
+        if cached is not None:
+            return cached
+
+    result = await find_path(username, target)
+    if path_cache is not None and result["path"] is not None:
+        path_cache.set(username, result, target)
+    return {**result, "job": ingest_queue.submit(username)}
+
+@app.get("/path/{username}/all")
+async def all_paths_to_target(username: str, target: str = Query(MAGNUS),
+                              k: int = Query(5, ge=1, le=settings.all_paths_max_k),
+                              rank: Optional[str] = Query(None, description="titled or recent"),
+                              time_class: Optional[str] = None, rated: Optional[bool] = None,
+                              since: Optional[date] = None, until: Optional[date] = None):
+    """Number of distinct shortest paths, the first k, and with rank the best-scoring one"""
+    target = check_target(target)
+    if rank is not None and rank not in RANKS:
+        raise HTTPException(status_code=400, detail=f"rank must be one of {', '.join(RANKS)}")
+    path_filter = path_filter_from(time_class, rated, since, until)
+    return await find_all_paths(username, target, k, rank, path_filter or None)
+
+class PathsRequest(BaseModel):
+    usernames: List[str]
+    target: str = MAGNUS
+
+paths_in_progress = 0   # POST /paths responses still streaming
+
+@app.post("/paths")
+async def paths_to_target(request: PathsRequest):
+    """Paths for many players in one call, streamed as NDJSON lines as they are found.
+
+    Usernames are deduplicated; cached paths come first, then the rest are
+    resolved together by find_paths. Unlike /path, no ingest jobs are queued.
+    """
+    target = check_target(request.target)
+    usernames = list(dict.fromkeys(username.lower() for username in request.usernames))
+    if len(usernames) > settings.paths_max_usernames:
+        raise HTTPException(status_code=413, detail=f"At most {settings.paths_max_usernames} usernames per request")
+    # Checked and taken with no await in between, so two requests cannot both get the last slot
+    global paths_in_progress
+    if paths_in_progress >= settings.paths_max_concurrent:
+        raise HTTPException(status_code=429, detail="Too many batch path requests in progress")
+    paths_in_progress += 1
+
+    async def lines():
+        global paths_in_progress
+        try:
+            pending = []
+            for username in usernames:
+                cached = path_cache.get(username, target) if path_cache is not None else None
+                if cached is not None:
+                    yield json.dumps({"username": username, **cached}, default=str) + "\n"
+                else:
+                    pending.append(username)
+
+            async for result in find_paths(pending, target):
+                if path_cache is not None and result["path"] is not None:
+                    path_cache.set(result["username"], {"path": result["path"], "games": result["games"]}, target)
+                yield json.dumps(result, default=str) + "\n"
+        finally:
+            paths_in_progress -= 1
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.get("/targets")
+async def get_targets():
+    """Players /path can measure degrees to, and the engine's per-target trees"""
+    return {"targets": settings.path_targets, "trees": target_trees.stats()}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = Query(0, ge=0, le=30), target: str = Query(MAGNUS)):
+    """Ingest job status; pass wait to block until it finishes, then get the refreshed path"""
+    target = check_target(target)
+    job = await ingest_queue.wait(job_id, wait)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    if job["status"] == "done":
+        return {"job": job, **(await find_path(job["username"], target))}
+    return {"job": job}
 
 @app.post("/ingest/magnus")
 async def ingest_magnus():
@@ -17,29 +168,31 @@ async def ingest_magnus():
 @app.get("/metadata")
 async def get_metadata():
     """Get data ingestion metadata"""
-    return get_data_metadata()
+    return await get_data_metadata()
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """Path cache hit/miss counters for this worker"""
+    return path_cache.stats() if path_cache is not None else {}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus text exposition of this worker's metrics"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/traces/{trace_id}")
+async def get_trace(trace_id: str):
+    """Spans recorded for a trace, e.g. a /path request and the ingest job it queued"""
+    spans = metrics.get_trace(trace_id)
+    if not spans:
+        raise HTTPException(status_code=404, detail="Unknown trace")
+    return spans
 
 @app.get("/players/search")
 async def search_players(q: str = Query(..., min_length=2)):
     """Search for players by username prefix"""
     try:
-        with driver.session() as session:
-            result = session.run("""
-            MATCH (p:Player)
-            WHERE toLower(p.username) STARTS WITH toLower($query)
-            RETURN p.username as username, p.avatar as avatar
-            ORDER BY p.username
-            LIMIT 10
-            """, query=q)
-            
-            suggestions = []
-            for record in result:
-                suggestions.append({
-                    "username": record["username"],
-                    "avatar": record["avatar"]
-                })
-            
-            return suggestions
+        return await find_players_by_prefix(q)
     except Exception as e:
         print(f"Database error: {e}")
-        return []
\ No newline at end of file
+        return []
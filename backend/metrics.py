@@ -0,0 +1,189 @@
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+class Metric:
+    """A named family of samples keyed by label values, rendered in Prometheus text format"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.lock = threading.Lock()
+        self.values: Dict[Tuple[str, ...], object] = {}
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def _format_labels(self, key: Tuple[str, ...], extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(zip(self.labels, key))
+        if extra is not None:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{label}="{_escape(value)}"' for label, value in pairs) + "}"
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{self._format_labels(key)} {value}")
+        return lines
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            for key, (counts, total, count) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, bucket in zip(self.buckets, counts):
+                    cumulative += bucket
+                    lines.append(f"{self.name}_bucket{self._format_labels(key, ('le', repr(bound)))} {cumulative}")
+                lines.append(f"{self.name}_bucket{self._format_labels(key, ('le', '+Inf'))} {count}")
+                lines.append(f"{self.name}_sum{self._format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{self._format_labels(key)} {count}")
+        return lines
+
+REGISTRY: List[Metric] = []
+
+HTTP_REQUEST_SECONDS = Histogram("http_request_seconds", "API request latency by route",
+                                 ("method", "route", "status"))
+CHESS_API_REQUESTS = Counter("chess_api_requests_total", "chess.com responses by status code", ("status",))
+CHESS_API_SECONDS = Histogram("chess_api_request_seconds", "chess.com request latency, per attempt")
+CHESS_API_RETRIES = Counter("chess_api_retries_total", "chess.com attempts retried", ("reason",))
+CACHE_LOOKUPS = Counter("cache_lookups_total", "Cache lookups by cache and outcome", ("cache", "result"))
+QUERY_SECONDS = Histogram("cypher_query_seconds", "Cypher transaction time by query name", ("query",))
+ROWS_WRITTEN = Counter("graph_rows_written_total", "Rows written through GraphWriter batches", ("query",))
+WRITE_ROWS_PER_SECOND = Gauge("graph_write_rows_per_second", "Throughput of the most recent GraphWriter flush")
+CLEANUP_DELETED = Counter("cleanup_deleted_total", "Edges, games and players removed by cleanup", ("kind",))
+SPAN_SECONDS = Histogram("span_seconds", "Duration of traced operations", ("span",))
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+def dump(path: str):
+    """Write the current metrics to a file, e.g. at the end of a scheduler run"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        f.write(render())
+
+# Tracing: spans share a trace id through the context (and so across awaited
+# tasks and threads started with asyncio.to_thread); finished spans are kept
+# in a bounded buffer for lookup by trace id.
+
+_current: ContextVar[Optional[Tuple[str, Optional[str]]]] = ContextVar("trace", default=None)
+_finished: deque = deque(maxlen=10000)
+
+def current_trace() -> Optional[Tuple[str, Optional[str]]]:
+    """(trace id, span id) of the innermost open span, to hand to work started elsewhere"""
+    return _current.get()
+
+@contextmanager
+def continue_trace(parent: Optional[Tuple[str, Optional[str]]]):
+    """Run a block as part of a trace captured with current_trace(), e.g. in a queue worker"""
+    token = _current.set(parent)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+@contextmanager
+def span(name: str, **attributes):
+    """Record a timed operation; the yielded record's name and attributes can be updated inside"""
+    parent = _current.get()
+    trace_id = parent[0] if parent else uuid.uuid4().hex[:16]
+    record = {
+        "trace_id": trace_id,
+        "span_id": uuid.uuid4().hex[:16],
+        "parent_id": parent[1] if parent else None,
+        "name": name,
+        "attributes": attributes,
+        "start": time.time(),
+        "status": "ok"
+    }
+    token = _current.set((trace_id, record["span_id"]))
+    start = time.perf_counter()
+    try:
+        yield record
+    except BaseException:
+        record["status"] = "error"
+        raise
+    finally:
+        _current.reset(token)
+        record["duration_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        SPAN_SECONDS.observe(record["duration_ms"] / 1000, span=record["name"])
+        _finished.append(record)
+
+@contextmanager
+def query(name: str):
+    """Time a Cypher transaction under its query name, as a span of the current trace"""
+    with span(f"cypher {name}"), QUERY_SECONDS.time(query=name):
+        yield
+
+def get_trace(trace_id: str) -> List[Dict]:
+    return sorted((record for record in list(_finished) if record["trace_id"] == trace_id),
+                  key=lambda record: record["start"])
@@ -0,0 +1,232 @@
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Set
+import logging
+from pydantic_settings import BaseSettings
+from distance_tree import MAGNUS
+from metrics import CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+class Settings(BaseSettings):
+    path_cache_enabled: bool = True
+    path_cache_max_entries: int = 10000
+    path_cache_ttl_seconds: int = 3600
+    # Shared by every API worker and the scheduler, so ingest anywhere invalidates it;
+    # set it empty for a per-process cache that only expires by TTL
+    path_cache_sqlite_path: str = "cache/paths.sqlite3"
+
+    class Config:
+        env_file = ".env"
+        extra = "ignore"
+
+settings = Settings()
+
+class MemoryStore:
+    """Per-process LRU of path results with a reverse index from player to keys.
+
+    Invalidation only reaches this process: writes made by the scheduler (or
+    another worker) leave its entries in place until they expire.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: OrderedDict = OrderedDict()   # key -> (expires_at, value, players)
+        self.members: Dict[str, Set[str]] = {}
+
+    def get(self, key: str) -> Optional[Dict]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.time():
+            self.delete(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry[1]
+
+    def set(self, key: str, value: Dict, players: Set[str], ttl: float):
+        self.delete(key)
+        self.entries[key] = (time.time() + ttl, value, players)
+        for player in players:
+            self.members.setdefault(player, set()).add(key)
+        while len(self.entries) > self.max_entries:
+            self.delete(next(iter(self.entries)))
+
+    def delete(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        for player in entry[2]:
+            keys = self.members.get(player)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.members[player]
+
+    def invalidate(self, players: Iterable[str]) -> int:
+        keys = set()
+        for player in players:
+            keys.update(self.members.get(player, ()))
+        for key in keys:
+            self.delete(key)
+        return len(keys)
+
+    def clear(self):
+        self.entries.clear()
+        self.members.clear()
+
+class SQLiteStore:
+    """Path results in a SQLite file, so every worker on the host shares one cache"""
+
+    def __init__(self, path: str, max_entries: int):
+        self.max_entries = max_entries
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS paths (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            expires_at REAL NOT NULL,
+            accessed_at REAL NOT NULL
+        )
+        """)
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS path_members (
+            player TEXT NOT NULL,
+            key TEXT NOT NULL,
+            PRIMARY KEY (player, key)
+        )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS path_members_key ON path_members (key)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS paths_accessed ON paths (accessed_at)")
+
+    def get(self, key: str) -> Optional[Dict]:
+        now = time.time()
+        row = self.conn.execute("SELECT value, expires_at FROM paths WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] < now:
+            self.delete(key)
+            return None
+        self.conn.execute("UPDATE paths SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Dict, players: Set[str], ttl: float):
+        now = time.time()
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.execute("DELETE FROM path_members WHERE key = ?", (key,))
+            self.conn.execute(
+                "INSERT OR REPLACE INTO paths (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, default=str), now + ttl, now),
+            )
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO path_members (player, key) VALUES (?, ?)",
+                [(player, key) for player in players],
+            )
+            count = self.conn.execute("SELECT count(*) FROM paths").fetchone()[0]
+            if count > self.max_entries:
+                stale = [row[0] for row in self.conn.execute(
+                    "SELECT key FROM paths ORDER BY accessed_at LIMIT ?", (count - self.max_entries,)
+                )]
+                self._delete_keys(stale)
+
+    def delete(self, key: str):
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self._delete_keys([key])
+
+    def _delete_keys(self, keys):
+        self.conn.executemany("DELETE FROM paths WHERE key = ?", [(key,) for key in keys])
+        self.conn.executemany("DELETE FROM path_members WHERE key = ?", [(key,) for key in keys])
+
+    def invalidate(self, players: Iterable[str]) -> int:
+        players = list(players)
+        if not players:
+            return 0
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            keys = set()
+            for i in range(0, len(players), 500):
+                chunk = players[i:i + 500]
+                keys.update(row[0] for row in self.conn.execute(
+                    f"SELECT key FROM path_members WHERE player IN ({','.join('?' * len(chunk))})", chunk
+                ))
+            self._delete_keys(list(keys))
+        return len(keys)
+
+    def clear(self):
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.execute("DELETE FROM paths")
+            self.conn.execute("DELETE FROM path_members")
+
+class PathCache:
+    """TTL + LRU cache in front of find_path, invalidated by ingestion.
+
+    Each entry is indexed by every player on its path (and the player it was
+    looked up for), so a write touching any of them drops the entry.
+    """
+
+    def __init__(self, store, ttl_seconds: float):
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _key(username: str, target: str) -> str:
+        # Magnus paths keep the bare username key they had before other targets
+        return username if target == MAGNUS else f"{username}>{target}"
+
+    def get(self, username: str, target: str = MAGNUS) -> Optional[Dict]:
+        value = self.store.get(self._key(username, target))
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        CACHE_LOOKUPS.inc(cache="path", result="miss" if value is None else "hit")
+        return value
+
+    def set(self, username: str, result: Dict, target: str = MAGNUS):
+        players = {username}
+        players.update(node["username"] for node in result.get("path") or [])
+        self.store.set(self._key(username, target), result, players, self.ttl_seconds)
+
+    def invalidate_players(self, usernames: Iterable[str]) -> int:
+        dropped = self.store.invalidate(usernames)
+        self.invalidations += dropped
+        return dropped
+
+    def clear(self):
+        self.store.clear()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "invalidations": self.invalidations
+        }
+
+def create_path_cache() -> Optional[PathCache]:
+    if not settings.path_cache_enabled:
+        return None
+    if settings.path_cache_sqlite_path:
+        store = SQLiteStore(settings.path_cache_sqlite_path, settings.path_cache_max_entries)
+    else:
+        logger.warning("Path cache is per-process (PATH_CACHE_SQLITE_PATH is empty): ingestion by the "
+                       f"scheduler will not invalidate it, so paths may be up to "
+                       f"{settings.path_cache_ttl_seconds}s stale")
+        store = MemoryStore(settings.path_cache_max_entries)
+    return PathCache(store, settings.path_cache_ttl_seconds)
+
+path_cache = create_path_cache()
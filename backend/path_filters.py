@@ -0,0 +1,114 @@
+from datetime import date, datetime, timezone
+from typing import Dict, Iterable, Optional, Tuple
+
+TIME_CLASSES = ("bullet", "blitz", "rapid", "daily")
+
+# A PLAYED edge lists the kinds of games its pair played as "YYYY/MM|time class|rated"
+# (or "casual") tokens, one per distinct combination. The engine packs each token
+# into an int: month index * 16 + time class index * 2 + rated.
+FIRST_YEAR = 2000
+
+def kind_token(end_time: int, time_class: str, rated: bool) -> str:
+    month = datetime.fromtimestamp(end_time, timezone.utc).strftime("%Y/%m")
+    return f"{month}|{time_class or ''}|{'rated' if rated else 'casual'}"
+
+def _class_index(time_class: str) -> int:
+    return TIME_CLASSES.index(time_class) if time_class in TIME_CLASSES else len(TIME_CLASSES)
+
+def _month_index(month: str) -> int:
+    year, number = month.split("/")
+    return (int(year) - FIRST_YEAR) * 12 + int(number) - 1
+
+def encode_kind(token: str) -> int:
+    month, time_class, rated = token.split("|")
+    return _month_index(month) * 16 + _class_index(time_class) * 2 + (rated == "rated")
+
+def decode_kind(code: int) -> Tuple[str, str, bool]:
+    month, rest = divmod(code, 16)
+    year, number = divmod(month, 12)
+    class_index = rest >> 1
+    time_class = TIME_CLASSES[class_index] if class_index < len(TIME_CLASSES) else ""
+    return f"{FIRST_YEAR + year}/{number + 1:02d}", time_class, bool(rest & 1)
+
+class PathFilter:
+    """Which games may link two players on a filtered path.
+
+    A hop qualifies when its pair played at least one game of an allowed time
+    class and rated flag in a month within [since, until]; None means any.
+    """
+
+    def __init__(self, time_classes: Optional[Iterable[str]] = None, rated: Optional[bool] = None,
+                 since: Optional[date] = None, until: Optional[date] = None):
+        self.time_classes = tuple(sorted(set(time_classes))) if time_classes else None
+        if self.time_classes:
+            unknown = [c for c in self.time_classes if c not in TIME_CLASSES]
+            if unknown:
+                raise ValueError(f"Unknown time class: {', '.join(unknown)}")
+        self.rated = rated
+        self.since = since.strftime("%Y/%m") if since else None
+        self.until = until.strftime("%Y/%m") if until else None
+        if self.since and self.until and self.since > self.until:
+            raise ValueError("since is after until")
+
+    def __bool__(self):
+        return any(value is not None for value in (self.time_classes, self.rated, self.since, self.until))
+
+    def key(self) -> Tuple:
+        return (self.time_classes, self.rated, self.since, self.until)
+
+    def kind_mask(self) -> int:
+        """Bit (time class index * 2 + rated) set for every allowed combination"""
+        mask = 0
+        for class_index in range(len(TIME_CLASSES) + 1):
+            if self.time_classes and (class_index == len(TIME_CLASSES)
+                                      or TIME_CLASSES[class_index] not in self.time_classes):
+                continue
+            for rated in (0, 1):
+                if self.rated is None or self.rated == bool(rated):
+                    mask |= 1 << (class_index * 2 + rated)
+        return mask
+
+    def month_range(self) -> Tuple[int, int]:
+        return (_month_index(self.since) if self.since else -1,
+                _month_index(self.until) if self.until else 1 << 30)
+
+    def matches(self, kind: Tuple[str, str, bool]) -> bool:
+        month, time_class, rated = kind
+        return ((self.time_classes is None or time_class in self.time_classes)
+                and (self.rated is None or rated == self.rated)
+                and (self.since is None or month >= self.since)
+                and (self.until is None or month <= self.until))
+
+    def describe(self, kinds: Iterable[Tuple[str, str, bool]]) -> Optional[Dict]:
+        """What a hop's qualifying games have in common: time classes, rated flags and month span"""
+        matched = [kind for kind in kinds if self.matches(kind)]
+        if not matched:
+            return None
+        months = sorted(month for month, _, _ in matched)
+        return {
+            "time_classes": sorted({time_class for _, time_class, _ in matched if time_class}),
+            "rated": sorted({rated for _, _, rated in matched}),
+            "months": [months[0], months[-1]]
+        }
+
+    def cypher_params(self) -> Dict:
+        """Parameters for CYPHER_PREDICATE"""
+        return {
+            "classes": list(self.time_classes) if self.time_classes else None,
+            "rated": None if self.rated is None else ("rated" if self.rated else "casual"),
+            "since": self.since,
+            "until": self.until
+        }
+
+def parse_kind(token: str) -> Tuple[str, str, bool]:
+    month, time_class, rated = token.split("|")
+    return month, time_class, rated == "rated"
+
+# True for a relationship r with a game allowed by cypher_params()
+CYPHER_PREDICATE = """
+any(k IN coalesce(r.kinds, []) WHERE
+    ($since IS NULL OR substring(k, 0, 7) >= $since)
+    AND ($until IS NULL OR substring(k, 0, 7) <= $until)
+    AND ($classes IS NULL OR split(k, '|')[1] IN $classes)
+    AND ($rated IS NULL OR split(k, '|')[2] = $rated))
+"""
@@ -0,0 +1,134 @@
+import os
+import sqlite3
+import time
+from typing import Dict, Iterable, Optional, Set, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ProgressJournal:
+    """Persistent record of a historical import, so a crashed run can resume.
+
+    Stores the discovered frontier of every level (and which players of the
+    previous level were already expanded), the players fully ingested, and
+    per player the last archive whose games were written. Every update is
+    committed immediately.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript("""
+        CREATE TABLE IF NOT EXISTS run (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            start_username TEXT NOT NULL,
+            started_at REAL NOT NULL,
+            finished_at REAL
+        );
+        CREATE TABLE IF NOT EXISTS frontier (
+            level INTEGER NOT NULL,
+            username TEXT NOT NULL,
+            PRIMARY KEY (level, username)
+        );
+        CREATE TABLE IF NOT EXISTS expanded (
+            level INTEGER NOT NULL,
+            username TEXT NOT NULL,
+            PRIMARY KEY (level, username)
+        );
+        CREATE TABLE IF NOT EXISTS levels_done (
+            level INTEGER PRIMARY KEY
+        );
+        CREATE TABLE IF NOT EXISTS ingested (
+            username TEXT PRIMARY KEY,
+            finished_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS archives (
+            username TEXT PRIMARY KEY,
+            last_archive TEXT NOT NULL,
+            games INTEGER NOT NULL
+        );
+        """)
+        self.conn.commit()
+
+    def start(self, start_username: str, resume: bool) -> bool:
+        """Begin a run; returns True when an unfinished run for start_username is resumed"""
+        row = self.conn.execute("SELECT start_username, finished_at FROM run WHERE id = 1").fetchone()
+        if resume and row is not None and row[0] == start_username and row[1] is None:
+            logger.info(f"Resuming historical import from {start_username}: "
+                        f"{self.count('levels_done')} levels discovered, {self.count('ingested')} players ingested")
+            return True
+
+        with self.conn:
+            for table in ("run", "frontier", "expanded", "levels_done", "ingested", "archives"):
+                self.conn.execute(f"DELETE FROM {table}")
+            self.conn.execute("INSERT INTO run (id, start_username, started_at) VALUES (1, ?, ?)",
+                              (start_username, time.time()))
+        return False
+
+    def finish(self):
+        with self.conn:
+            self.conn.execute("UPDATE run SET finished_at = ? WHERE id = 1", (time.time(),))
+
+    def count(self, table: str) -> int:
+        return self.conn.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+
+    # Discovery
+
+    def discovered(self) -> Dict[int, Set[str]]:
+        levels: Dict[int, Set[str]] = {}
+        for level, username in self.conn.execute("SELECT level, username FROM frontier"):
+            levels.setdefault(level, set()).add(username)
+        return levels
+
+    def completed_levels(self) -> Set[int]:
+        return {row[0] for row in self.conn.execute("SELECT level FROM levels_done")}
+
+    def expanded(self, level: int) -> Set[str]:
+        return {row[0] for row in self.conn.execute("SELECT username FROM expanded WHERE level = ?", (level,))}
+
+    def add_players(self, level: int, usernames: Iterable[str]):
+        with self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO frontier (level, username) VALUES (?, ?)",
+                                  [(level, username) for username in usernames])
+
+    def mark_expanded(self, level: int, username: str, found: Iterable[str]):
+        """Record that username (at level) was fully expanded, with the new players it yielded"""
+        with self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO frontier (level, username) VALUES (?, ?)",
+                                  [(level + 1, opponent) for opponent in found])
+            self.conn.execute("INSERT OR IGNORE INTO expanded (level, username) VALUES (?, ?)", (level, username))
+
+    def complete_level(self, level: int, usernames: Iterable[str]):
+        """Freeze a level's final membership (after any limit was applied)"""
+        with self.conn:
+            self.conn.execute("DELETE FROM frontier WHERE level = ?", (level,))
+            self.conn.executemany("INSERT INTO frontier (level, username) VALUES (?, ?)",
+                                  [(level, username) for username in usernames])
+            self.conn.execute("INSERT OR IGNORE INTO levels_done (level) VALUES (?)", (level,))
+
+    # Ingestion
+
+    def ingested(self) -> Set[str]:
+        return {row[0] for row in self.conn.execute("SELECT username FROM ingested")}
+
+    def mark_ingested(self, username: str):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO ingested (username, finished_at) VALUES (?, ?)",
+                              (username, time.time()))
+            self.conn.execute("DELETE FROM archives WHERE username = ?", (username,))
+
+    def archive_checkpoint(self, username: str) -> Tuple[Optional[str], int]:
+        """Last archive written for username and the games counted up to it"""
+        row = self.conn.execute("SELECT last_archive, games FROM archives WHERE username = ?",
+                                (username,)).fetchone()
+        return (row[0], row[1]) if row else (None, 0)
+
+    def set_archive_checkpoint(self, username: str, archive_url: str, games: int):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO archives (username, last_archive, games) VALUES (?, ?, ?)",
+                              (username, archive_url, games))
+
+    def close(self):
+        self.conn.close()
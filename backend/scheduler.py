@@ -3,7 +3,10 @@ import logging
 from datetime import datetime, timedelta
 from enhanced_ingest import EnhancedIngestion
 from schema import SchemaManager
-from ingest import driver
+from ingest import driver, settings as ingest_settings
+from graph_engine import export_snapshot
+from chess_api import close_client
+import metrics
 
 # Configure logging
 logging.basicConfig(
@@ -70,25 +73,42 @@ async def main():
     scheduler = ChessDataScheduler()
     
     if len(sys.argv) < 2:
-        print("Usage: python scheduler.py [historical|monthly|weekly|monitor|cleanup]")
+        print("Usage: python scheduler.py [historical [--resume]|monthly|weekly|monitor [--reconcile]|cleanup [--dry-run]|tree|migrate-edges|snapshot [path]]")
         return
     
     command = sys.argv[1]
     
-    if command == "historical":
-        await scheduler.ingestion.ingest_historical_data()
-    elif command == "monthly":
-        await scheduler.run_monthly_update()
-    elif command == "weekly":
-        await scheduler.run_weekly_check()
-    elif command == "monitor":
-        usage = scheduler.ingestion.monitor_storage_usage()
-        print(f"Storage Usage: {usage}")
-    elif command == "cleanup":
-        result = scheduler.ingestion.cleanup_old_data()
-        print(f"Cleanup result: {result}")
-    else:
-        print(f"Unknown command: {command}")
+    try:
+        with metrics.span(f"scheduler {command}"):
+            if command == "historical":
+                await scheduler.ingestion.ingest_historical_data(resume="--resume" in sys.argv[2:])
+            elif command == "monthly":
+                await scheduler.run_monthly_update()
+            elif command == "weekly":
+                await scheduler.run_weekly_check()
+            elif command == "monitor":
+                usage = scheduler.ingestion.monitor_storage_usage(reconcile="--reconcile" in sys.argv[2:])
+                print(f"Storage Usage: {usage}")
+            elif command == "tree":
+                result = scheduler.ingestion.rebuild_distance_tree()
+                print(f"Distance tree: {result if result is not None else 'disabled (DISTANCE_TREE_ENABLED=false)'}")
+            elif command == "snapshot":
+                path = sys.argv[2] if len(sys.argv) > 2 else ingest_settings.graph_snapshot_path
+                result = export_snapshot(driver, path)
+                print(f"Snapshot: {result}")
+            elif command == "migrate-edges":
+                result = scheduler.schema_manager.migrate_played_edges()
+                print(f"Migration result: {result}")
+            elif command == "cleanup":
+                result = scheduler.ingestion.cleanup_old_data(dry_run="--dry-run" in sys.argv[2:])
+                print(f"Cleanup result: {result}")
+            else:
+                print(f"Unknown command: {command}")
+    finally:
+        await close_client()
+        # Kept with the logs (and uploaded by the GitHub Actions workflow)
+        metrics.dump("logs/metrics.prom")
+        logger.info("Metrics written to logs/metrics.prom")
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -1,13 +1,138 @@
-from neo4j import GraphDatabase
-from datetime import datetime, timedelta
+from datetime import datetime, timezone
 from typing import Dict, List, Optional
 import logging
+from graph_stats import GraphStats
+from path_filters import TIME_CLASSES, kind_token
 
 logger = logging.getLogger(__name__)
 
+# Pairs still linked by pre-aggregation PLAYED edges (no games count), for a page
+# of players in username order after $after; players without any come back with
+# a null b, so the caller can move past the page
+LEGACY_PAIRS_QUERY = """
+MATCH (a:Player)
+WHERE a.username > $after
+WITH a ORDER BY a.username LIMIT $limit
+OPTIONAL MATCH (a)-[r:PLAYED]-(b:Player)
+WHERE r.games IS NULL AND a.username < b.username
+WITH a, b, collect(r {.url, .date, .result, .time_control, .rated, white: startNode(r).username}) AS games
+RETURN a.username AS a, b.username AS b, games
+"""
+
+# Aggregated edges that already exist for the pairs about to be migrated
+AGGREGATED_EDGES_QUERY = """
+UNWIND $pairs AS pair
+MATCH (a:Player {username: pair.a})-[r:PLAYED]->(b:Player {username: pair.b})
+WHERE r.games IS NOT NULL
+RETURN a.username AS a, b.username AS b, properties(r) AS props
+"""
+
+MIGRATE_EDGES_QUERY = """
+UNWIND $rows AS row
+MATCH (a:Player {username: row.a}), (b:Player {username: row.b})
+OPTIONAL MATCH (a)-[old:PLAYED]-(b)
+WHERE old.games IS NULL
+DELETE old
+WITH DISTINCT a, b, row
+MERGE (a)-[r:PLAYED]->(b)
+SET r = row.props
+"""
+
+def _time_class(time_control: str) -> str:
+    """chess.com's time class for a time control such as 180+2 (seconds+increment) or 1/86400 (daily)"""
+    if not time_control:
+        return ""
+    if "/" in time_control:
+        return "daily"
+    base, _, increment = time_control.partition("+")
+    try:
+        estimate = int(base) + 40 * int(increment or 0)
+    except ValueError:
+        return ""
+    if estimate < 180:
+        return "bullet"
+    return "blitz" if estimate < 600 else "rapid"
+
+def _end_time(date) -> Optional[int]:
+    """Epoch seconds of a legacy edge date (an end_time integer or a Neo4j temporal)"""
+    if isinstance(date, int):
+        return date or None
+    if hasattr(date, "to_native"):
+        return int(date.to_native().timestamp())
+    return None
+
+def _month(end_time: int) -> str:
+    return datetime.fromtimestamp(end_time, timezone.utc).strftime("%Y/%m")
+
+def _aggregate_legacy_games(games: List[Dict], existing: Optional[Dict] = None) -> Dict:
+    """Properties of the aggregated edge replacing a pair's legacy edges.
+
+    When the pair already has an aggregated edge (ingest ran before the
+    migration), the legacy games are folded into its properties. As in
+    writer.EDGE_QUERY, a game in a month the edge has recorded only counts if
+    it ended after the latest game counted, and a URL already in legacy_urls
+    never counts twice.
+    """
+    existing = dict(existing or {})
+    months = set(existing.get("months") or ())
+    last_end_time = existing.get("last_end_time") or 0
+    counted_urls = set(existing.get("legacy_urls") or ())
+
+    by_url = {}
+    for game in games:
+        end_time = _end_time(game.get("date"))
+        key = game.get("url") or f"{end_time}:{game.get('white')}"
+        # Symmetric legacy pairs store the same game twice; keep the copy with a result
+        if key not in by_url or game.get("result"):
+            by_url[key] = dict(game, end_time=end_time)
+    games = sorted(
+        (game for game in by_url.values()
+         if game.get("url") not in counted_urls
+         and not (game["end_time"] and _month(game["end_time"]) in months and game["end_time"] <= last_end_time)),
+        key=lambda game: game["end_time"] or 0
+    )
+    if not games:
+        return existing
+    first, latest = games[0], games[-1]
+
+    props = existing
+    props["games"] = (existing.get("games") or 0) + len(games)
+    props["months"] = existing.get("months") or []
+    props["legacy_urls"] = list(existing.get("legacy_urls") or []) + [game["url"] for game in games if game.get("url")]
+    if existing.get("first_end_time") is None or (first["end_time"] or 0) < existing["first_end_time"]:
+        props.update(
+            first_url=first.get("url"),
+            first_date=datetime.fromtimestamp(first["end_time"]) if first["end_time"] else None,
+            first_end_time=first["end_time"]
+        )
+    if existing.get("last_end_time") is None or (latest["end_time"] or 0) >= existing["last_end_time"]:
+        props.update(
+            url=latest.get("url"),
+            date=datetime.fromtimestamp(latest["end_time"]) if latest["end_time"] else None,
+            last_end_time=latest["end_time"],
+            white=latest.get("white") if latest.get("result") else None,
+            result=latest.get("result"),
+            time_control=latest.get("time_control"),
+            rated=latest.get("rated")
+        )
+    kinds = list(existing.get("kinds") or [])
+    for kind in sorted({
+        kind_token(game["end_time"], _time_class(game.get("time_control") or ""), bool(game.get("rated")))
+        for game in games if game["end_time"]
+    }):
+        if kind not in kinds:
+            kinds.append(kind)
+    props["kinds"] = kinds
+    for time_class in TIME_CLASSES:
+        props[f"{time_class}_games"] = (existing.get(f"{time_class}_games") or 0) + sum(
+            1 for game in games if _time_class(game.get("time_control") or "") == time_class
+        )
+    return props
+
 class SchemaManager:
     def __init__(self, driver):
         self.driver = driver
+        self.graph_stats = GraphStats(driver)
     
     def create_constraints_and_indexes(self):
         """Create database constraints and indexes for optimal performance"""
@@ -34,49 +159,71 @@ class SchemaManager:
             FOR (p:Player) ON (p.last_updated)
             """)
     
-    def get_database_stats(self) -> Dict:
-        """Get current database usage statistics"""
-        with self.driver.session() as session:
-            result = session.run("""
-            MATCH (p:Player)
-            RETURN count(p) as player_count,
-                   sum(p.games_played) as total_games_count
-            """)
-            
-            player_stats = result.single()
-            
-            result = session.run("""
-            MATCH ()-[r:PLAYED]-()
-            RETURN count(DISTINCT r) as relationship_count
-            """)
-            
-            rel_stats = result.single()
-            
-            return {
-                "players": player_stats["player_count"],
-                "relationships": rel_stats["relationship_count"],
-                "total_games": player_stats["total_games_count"] or 0
+    def get_database_stats(self, reconcile: bool = False) -> Dict:
+        """Get current database usage statistics from the count store and GraphStats counters.
+
+        reconcile=True recounts every player and edge first and corrects the
+        counters, for when they may have drifted (e.g. after manual edits).
+        """
+        stats = self.graph_stats.reconcile() if reconcile else self.graph_stats.read()
+        return {
+            "players": stats["players"],
+            "relationships": stats["relationships"],
+            "total_games": stats["total_games"] or 0
+        }
+    
+    def migrate_played_edges(self, batch_size: int = 500) -> Dict:
+        """Replace pre-aggregation PLAYED edges with one aggregated edge per player pair.
+
+        Legacy edges only kept the latest game per colour order (or per pair),
+        so the migrated counts cover just those games. Their URLs are kept in
+        legacy_urls and the months are left unrecorded, so re-ingesting the
+        pair later counts every game exactly once. Players are paged in
+        username order, so each batch reads only its own players' edges.
+        """
+        def migrate(tx, records):
+            existing = {
+                (record["a"], record["b"]): record["props"]
+                for record in tx.run(AGGREGATED_EDGES_QUERY,
+                                     pairs=[{"a": record["a"], "b": record["b"]} for record in records])
             }
+            rows = [
+                {"a": record["a"], "b": record["b"],
+                 "props": _aggregate_legacy_games(record["games"], existing.get((record["a"], record["b"])))}
+                for record in records
+            ]
+            tx.run(MIGRATE_EDGES_QUERY, rows=rows).consume()
+
+        pairs = 0
+        after = ""
+        with self.driver.session() as session:
+            while True:
+                records = list(session.run(LEGACY_PAIRS_QUERY, after=after, limit=batch_size))
+                if not records:
+                    break
+                after = max(record["a"] for record in records)
+                legacy = [record for record in records if record["b"] is not None]
+                if not legacy:
+                    continue
+                session.execute_write(migrate, legacy)
+                pairs += len(legacy)
+                logger.info(f"Migrated {pairs} player pairs to aggregated PLAYED edges (players up to {after})")
+        
+        # Game counts changed wholesale, so recount rather than patch the counters
+        if pairs:
+            self.graph_stats.reconcile()
+        
+        return {"pairs": pairs}
     
     def get_storage_breakdown(self) -> Dict:
-        """Get detailed storage breakdown by player level and activity"""
-        with self.driver.session() as session:
-            result = session.run("""
-            MATCH (p:Player)
-            RETURN p.distance_from_magnus as level,
-                   count(p) as player_count,
-                   sum(p.games_played) as total_games,
-                   avg(p.games_played) as avg_games
-            ORDER BY level
-            """)
-            
-            breakdown = {}
-            for record in result:
-                level = record["level"] or "unknown"
-                breakdown[level] = {
-                    "players": record["player_count"],
-                    "total_games": record["total_games"] or 0,
-                    "avg_games": round(record["avg_games"] or 0, 1)
-                }
-            
-            return breakdown
+        """Get storage breakdown by distance from Magnus, from the per-level counters"""
+        breakdown = {}
+        for level, counts in sorted(self.graph_stats.read()["levels"].items(),
+                                    key=lambda item: (item[0] is None, item[0])):
+            breakdown["unknown" if level is None else level] = {
+                "players": counts["players"],
+                "total_games": counts["games"],
+                "avg_games": round(counts["games"] / counts["players"], 1) if counts["players"] else 0
+            }
+        
+        return breakdown
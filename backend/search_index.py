@@ -0,0 +1,142 @@
+import heapq
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from typing import List, Optional, Sequence
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Players in a leaf block are ranked by scanning them; larger ranges go through the tree
+BLOCK = 64
+
+# Smaller is better: distance from Magnus first (unknown last), then more games
+UNREACHED = 1000
+GAMES_CAP = 2 ** 31 - 1
+
+def rank_key(distance: Optional[int], games: Optional[int]) -> int:
+    return (UNREACHED if distance is None else distance) * 2 ** 31 + GAMES_CAP - min(games or 0, GAMES_CAP)
+
+class SearchIndex:
+    """Typeahead over every username, ranked without scanning the prefix's matches.
+
+    Usernames are held sorted, so a prefix is a contiguous range found by
+    bisection. A segment tree over blocks of BLOCK players keeps, per node,
+    the top players of its range by rank_key (ties in username order). A
+    query merges the O(log n) nodes covering the range plus the partial
+    blocks at its ends, so it reads at most 2 * BLOCK + 2 * top * log2(n / BLOCK)
+    entries however many players share the prefix.
+    """
+
+    def __init__(self, usernames: Sequence[str], keys: Sequence[int], top: int = 10):
+        order = sorted(range(len(usernames)), key=usernames.__getitem__)
+        self.usernames = [usernames[i] for i in order]
+        self.keys = array("q", (keys[i] for i in order))
+        self.top = top
+        self.loaded_at = time.time()
+
+        blocks = (len(self.usernames) + BLOCK - 1) // BLOCK
+        self.size = 1
+        while self.size < blocks:
+            self.size *= 2
+        self.tree: List[tuple] = [()] * (2 * self.size)
+        for block in range(blocks):
+            self.tree[self.size + block] = self._best(range(block * BLOCK, min(len(self.usernames), (block + 1) * BLOCK)))
+        for node in range(self.size - 1, 0, -1):
+            self.tree[node] = self._best(self.tree[2 * node] + self.tree[2 * node + 1])
+
+    @classmethod
+    def load(cls, driver, top: int = 10) -> "SearchIndex":
+        start = time.perf_counter()
+        usernames, keys = [], array("q")
+        with driver.session() as session:
+            for record in session.run("""
+            MATCH (p:Player)
+            RETURN p.username AS username, p.distance_from_magnus AS distance, p.games_played AS games
+            """):
+                usernames.append(record["username"])
+                keys.append(rank_key(record["distance"], record["games"]))
+        index = cls(usernames, keys, top)
+        logger.info(f"Search index loaded {len(usernames)} players in {time.perf_counter() - start:.2f}s")
+        return index
+
+    def __len__(self):
+        return len(self.usernames)
+
+    def _best(self, candidates) -> tuple:
+        keys = self.keys
+        return tuple(heapq.nsmallest(self.top, candidates, key=lambda i: (keys[i], i)))
+
+    def search(self, prefix: str, limit: int = 10) -> List[str]:
+        """Best-ranked usernames starting with prefix, at most min(limit, top)"""
+        lo = bisect_left(self.usernames, prefix)
+        hi = bisect_left(self.usernames, prefix + "\U0010ffff", lo)
+        if lo >= hi:
+            return []
+
+        first, last = lo // BLOCK, (hi - 1) // BLOCK
+        if first == last:
+            candidates = list(range(lo, hi))
+        else:
+            # Partial blocks at either end are scanned; whole blocks come from the tree
+            candidates = list(range(lo, (first + 1) * BLOCK)) + list(range(last * BLOCK, hi))
+            left, right = self.size + first + 1, self.size + last
+            while left < right:
+                if left & 1:
+                    candidates.extend(self.tree[left])
+                    left += 1
+                if right & 1:
+                    right -= 1
+                    candidates.extend(self.tree[right])
+                left //= 2
+                right //= 2
+
+        keys = self.keys
+        best = heapq.nsmallest(min(limit, self.top), candidates, key=lambda i: (keys[i], i))
+        return [self.usernames[i] for i in best]
+
+class SearchIndexes:
+    """The shared SearchIndex, built on a background thread so no request waits for it.
+
+    current() returns None until the first build finishes (callers fall back
+    to a bounded Cypher query) and keeps returning the previous index while a
+    rebuild runs. Indexes are rebuilt after max_age_seconds, or once
+    min_rebuild_seconds have passed since expire() reported new players.
+    """
+
+    def __init__(self, max_age_seconds: float, min_rebuild_seconds: float):
+        self.max_age_seconds = max_age_seconds
+        self.min_rebuild_seconds = min_rebuild_seconds
+        self.index: Optional[SearchIndex] = None
+        self.expired = False
+        self.building = False
+        self.failed_at = 0.0
+        self.lock = threading.Lock()
+
+    def expire(self):
+        self.expired = True
+
+    def current(self, driver) -> Optional[SearchIndex]:
+        index = self.index
+        if index is not None:
+            age = time.time() - index.loaded_at
+            if age <= self.max_age_seconds and not (self.expired and age > self.min_rebuild_seconds):
+                return index
+        with self.lock:
+            if self.building or time.time() - self.failed_at < self.min_rebuild_seconds:
+                return index
+            self.building = True
+            self.expired = False
+        threading.Thread(target=self._build, args=(driver,), daemon=True).start()
+        return index
+
+    def _build(self, driver):
+        try:
+            self.index = SearchIndex.load(driver)
+        except Exception as e:
+            self.failed_at = time.time()
+            logger.warning(f"Search index build failed: {e}")
+        finally:
+            with self.lock:
+                self.building = False
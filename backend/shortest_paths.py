@@ -0,0 +1,179 @@
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from graph_engine import FilteredEdges, GraphEngine
+
+RANKS = ("titled", "recent")
+
+def score_key(titled: int, end_times: Sequence[Optional[int]], rank: str) -> Tuple:
+    """Ordering for rank: titled intermediaries then recency of the hops' latest games, or the reverse"""
+    recency = sum(end_time or 0 for end_time in end_times)
+    return (titled, recency) if rank == "titled" else (recency, titled)
+
+def describe_score(titled: int, end_times: Sequence[Optional[int]]) -> Dict:
+    return {
+        "titled_intermediaries": titled,
+        "mean_end_time": round(sum(end_time or 0 for end_time in end_times) / len(end_times)) if end_times else None
+    }
+
+class ShortestPaths:
+    """Every shortest path between two players, from one bidirectional BFS.
+
+    Both sides expand whole layers, counting how many shortest paths reach
+    each player from their end (the count for a player is the sum over its
+    predecessors in the previous layer). When a new layer touches the other
+    side, the number of shortest paths is the sum, over the meeting players,
+    of the product of their two counts. Paths are then enumerated lazily by
+    walking predecessors outward from the meeting players, so listing the
+    first k costs O(k * depth) however many paths exist. The best path under
+    a score is found by dynamic programming over the same layered DAG. With
+    edges (a FilteredEdges), only the edges it admits are read.
+    """
+
+    def __init__(self, engine: GraphEngine, source: int, target: int, max_depth: int = 6,
+                 edges: Optional[FilteredEdges] = None):
+        self.engine = engine
+        self.edges = edges if edges is not None else engine
+        self.source = source
+        self.target = target
+        self.count = 0
+        self.length: Optional[int] = None
+        self.meeting: List[int] = []
+        # Per side: node -> distance from that side's end, and number of shortest paths to it
+        self.distance = ({source: 0}, {target: 0})
+        self.paths_to = ({source: 1}, {target: 1})
+        if source == target:
+            self.count, self.length, self.meeting = 1, 0, [source]
+            return
+        self._search(max_depth)
+
+    def _search(self, max_depth: int):
+        adjacent, degree = self.edges.adjacent, self.edges.degree
+        frontiers = ([self.source], [self.target])
+        depths = [0, 0]
+        while frontiers[0] and frontiers[1] and depths[0] + depths[1] < max_depth:
+            # Expand the side whose frontier has fewer edges to scan
+            costs = [sum(degree(n) for n in frontier) for frontier in frontiers]
+            side = 0 if costs[0] <= costs[1] else 1
+            distance, paths_to = self.distance[side], self.paths_to[side]
+            depths[side] += 1
+            layer = []
+            for node in frontiers[side]:
+                for neighbour, _ in adjacent(node):
+                    seen = distance.get(neighbour)
+                    if seen is None:
+                        distance[neighbour] = depths[side]
+                        paths_to[neighbour] = 0
+                        layer.append(neighbour)
+                        seen = depths[side]
+                    if seen == depths[side]:
+                        paths_to[neighbour] += paths_to[node]
+            frontiers = (layer, frontiers[1]) if side == 0 else (frontiers[0], layer)
+
+            other = self.distance[1 - side]
+            touching = [node for node in layer if node in other]
+            if touching:
+                closest = min(other[node] for node in touching)
+                self.meeting = sorted(node for node in touching if other[node] == closest)
+                self.length = depths[side] + closest
+                other_paths = self.paths_to[1 - side]
+                self.count = sum(paths_to[node] * other_paths[node] for node in self.meeting)
+                return
+
+    def _predecessors(self, side: int, node: int) -> List[Tuple[int, int]]:
+        """(neighbour one step closer to this side's end, edge) pairs, in adjacency order"""
+        distance = self.distance[side]
+        closer = distance[node] - 1
+        return [(neighbour, edge) for neighbour, edge in self.edges.adjacent(node)
+                if distance.get(neighbour) == closer]
+
+    def _walks(self, side: int, node: int) -> Iterator[List[Tuple[int, int]]]:
+        """Walks from node to this side's end, as [(node, edge to the next node)]"""
+        if self.distance[side][node] == 0:
+            yield [(node, -1)]
+            return
+        for previous, edge in self._predecessors(side, node):
+            for walk in self._walks(side, previous):
+                yield [(node, edge)] + walk
+
+    def paths(self, limit: int) -> List[List[Tuple[int, int]]]:
+        """Up to limit shortest paths as [(node, edge into node)] from source to target"""
+        found = []
+        for middle in self.meeting:
+            for head in self._walks(0, middle):
+                for tail in self._walks(1, middle):
+                    found.append(self._join(head, tail))
+                    if len(found) >= limit:
+                        return found
+        return found
+
+    @staticmethod
+    def _join(head: List[Tuple[int, int]], tail: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        # head runs middle -> source, each node with its edge towards the source: reversed,
+        # that is each node with the edge into it
+        hops = list(reversed(head))
+        # tail runs middle -> target with the edge to the next node already in travel order
+        for (_, edge), (node, _) in zip(tail, tail[1:]):
+            hops.append((node, edge))
+        return hops
+
+    def best(self, rank: str) -> Optional[Tuple[List[Tuple[int, int]], Dict]]:
+        """The shortest path with the highest score under rank, and that score"""
+        if not self.meeting:
+            return None
+        titles, games = self.engine.titles, self.engine.games
+        memo = ({}, {})
+
+        def best_walk(side: int, node: int):
+            """(titled count, end times, walk) maximising the score from node to this side's end"""
+            if node in memo[side]:
+                return memo[side][node]
+            if self.distance[side][node] == 0:
+                result = (0, [], [(node, -1)])
+            else:
+                result = None
+                for previous, edge in self._predecessors(side, node):
+                    titled, end_times, walk = best_walk(side, previous)
+                    # Ends of the path are not intermediaries
+                    titled += 1 if titles[previous] and self.distance[side][previous] else 0
+                    end_times = end_times + [games[edge]["end_time"]]
+                    if result is None or score_key(titled, end_times, rank) > score_key(result[0], result[1], rank):
+                        result = (titled, end_times, [(node, edge)] + walk)
+            memo[side][node] = result
+            return result
+
+        best = None
+        for middle in self.meeting:
+            head_titled, head_times, head = best_walk(0, middle)
+            tail_titled, tail_times, tail = best_walk(1, middle)
+            titled = head_titled + tail_titled
+            if titles[middle] and middle not in (self.source, self.target):
+                titled += 1
+            end_times = head_times + tail_times
+            if best is None or score_key(titled, end_times, rank) > score_key(best[0], best[1], rank):
+                best = (titled, end_times, self._join(head, tail))
+        return best[2], describe_score(best[0], best[1])
+
+def find_all_paths(engine: GraphEngine, username: str, target: str, k: int, rank: Optional[str] = None,
+                   path_filter=None, max_depth: int = 6) -> Optional[Dict]:
+    """graph.find_all_paths payload from the engine, or None when it cannot answer"""
+    source_id = engine.ids.get(username)
+    target_id = engine.ids.get(target)
+    if source_id is None or target_id is None:
+        return None
+    if path_filter and engine.kind_offsets is None:
+        return None
+
+    edges = engine.filtered_edges(path_filter) if path_filter else None
+    search = ShortestPaths(engine, source_id, target_id, max_depth, edges)
+    if not search.count:
+        return None
+
+    result = {
+        "count": search.count,
+        "count_capped": False,
+        "length": search.length,
+        "paths": [engine.path_payload(hops, path_filter) for hops in search.paths(k)]
+    }
+    if rank:
+        hops, score = search.best(rank)
+        result["best"] = {**engine.path_payload(hops, path_filter), "score": score}
+    return result
@@ -0,0 +1,230 @@
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from datetime import datetime
+from itertools import chain
+from typing import Dict, List, Optional, Sequence, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"DOMCSNAP"
+VERSION = 1
+
+# magic, version, players, pairs, sections, created_at, data refreshed at (epoch seconds, 0 if unknown)
+HEADER = struct.Struct("<8sIIII4xdd")
+# name, offset, length in bytes
+SECTION = struct.Struct("<8sQQ")
+ALIGN = 8
+
+class SnapshotError(Exception):
+    pass
+
+class StringTable:
+    """Strings stored as one UTF-8 blob plus uint32 end offsets, decoded on access"""
+
+    def __init__(self, ends, blob):
+        self.ends = ends
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.ends)
+
+    def __getitem__(self, i: int) -> str:
+        if i < 0:
+            i += len(self.ends)
+        start = self.ends[i - 1] if i > 0 else 0
+        return str(self.blob[start:self.ends[i]], "utf-8")
+
+    def __iter__(self):
+        blob, start = self.blob, 0
+        for end in self.ends:
+            yield str(blob[start:end], "utf-8")
+            start = end
+
+    @staticmethod
+    def encode(strings: Sequence[Optional[str]]):
+        ends = array("I")
+        parts = []
+        size = 0
+        for s in strings:
+            data = (s or "").encode("utf-8")
+            parts.append(data)
+            size += len(data)
+            ends.append(size)
+        return ends, b"".join(parts)
+
+class SnapshotGames:
+    """Edge metadata columns presented as the game dicts GraphEngine hands out"""
+
+    def __init__(self, urls: StringTable, end_times, counts):
+        self.urls = urls
+        self.end_times = end_times
+        self.counts = counts
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __getitem__(self, i: int) -> Dict:
+        end_time = self.end_times[i]
+        return {
+            "url": self.urls[i],
+            "date": datetime.fromtimestamp(end_time) if end_time else None,
+            "end_time": end_time or None,
+            "games": self.counts[i]
+        }
+
+def _column(buffer, typecode: str):
+    """Zero-copy typed view of a little-endian column (copied and swapped on big-endian hosts)"""
+    view = memoryview(buffer).cast("B").cast(typecode)
+    if sys.byteorder == "little":
+        return view
+    column = array(typecode, view)
+    column.byteswap()
+    return column
+
+def write_snapshot(path: str, usernames: List[str], avatars: List, titles: List,
+                   offsets, neighbors, edge_ids, games: List[Dict],
+                   refreshed_at: Optional[float] = None, kind_offsets=None, kinds=None,
+                   kind_partitions: Optional[Dict[int, Tuple]] = None) -> int:
+    """Write a CSR graph and its edge metadata as a versioned columnar file; returns its size.
+
+    Every column starts on an 8-byte boundary so a reader can map the file and
+    use the arrays in place. The file is written next to path and renamed
+    over it, so readers never see a partial snapshot.
+    """
+    def int_column(typecode, values):
+        column = array(typecode, values)
+        if sys.byteorder != "little":
+            column.byteswap()
+        return column.tobytes()
+
+    name_ends, name_blob = StringTable.encode(usernames)
+    avatar_ends, avatar_blob = StringTable.encode(avatars)
+    title_ends, title_blob = StringTable.encode(titles)
+    url_ends, url_blob = StringTable.encode([game.get("url") for game in games])
+
+    sections = [
+        (b"names", int_column("I", name_ends)),
+        (b"namebuf", name_blob),
+        (b"avatars", int_column("I", avatar_ends)),
+        (b"avtrbuf", avatar_blob),
+        (b"titles", int_column("I", title_ends)),
+        (b"titlebuf", title_blob),
+        (b"offsets", int_column("i", offsets)),
+        (b"nbrs", int_column("i", neighbors)),
+        (b"edgeids", int_column("i", edge_ids)),
+        (b"urls", int_column("I", url_ends)),
+        (b"urlbuf", url_blob),
+        (b"endtime", int_column("q", [game.get("end_time") or 0 for game in games])),
+        (b"games", int_column("i", [game.get("games") or 1 for game in games])),
+    ]
+    # Optional: readers without these sections just cannot answer filtered queries
+    if kind_offsets is not None:
+        sections.append((b"kindoffs", int_column("i", kind_offsets)))
+        sections.append((b"kinds", int_column("i", kinds)))
+    # Adjacency split by kind (graph_engine.partition_kinds); rebuilt on load when absent.
+    # Slots are concatenated: offsets are relative to each slot's first entry.
+    if kind_partitions is not None:
+        slots = sorted(kind_partitions)
+        parts = [kind_partitions[slot] for slot in slots]
+        bases = [0]
+        for _, part_neighbors, _, _ in parts:
+            bases.append(bases[-1] + len(part_neighbors))
+        sections.append((b"partslot", int_column("i", slots)))
+        sections.append((b"partbase", int_column("q", bases)))
+        for name, typecode, column in ((b"partoffs", "i", 0), (b"partnbrs", "i", 1),
+                                       (b"partedge", "i", 2), (b"partyear", "B", 3)):
+            sections.append((name, int_column(typecode, chain.from_iterable(part[column] for part in parts))))
+
+    position = HEADER.size + SECTION.size * len(sections)
+    table = []
+    for name, data in sections:
+        position += -position % ALIGN
+        table.append(SECTION.pack(name, position, len(data)))
+        position += len(data)
+
+    header = HEADER.pack(MAGIC, VERSION, len(usernames), len(games), len(sections),
+                         time.time(), refreshed_at or 0.0)
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(header)
+        f.write(b"".join(table))
+        for name, data in sections:
+            f.write(b"\0" * (-f.tell() % ALIGN))
+            f.write(data)
+        size = f.tell()
+    os.replace(temporary, path)
+    return size
+
+class Snapshot:
+    """Memory-mapped view of a snapshot file; columns are used in place, not parsed"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self.map) < HEADER.size:
+            raise SnapshotError(f"{path} is too short to be a snapshot")
+        magic, version, players, pairs, count, created_at, refreshed_at = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise SnapshotError(f"{path} is not a graph snapshot")
+        if version != VERSION:
+            raise SnapshotError(f"{path} has snapshot version {version}, expected {VERSION}")
+
+        self.players = players
+        self.pairs = pairs
+        self.created_at = created_at
+        self.refreshed_at = refreshed_at or None
+
+        view = memoryview(self.map)
+        self.sections = {}
+        for i in range(count):
+            name, offset, length = SECTION.unpack_from(self.map, HEADER.size + i * SECTION.size)
+            if offset + length > len(self.map):
+                raise SnapshotError(f"{path} is truncated")
+            self.sections[name.rstrip(b"\0").decode()] = view[offset:offset + length]
+
+    def column(self, name: str, typecode: str):
+        return _column(self.sections[name], typecode)
+
+    def kind_partitions(self) -> Optional[Dict[int, Tuple]]:
+        """Per slot, the (offsets, neighbors, edge_ids, buckets) views written by write_snapshot"""
+        if "partslot" not in self.sections:
+            return None
+        bases = self.column("partbase", "q")
+        offsets, neighbors = self.column("partoffs", "i"), self.column("partnbrs", "i")
+        edge_ids, buckets = self.column("partedge", "i"), self.column("partyear", "B")
+        stride = self.players + 1
+        return {
+            slot: (offsets[k * stride:(k + 1) * stride], neighbors[bases[k]:bases[k + 1]],
+                   edge_ids[bases[k]:bases[k + 1]], buckets[bases[k]:bases[k + 1]])
+            for k, slot in enumerate(self.column("partslot", "i"))
+        }
+
+    def strings(self, name: str, blob: str) -> StringTable:
+        return StringTable(self.column(name, "I"), self.sections[blob])
+
+    @property
+    def usernames(self) -> StringTable:
+        return self.strings("names", "namebuf")
+
+    @property
+    def avatars(self) -> StringTable:
+        return self.strings("avatars", "avtrbuf")
+
+    @property
+    def titles(self) -> StringTable:
+        return self.strings("titles", "titlebuf")
+
+    @property
+    def games(self) -> SnapshotGames:
+        return SnapshotGames(self.strings("urls", "urlbuf"), self.column("endtime", "q"), self.column("games", "i"))
@@ -0,0 +1,210 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import logging
+from graph_engine import GraphEngine
+from metrics import CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+BYTES_PER_PLAYER = 12   # player id, parent id and parent edge id, as int32
+
+class TargetTree:
+    """BFS tree rooted at one target player over a GraphEngine, capped at max_players.
+
+    Reached players are kept sorted by id alongside their parent (the
+    neighbour one step closer to the target) and the edge between them, in
+    int32 arrays, so a tree costs BYTES_PER_PLAYER per player it holds. The
+    BFS stops once max_players are reached; a truncated tree still answers
+    exactly for the players it holds but knows nothing about the rest. The
+    BFS itself works in columns indexed by player id (9 bytes per player in
+    the engine) and is compacted once it stops.
+    """
+
+    def __init__(self, engine: GraphEngine, target: int, max_players: int, max_depth: int = 6):
+        start = time.perf_counter()
+        self.target = target
+        offsets, neighbors, edge_ids = engine.offsets, engine.neighbors, engine.edge_ids
+
+        # Build columns indexed by player id, compacted to the reached players below
+        visited = bytearray(len(engine))
+        parent = array("i", [-1]) * len(engine)
+        edge = array("i", [-1]) * len(engine)
+        queue = array("i", [target])   # Reached players in BFS order; each level follows the last
+        visited[target] = 1
+        head = 0
+        depth = 0
+        self.complete = True   # Every player within max_depth of the target is in the tree
+        while head < len(queue) and depth < max_depth and self.complete:
+            depth += 1
+            level_end = len(queue)
+            for node in queue[head:level_end]:
+                for i in range(offsets[node], offsets[node + 1]):
+                    neighbour = neighbors[i]
+                    if visited[neighbour]:
+                        continue
+                    if len(queue) >= max_players:
+                        self.complete = False
+                        break
+                    visited[neighbour] = 1
+                    parent[neighbour] = node
+                    edge[neighbour] = edge_ids[i]
+                    queue.append(neighbour)
+                if not self.complete:
+                    break
+            head = level_end
+        del queue
+
+        self.players = array("i")
+        player = visited.find(1)
+        while player != -1:
+            self.players.append(player)
+            player = visited.find(1, player + 1)
+        self.parents = array("i", (parent[player] for player in self.players))
+        self.edges = array("i", (edge[player] for player in self.players))
+        self.seconds = time.perf_counter() - start
+
+    def __len__(self):
+        return len(self.players)
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.players) * BYTES_PER_PLAYER
+
+    def _index(self, player: int) -> int:
+        i = bisect_left(self.players, player)
+        return i if i < len(self.players) and self.players[i] == player else -1
+
+    def path(self, source: int) -> Optional[List[Tuple[int, int]]]:
+        """[(node, edge into node)] from source up the tree to the target, or None if not held"""
+        i = self._index(source)
+        if i == -1:
+            return None
+        hops = [(source, -1)]
+        while self.parents[i] != -1:
+            hops.append((self.parents[i], self.edges[i]))
+            i = self._index(self.parents[i])
+        return hops
+
+class TargetTrees:
+    """Path service for many targets over one GraphEngine.
+
+    Targets requested at least hot_after times get a TargetTree, kept in an
+    LRU bounded by max_bytes in total; each tree holds at most
+    max_bytes_per_tree worth of players. Cold targets, and players outside a
+    truncated tree, are answered by bidirectional BFS. Only one thread builds
+    a given target's tree; single requests arriving meanwhile use BFS too and
+    batches wait for it. Everything
+    is dropped when the engine is replaced, since trees index into its arrays.
+    """
+
+    def __init__(self, max_bytes_per_tree: int, max_bytes: int, hot_after: int = 3, max_depth: int = 6):
+        # A tree bigger than the whole cache would be built and never kept
+        self.max_players = max(1, min(max_bytes_per_tree, max_bytes) // BYTES_PER_PLAYER)
+        self.max_bytes = max_bytes
+        self.hot_after = hot_after
+        self.max_depth = max_depth
+        self.lock = threading.Lock()
+        self.engine: Optional[GraphEngine] = None
+        self.trees: OrderedDict = OrderedDict()   # target -> TargetTree
+        self.requests: Dict[str, int] = {}
+        self.building: Dict[str, threading.Event] = {}   # target -> set once its build finishes
+        self.nbytes = 0
+
+    def _tree(self, engine: GraphEngine, target: str, target_id: int, requests: int = 1,
+              wait: bool = False) -> Optional[TargetTree]:
+        """The target's tree, building it once the target is hot.
+
+        While another thread builds it, returns None, or with wait the tree
+        that thread built (a batch gains more from waiting than from BFS).
+        """
+        with self.lock:
+            if engine is not self.engine:
+                self.engine = engine
+                self.trees.clear()
+                self.requests.clear()
+                self.building.clear()
+                self.nbytes = 0
+            tree = self.trees.get(target)
+            if tree is not None:
+                self.trees.move_to_end(target)
+                return tree
+            self.requests[target] = self.requests.get(target, 0) + requests
+            if self.requests[target] < self.hot_after:
+                return None
+            building = self.building.get(target)
+            if building is None:
+                built = self.building[target] = threading.Event()
+        if building is not None:
+            if not wait:
+                return None
+            building.wait()
+            with self.lock:
+                return self.trees.get(target)
+
+        tree = None
+        try:
+            tree = TargetTree(engine, target_id, self.max_players, self.max_depth)
+            logger.info(f"Built path tree for {target}: {len(tree)} players, {tree.nbytes} bytes "
+                        f"in {tree.seconds:.2f}s{'' if tree.complete else ' (truncated)'}")
+        finally:
+            # Cached and released together, so no request sees neither and builds it again
+            with self.lock:
+                if self.building.get(target) is built:
+                    del self.building[target]
+                if tree is not None and engine is self.engine and tree.nbytes <= self.max_bytes:
+                    previous = self.trees.pop(target, None)
+                    if previous is not None:
+                        self.nbytes -= previous.nbytes
+                    self.trees[target] = tree
+                    self.nbytes += tree.nbytes
+                    while self.nbytes > self.max_bytes:
+                        _, evicted = self.trees.popitem(last=False)
+                        self.nbytes -= evicted.nbytes
+            built.set()
+        return tree
+
+    def find_path(self, engine: GraphEngine, username: str, target: str) -> Optional[Dict]:
+        """Same payload as graph.find_path, or None when the engine cannot answer"""
+        source_id = engine.ids.get(username)
+        target_id = engine.ids.get(target)
+        if source_id is None or target_id is None:
+            return None
+
+        tree = self._tree(engine, target, target_id)
+        CACHE_LOOKUPS.inc(cache="target_tree", result="miss" if tree is None else "hit")
+        hops = tree.path(source_id) if tree is not None else None
+        if hops is None and (tree is None or not tree.complete):
+            hops = engine.shortest_path(source_id, target_id, self.max_depth)
+        return engine.path_payload(hops) if hops is not None else None
+
+    def find_paths(self, engine: GraphEngine, usernames: List[str], target: str) -> Dict[str, Optional[Dict]]:
+        """find_path for a batch; each player counts as one request towards making the target hot"""
+        target_id = engine.ids.get(target)
+        if target_id is None:
+            return {username: None for username in usernames}
+
+        tree = self._tree(engine, target, target_id, requests=len(usernames), wait=True)
+        CACHE_LOOKUPS.inc(len(usernames), cache="target_tree", result="miss" if tree is None else "hit")
+        results = {}
+        for username in usernames:
+            source_id = engine.ids.get(username)
+            hops = None
+            if source_id is not None:
+                hops = tree.path(source_id) if tree is not None else None
+                if hops is None and (tree is None or not tree.complete):
+                    hops = engine.shortest_path(source_id, target_id, self.max_depth)
+            results[username] = engine.path_payload(hops) if hops is not None else None
+        return results
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {
+                "trees": {target: {"players": len(tree), "bytes": tree.nbytes, "complete": tree.complete}
+                          for target, tree in self.trees.items()},
+                "bytes": self.nbytes,
+                "max_bytes": self.max_bytes
+            }
@@ -0,0 +1,16 @@
+import os
+import sys
+import tempfile
+
+# Backend modules import each other by bare name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Integration tests run against the database in NEO4J_TEST_URI and are skipped without one
+if os.environ.get("NEO4J_TEST_URI"):
+    os.environ["NEO4J_URI"] = os.environ["NEO4J_TEST_URI"]
+
+# Settings need a database to point at; the drivers only connect on first use
+os.environ.setdefault("NEO4J_URI", "bolt://localhost:7687")
+os.environ.setdefault("NEO4J_USER", "neo4j")
+os.environ.setdefault("NEO4J_PASSWORD", "test")
+os.environ.setdefault("PATH_CACHE_SQLITE_PATH", os.path.join(tempfile.mkdtemp(), "paths.sqlite3"))
@@ -0,0 +1,72 @@
+import enhanced_ingest
+from enhanced_ingest import (CLEANUP_EDGES_QUERY, CLEANUP_ESTIMATE_QUERY, CLEANUP_ORPHANS_QUERY,
+                             EnhancedIngestion)
+
+class Record(dict):
+    def data(self):
+        return dict(self)
+
+class Session:
+    """Replays canned results for the cleanup queries"""
+
+    def __init__(self, batches, orphans):
+        self.batches = list(batches)
+        self.orphans = list(orphans)
+        self.queries = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def execute_write(self, work):
+        return work(self)
+
+    execute_read = execute_write
+
+    def run(self, cypher, **params):
+        self.queries.append(cypher)
+        if cypher == CLEANUP_EDGES_QUERY:
+            return [Record(row) for row in (self.batches.pop(0) if self.batches else [])]
+        if cypher == CLEANUP_ORPHANS_QUERY:
+            return [Record(row) for row in self.orphans.pop(0)]
+        raise AssertionError(cypher)
+
+class Driver:
+    def __init__(self, session):
+        self.session_ = session
+
+    def session(self, **kwargs):
+        return self.session_
+
+def test_cleanup_keeps_the_counters_in_step(monkeypatch):
+    session = Session(
+        batches=[[
+            # alice (level 1) lost two edges with 3 games; bob (level 2) and carol (unreached) one each
+            {"username": "alice", "level": 1, "edges": 2, "games": 3},
+            {"username": "bob", "level": 2, "edges": 1, "games": 1},
+            {"username": "carol", "level": None, "edges": 1, "games": 2},
+        ]],
+        orphans=[[{"level": 2, "players": 1}, {"level": None, "players": 1}]]
+    )
+    monkeypatch.setattr(enhanced_ingest, "driver", Driver(session))
+    added = []
+    monkeypatch.setattr(enhanced_ingest.schema_manager.graph_stats, "add", lambda **counts: added.append(counts))
+    ingestion = EnhancedIngestion()
+    rebuilt = []
+    monkeypatch.setattr(ingestion, "rebuild_distance_tree", lambda: rebuilt.append(True))
+
+    result = ingestion.cleanup_old_data(batch_size=10)
+
+    assert result == {"deleted_edges": 2, "deleted_games": 3, "deleted_players": 2}
+    assert added == [{"games": -3, "players": {2: -1, None: -1}, "level_games": {1: -3, 2: -1, None: -2}}]
+    assert rebuilt == [True]
+    assert CLEANUP_ESTIMATE_QUERY not in session.queries   # Only dry runs estimate
+
+def test_nothing_expired(monkeypatch):
+    session = Session(batches=[], orphans=[])
+    monkeypatch.setattr(enhanced_ingest, "driver", Driver(session))
+    ingestion = EnhancedIngestion()
+    monkeypatch.setattr(ingestion, "rebuild_distance_tree", lambda: (_ for _ in ()).throw(AssertionError))
+    assert ingestion.cleanup_old_data() == {"deleted_edges": 0, "deleted_games": 0, "deleted_players": 0}
@@ -0,0 +1,34 @@
+import asyncio
+import graph
+from path_filters import PathFilter
+
+PLAYERS = {"hikaru": {"username": "hikaru", "avatar": "a.png", "title": "GM"}}
+
+def fake_reads(monkeypatch):
+    """Answer player lookups from PLAYERS and record the name of every query run"""
+    queries = []
+
+    async def read_records(cypher, name, **params):
+        queries.append(name)
+        player = PLAYERS.get(params.get("username"))
+        return [player] if name == "player_path" and player else []
+    monkeypatch.setattr(graph, "read_records", read_records)
+    monkeypatch.setattr(graph.settings, "graph_engine_enabled", False)
+    return queries
+
+def test_path_to_self_is_one_node(monkeypatch):
+    queries = fake_reads(monkeypatch)
+    single = {"path": [PLAYERS["hikaru"]], "games": []}
+    assert asyncio.run(graph.find_path("Hikaru", "hikaru")) == single
+    assert asyncio.run(graph.find_path("hikaru", "hikaru", PathFilter(rated=True))) == single
+    assert asyncio.run(graph.find_path("nobody", "nobody")) == {"path": None, "games": None}
+    assert set(queries) == {"player_path"}
+
+def test_all_paths_to_self_is_one_path(monkeypatch):
+    queries = fake_reads(monkeypatch)
+    single = {"path": [PLAYERS["hikaru"]], "games": []}
+    result = asyncio.run(graph.find_all_paths("hikaru", "hikaru", k=5, rank="titled"))
+    assert result == {"count": 1, "count_capped": False, "length": 0, "paths": [single],
+                      "best": {**single, "score": {"titled_intermediaries": 0, "mean_end_time": None}}}
+    assert asyncio.run(graph.find_all_paths("nobody", "nobody"))["count"] == 0
+    assert set(queries) == {"player_path"}
@@ -0,0 +1,104 @@
+import random
+import threading
+import time
+from collections import deque
+import graph_engine
+from graph_engine import GraphEngine, get_engine
+
+def random_graph(players: int, edges: int, seed: int = 1) -> GraphEngine:
+    rng = random.Random(seed)
+    usernames = [f"p{i}" for i in range(players)]
+    rows = []
+    for n in range(edges):
+        a, b = rng.sample(usernames, 2)
+        rows.append((a, b, {"url": f"https://chess.com/game/{n}", "date": None, "end_time": n, "games": 1}))
+    return GraphEngine.from_edges([(u, None, None) for u in usernames], rows)
+
+def distances(engine: GraphEngine, source: int):
+    seen = {source: 0}
+    queue = deque([source])
+    while queue:
+        node = queue.popleft()
+        for neighbour in engine.neighbours(node):
+            if neighbour not in seen:
+                seen[neighbour] = seen[node] + 1
+                queue.append(neighbour)
+    return seen
+
+def test_from_edges_keeps_one_undirected_edge_per_pair():
+    engine = GraphEngine.from_edges(
+        [("a", None, None), ("b", None, None), ("c", None, None)],
+        [("a", "b", {"url": "1"}), ("b", "a", {"url": "2"}), ("b", "c", {"url": "3"}),
+         ("a", "a", {"url": "4"}), ("a", "zz", {"url": "5"})]
+    )
+    assert len(engine.games) == 2
+    assert sorted(engine.neighbours(engine.ids["b"])) == [engine.ids["a"], engine.ids["c"]]
+    assert [engine.ids["b"]] == list(engine.neighbours(engine.ids["a"]))
+
+def test_shortest_path_matches_bfs():
+    engine = random_graph(300, 500)
+    rng = random.Random(2)
+    for _ in range(200):
+        source, target = rng.randrange(300), rng.randrange(300)
+        expected = distances(engine, source).get(target)
+        hops = engine.shortest_path(source, target, max_depth=300)
+        if expected is None:
+            assert hops is None
+            continue
+        assert len(hops) - 1 == expected
+        assert hops[0] == (source, -1) and hops[-1][0] == target
+        # Every hop is a real edge into its node
+        for (previous, _), (node, edge) in zip(hops, hops[1:]):
+            i = list(engine.neighbours(previous)).index(node)
+            assert engine.edge_ids[engine.offsets[previous] + i] == edge
+
+def test_shortest_path_respects_max_depth():
+    chain = [(f"p{i}", f"p{i + 1}", {"url": str(i)}) for i in range(5)]
+    engine = GraphEngine.from_edges([(f"p{i}", None, None) for i in range(6)], chain)
+    assert engine.shortest_path(0, 5, max_depth=4) is None
+    assert len(engine.shortest_path(0, 5, max_depth=5)) == 6
+
+def test_find_path_payload():
+    engine = GraphEngine.from_edges(
+        [("alice", "a.png", "GM"), ("bob", None, None), ("magnuscarlsen", None, "GM")],
+        [("alice", "bob", {"url": "g1", "date": "d1"}), ("bob", "magnuscarlsen", {"url": "g2", "date": "d2"})]
+    )
+    payload = engine.find_path("alice")
+    assert [hop["username"] for hop in payload["path"]] == ["alice", "bob", "magnuscarlsen"]
+    assert payload["path"][0] == {"username": "alice", "avatar": "a.png", "title": "GM"}
+    assert payload["games"] == [{"url": "g1", "date": "d1"}, {"url": "g2", "date": "d2"}]
+    assert engine.find_path("nobody") is None
+
+def test_get_engine_rebuilds_once_and_serves_stale_meanwhile(monkeypatch):
+    stale = random_graph(10, 10)
+    stale.loaded_at = time.time() - 3600
+    monkeypatch.setattr(graph_engine, "_engine", stale)
+
+    started, release = threading.Event(), threading.Event()
+    loads = []
+
+    def load(driver):
+        loads.append(driver)
+        started.set()
+        release.wait(5)
+        return random_graph(10, 10)
+
+    monkeypatch.setattr(GraphEngine, "load", staticmethod(load))
+    rebuilding = threading.Thread(target=get_engine, args=("driver", 60))
+    rebuilding.start()
+    assert started.wait(5)
+
+    # Callers arriving during the rebuild neither wait nor start another load
+    results = []
+    others = [threading.Thread(target=lambda: results.append(get_engine("driver", 60))) for _ in range(8)]
+    for thread in others:
+        thread.start()
+    for thread in others:
+        thread.join(5)
+    assert results == [stale] * 8
+
+    release.set()
+    rebuilding.join(5)
+    assert len(loads) == 1
+    assert get_engine("driver", 60) is not stale
+    assert len(loads) == 1
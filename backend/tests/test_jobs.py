@@ -0,0 +1,67 @@
+import asyncio
+import threading
+import httpx
+import ingest
+import main
+from jobs import IngestQueue
+
+def test_request_is_served_while_a_job_writes(monkeypatch):
+    writing, release = threading.Event(), threading.Event()
+
+    async def recent_games(username, months):
+        return [{"white": {"username": "Alice"}, "black": {"username": "Bob"}}]
+
+    def write_player(players, profiles, games, months):
+        # Blocks like a slow Neo4j write; the loop must keep running meanwhile
+        writing.set()
+        release.wait(5)
+
+    async def profile(username):
+        return {}
+
+    monkeypatch.setattr(ingest, "get_recent_games", recent_games)
+    monkeypatch.setattr(ingest, "players_with_fresh_profiles", lambda usernames: set())
+    monkeypatch.setattr(ingest, "fetch_profile", profile)
+    monkeypatch.setattr(ingest, "_write_player", write_player)
+
+    async def scenario():
+        main.ingest_queue.start()
+        try:
+            job = main.ingest_queue.submit("alice")
+            assert await asyncio.to_thread(writing.wait, 5)
+
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                response = await asyncio.wait_for(client.get(f"/jobs/{job['id']}"), 2)
+            assert response.status_code == 200
+            assert response.json()["job"]["status"] == "running"
+
+            release.set()
+            finished = await main.ingest_queue.wait(job["id"], 5)
+            assert finished["status"] == "done"
+        finally:
+            release.set()
+            await main.ingest_queue.stop()
+
+    asyncio.run(scenario())
+
+def test_rejected_jobs_can_be_looked_up():
+    async def never(username):
+        await asyncio.Event().wait()
+
+    async def scenario():
+        queue = IngestQueue(never, workers=0, maxsize=1, cooldown_seconds=900, history=2)
+        queue.start()
+        queued = queue.submit("alice")
+        rejected = queue.submit("bob")
+        assert rejected["status"] == "rejected"
+        assert queue.get(rejected["id"]) is rejected
+        assert (await queue.wait(rejected["id"], 1))["status"] == "rejected"
+        # A rejection is not the player's job to reuse; the next submission tries again
+        assert queue.submit("bob")["id"] != rejected["id"]
+        # Rejections are pruned like finished jobs, never queued ones
+        assert queue.get(queued["id"]) is queued
+        assert len(queue.jobs) <= 2
+        await queue.stop()
+
+    asyncio.run(scenario())
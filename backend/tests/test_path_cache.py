@@ -0,0 +1,30 @@
+from path_cache import MemoryStore, PathCache, SQLiteStore
+
+RESULT = {"path": [{"username": "alice"}, {"username": "bob"}, {"username": "magnuscarlsen"}], "games": []}
+
+def test_sqlite_invalidation_reaches_other_processes(tmp_path):
+    # Two stores on one file stand in for the API and the scheduler
+    api = PathCache(SQLiteStore(str(tmp_path / "paths.sqlite3"), 100), 3600)
+    scheduler = PathCache(SQLiteStore(str(tmp_path / "paths.sqlite3"), 100), 3600)
+    api.set("alice", RESULT)
+    api.set("carol", {"path": [{"username": "carol"}, {"username": "magnuscarlsen"}], "games": []})
+
+    assert scheduler.invalidate_players(["bob"]) == 1
+    assert api.get("alice") is None
+    assert api.get("carol") is not None
+
+def test_memory_store_lru_and_invalidation():
+    cache = PathCache(MemoryStore(2), 3600)
+    cache.set("alice", RESULT)
+    cache.set("alice", RESULT, target="hikaru")
+    cache.set("dave", {"path": None, "games": []})
+    assert cache.get("alice") is None   # Least recently used, evicted
+    assert cache.get("alice", "hikaru") == RESULT
+    assert cache.invalidate_players(["bob"]) == 1
+    assert cache.get("alice", "hikaru") is None
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = PathCache(SQLiteStore(str(tmp_path / "paths.sqlite3"), 100), -1)
+    cache.set("alice", RESULT)
+    assert cache.get("alice") is None
+    assert cache.stats()["misses"] == 1
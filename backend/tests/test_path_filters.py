@@ -0,0 +1,154 @@
+import random
+from collections import deque
+from datetime import date
+import pytest
+from graph_engine import BUCKET_MONTHS, GraphEngine
+from path_filters import TIME_CLASSES, PathFilter, decode_kind, encode_kind, kind_token, parse_kind
+
+CLASSES = TIME_CLASSES + ("",)
+
+def random_token(rng: random.Random) -> str:
+    return f"{rng.randint(2019, 2025)}/{rng.randint(1, 12):02d}|{rng.choice(CLASSES)}|{rng.choice(('rated', 'casual'))}"
+
+def random_filter(rng: random.Random) -> PathFilter:
+    since = date(rng.randint(2019, 2025), rng.randint(1, 12), 1) if rng.random() < 0.5 else None
+    until = date(rng.randint(2019, 2025), rng.randint(1, 12), 1) if rng.random() < 0.5 else None
+    if since and until and since > until:
+        since, until = until, since
+    classes = rng.sample(TIME_CLASSES, rng.randint(1, 3)) if rng.random() < 0.5 else None
+    return PathFilter(classes, rng.choice((None, True, False)), since, until)
+
+def test_kind_token_uses_the_utc_month():
+    assert kind_token(1704067199, "blitz", True) == "2023/12|blitz|rated"
+    assert kind_token(1704067200, "", False) == "2024/01||casual"
+
+def test_encode_decode_round_trip():
+    rng = random.Random(1)
+    for _ in range(500):
+        token = random_token(rng)
+        assert decode_kind(encode_kind(token)) == parse_kind(token)
+
+def test_packed_codes_agree_with_matches():
+    rng = random.Random(2)
+    for _ in range(300):
+        path_filter = random_filter(rng)
+        mask = path_filter.kind_mask()
+        first, last = path_filter.month_range()
+        for _ in range(20):
+            token = random_token(rng)
+            code = encode_kind(token)
+            packed = first <= code >> 4 <= last and bool(mask >> (code & 15) & 1)
+            assert packed == path_filter.matches(parse_kind(token))
+
+def test_validation_and_describe():
+    with pytest.raises(ValueError, match="Unknown time class"):
+        PathFilter(["blitz", "hyperbullet"])
+    with pytest.raises(ValueError, match="since is after until"):
+        PathFilter(since=date(2024, 5, 1), until=date(2024, 1, 1))
+    assert not PathFilter()
+    assert PathFilter(rated=False)
+
+    path_filter = PathFilter(["blitz"], since=date(2024, 1, 1))
+    kinds = [parse_kind(t) for t in ("2023/12|blitz|rated", "2024/03|blitz|casual", "2024/01|blitz|rated",
+                                     "2024/02|bullet|rated")]
+    assert path_filter.describe(kinds) == {"time_classes": ["blitz"], "rated": [False, True],
+                                           "months": ["2024/01", "2024/03"]}
+    assert path_filter.describe(kinds[:1]) is None
+    assert path_filter.cypher_params() == {"classes": ["blitz"], "rated": None, "since": "2024/01", "until": None}
+
+def filtered_graph(seed: int = 3):
+    rng = random.Random(seed)
+    usernames = [f"p{i}" for i in range(250)]
+    edges = []
+    for n in range(600):
+        a, b = rng.sample(usernames, 2)
+        kinds = sorted({random_token(rng) for _ in range(rng.choice((0, 1, 1, 2, 4)))})
+        edges.append((a, b, {"url": str(n), "date": None, "end_time": n, "games": len(kinds), "kinds": kinds}))
+    tokens = {}
+    for a, b, game in edges:
+        tokens.setdefault(tuple(sorted((a, b))), game["kinds"])
+    return GraphEngine.from_edges([(u, None, None) for u in usernames], edges), tokens
+
+def edge_pairs(engine: GraphEngine):
+    pairs = {}
+    for node in range(len(engine)):
+        for neighbour, edge in engine.adjacent(node):
+            pairs[edge] = tuple(sorted((engine.usernames[node], engine.usernames[neighbour])))
+    return pairs
+
+def test_filtered_edges_match_the_kinds():
+    engine, tokens = filtered_graph()
+    pairs = edge_pairs(engine)
+    rng = random.Random(4)
+    for _ in range(100):
+        path_filter = random_filter(rng)
+        if not path_filter:
+            continue
+        edges = engine.filtered_edges(path_filter)
+        for node in range(len(engine)):
+            adjacent = edges.adjacent(node)
+            assert len(adjacent) == len(set(adjacent))
+            expected = {(neighbour, edge) for neighbour, edge in engine.adjacent(node)
+                        if any(path_filter.matches(parse_kind(token)) for token in tokens[pairs[edge]])}
+            assert set(adjacent) == expected
+
+def test_filtered_paths_are_shortest_over_allowed_edges():
+    engine, tokens = filtered_graph()
+    pairs = edge_pairs(engine)
+    rng = random.Random(5)
+    for _ in range(60):
+        path_filter = random_filter(rng)
+        if not path_filter:
+            continue   # Unfiltered: the plain search, which also uses edges without kinds
+        source, target = rng.randrange(len(engine)), rng.randrange(len(engine))
+
+        seen = {source: 0}
+        queue = deque([source])
+        while queue:
+            node = queue.popleft()
+            for neighbour, edge in engine.adjacent(node):
+                if neighbour not in seen and any(path_filter.matches(parse_kind(t)) for t in tokens[pairs[edge]]):
+                    seen[neighbour] = seen[node] + 1
+                    queue.append(neighbour)
+
+        payload = engine.find_path(engine.usernames[source], engine.usernames[target], 50, path_filter)
+        if target not in seen:
+            assert payload is None
+            continue
+        assert len(payload["path"]) - 1 == seen[target]
+        for game in payload["games"]:
+            assert game["matched"] is not None
+
+def test_partitions_list_each_kind_by_year():
+    engine, _ = filtered_graph()
+    for slot, (offsets, neighbors, edge_ids, buckets) in engine.kind_partitions.items():
+        for node in range(len(engine)):
+            entries = list(zip(buckets[offsets[node]:offsets[node + 1]], neighbors[offsets[node]:offsets[node + 1]],
+                               edge_ids[offsets[node]:offsets[node + 1]]))
+            assert entries == sorted(entries)
+            expected = {((code >> 4) // BUCKET_MONTHS, neighbour, edge)
+                        for neighbour, edge in engine.adjacent(node)
+                        for code in engine.kind_codes[engine.kind_offsets[edge]:engine.kind_offsets[edge + 1]]
+                        if code & 15 == slot}
+            assert set(entries) == expected
+
+class CountingCodes(list):
+    reads = 0
+
+    def __getitem__(self, i):
+        CountingCodes.reads += 1
+        return list.__getitem__(self, i)
+
+def test_filter_reads_only_its_partitions_and_buckets():
+    engine, _ = filtered_graph()
+    edges = engine.filtered_edges(PathFilter(["blitz"], True, since=date(2024, 1, 1)))
+    assert [part[0] for part in edges.parts] == [3]   # blitz (index 1) * 2 + rated
+
+    # Whole years in range: no edge has its kinds scanned
+    engine.kind_codes = CountingCodes(engine.kind_codes)
+    edges = engine.filtered_edges(PathFilter(since=date(2022, 1, 1), until=date(2023, 12, 1)))
+    assert any(edges.adjacent(node) for node in range(len(engine)))
+    assert CountingCodes.reads == 0
+    edges = engine.filtered_edges(PathFilter(since=date(2022, 3, 1), until=date(2023, 12, 1)))
+    assert any(edges.adjacent(node) for node in range(len(engine)))
+    assert CountingCodes.reads > 0
@@ -0,0 +1,54 @@
+import asyncio
+import json
+import httpx
+import main
+
+def test_concurrent_batches_over_the_limit_get_429(monkeypatch):
+    monkeypatch.setattr(main.settings, "paths_max_concurrent", 1)
+    monkeypatch.setattr(main, "path_cache", None)
+
+    async def scenario():
+        started, release = asyncio.Event(), asyncio.Event()
+
+        async def find_paths(usernames, target):
+            started.set()
+            await release.wait()
+            for username in usernames:
+                yield {"username": username, "path": None, "games": None}
+
+        monkeypatch.setattr(main, "find_paths", find_paths)
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            # Sent together, so both are checked before either starts streaming
+            requests = [asyncio.ensure_future(client.post("/paths", json={"usernames": [name]}))
+                        for name in ("alice", "bob")]
+            await asyncio.wait_for(started.wait(), 2)
+            done, _ = await asyncio.wait(requests, timeout=2, return_when=asyncio.FIRST_COMPLETED)
+            assert [task.result().status_code for task in done] == [429]
+
+            release.set()
+            responses = await asyncio.gather(*requests)
+            assert sorted(response.status_code for response in responses) == [200, 429]
+            ok = next(response for response in responses if response.status_code == 200)
+            assert json.loads(ok.text.splitlines()[0])["path"] is None
+
+            # The slot is free again once the stream has finished
+            response = await client.post("/paths", json={"usernames": ["carol"]})
+            assert response.status_code == 200
+        assert main.paths_in_progress == 0
+
+    asyncio.run(scenario())
+
+def test_too_many_usernames(monkeypatch):
+    monkeypatch.setattr(main.settings, "paths_max_usernames", 2)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post("/paths", json={"usernames": ["a", "b", "c", "A"]})
+            assert response.status_code == 413
+            response = await client.post("/paths", json={"usernames": ["a"], "target": "someone"})
+            assert response.status_code == 400
+        assert main.paths_in_progress == 0
+
+    asyncio.run(scenario())
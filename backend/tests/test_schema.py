@@ -0,0 +1,51 @@
+from datetime import datetime, timezone
+from schema import _aggregate_legacy_games, _time_class
+
+def epoch(year, month, day):
+    return int(datetime(year, month, day, 12, tzinfo=timezone.utc).timestamp())
+
+def legacy(url, end_time, time_control="180", result="win", white="alice"):
+    return {"url": url, "date": end_time, "result": result, "time_control": time_control,
+            "rated": True, "white": white}
+
+def test_time_class():
+    assert [_time_class(tc) for tc in ("60", "120+1", "180", "300+5", "600", "1/86400", "", "x")] == \
+        ["bullet", "bullet", "blitz", "blitz", "rapid", "daily", "", ""]
+
+def test_legacy_games_aggregate():
+    props = _aggregate_legacy_games([
+        legacy("g1", epoch(2023, 5, 1)),
+        # Symmetric legacy edges store a game twice; the copy with a result wins
+        legacy("g1", epoch(2023, 5, 1), result=None, white="bob"),
+        legacy("g2", epoch(2023, 6, 1), time_control="60"),
+    ])
+    assert props["games"] == 2
+    assert props["legacy_urls"] == ["g1", "g2"]
+    assert props["months"] == []
+    assert (props["first_url"], props["url"]) == ("g1", "g2")
+    assert (props["blitz_games"], props["bullet_games"], props["rapid_games"]) == (1, 1, 0)
+    assert props["kinds"] == ["2023/05|blitz|rated", "2023/06|bullet|rated"]
+
+def test_legacy_games_fold_into_an_existing_aggregated_edge():
+    existing = {
+        "games": 4, "months": ["2024/01"], "last_end_time": epoch(2024, 1, 20), "url": "new",
+        "first_end_time": epoch(2024, 1, 2), "first_url": "jan", "blitz_games": 4, "bullet_games": 0,
+        "rapid_games": 0, "daily_games": 0, "kinds": ["2024/01|blitz|rated"], "legacy_urls": ["older"]
+    }
+    props = _aggregate_legacy_games([
+        legacy("counted", epoch(2024, 1, 10)),         # Month recorded, already counted by ingest
+        legacy("older", epoch(2022, 3, 1)),            # Already folded in by an earlier run
+        legacy("missing", epoch(2023, 11, 1), time_control="600"),
+    ], existing)
+    assert props["games"] == 5
+    assert props["rapid_games"] == 1 and props["blitz_games"] == 4
+    assert props["legacy_urls"] == ["older", "missing"]
+    assert props["months"] == ["2024/01"]
+    assert (props["first_url"], props["first_end_time"]) == ("missing", epoch(2023, 11, 1))
+    assert (props["url"], props["last_end_time"]) == ("new", epoch(2024, 1, 20))
+    assert props["kinds"] == ["2024/01|blitz|rated", "2023/11|rapid|rated"]
+    assert existing["games"] == 4   # Not modified in place
+
+def test_nothing_new_keeps_the_existing_edge():
+    existing = {"games": 1, "months": ["2024/01"], "last_end_time": epoch(2024, 1, 20), "legacy_urls": []}
+    assert _aggregate_legacy_games([legacy("counted", epoch(2024, 1, 10))], existing) == existing
@@ -0,0 +1,30 @@
+import asyncio
+import os
+import uuid
+import pytest
+
+pytestmark = pytest.mark.skipif(not os.environ.get("NEO4J_TEST_URI"), reason="needs NEO4J_TEST_URI")
+
+def test_best_match_outside_the_alphabetical_first_candidates():
+    from graph import find_players_by_prefix
+    from ingest import driver, search_indexes
+    from search_index import SearchIndex
+
+    prefix = f"zzsearch{uuid.uuid4().hex[:8]}"
+    # 300 unranked players sort ahead of the one player who is close to Magnus
+    rows = [{"username": f"{prefix}a{i:03d}", "distance": None, "games": 0} for i in range(300)]
+    rows.append({"username": f"{prefix}zz", "distance": 1, "games": 5})
+    rows.append({"username": f"{prefix}zy", "distance": 1, "games": 50})
+    with driver.session() as session:
+        session.run("""
+        UNWIND $rows AS row
+        CREATE (p:Player {username: row.username})
+        SET p.distance_from_magnus = row.distance, p.games_played = row.games
+        """, rows=rows).consume()
+    try:
+        search_indexes.index = SearchIndex.load(driver)
+        results = asyncio.run(find_players_by_prefix(prefix, limit=3))
+        assert [r["username"] for r in results] == [f"{prefix}zy", f"{prefix}zz", f"{prefix}a000"]
+    finally:
+        with driver.session() as session:
+            session.run("MATCH (p:Player) WHERE p.username STARTS WITH $prefix DELETE p", prefix=prefix).consume()
@@ -0,0 +1,62 @@
+import random
+from search_index import BLOCK, SearchIndex, SearchIndexes, rank_key
+
+class CountingKeys(list):
+    """Keys that count how many times they are read"""
+    reads = 0
+
+    def __getitem__(self, i):
+        CountingKeys.reads += 1
+        return list.__getitem__(self, i)
+
+def brute_force(usernames, keys, prefix, limit):
+    matches = [(keys[i], name) for i, name in enumerate(usernames) if name.startswith(prefix)]
+    return [name for _, name in sorted(matches)[:limit]]
+
+def random_players(n, seed):
+    rng = random.Random(seed)
+    usernames = sorted({"".join(rng.choice("abc") for _ in range(rng.randint(1, 9))) for _ in range(n)})
+    rng.shuffle(usernames)
+    keys = [rank_key(rng.choice([None, 1, 2, 3, 4]), rng.randint(0, 500)) for _ in usernames]
+    return usernames, keys
+
+def test_matches_brute_force():
+    for seed in range(5):
+        usernames, keys = random_players(3000, seed)
+        index = SearchIndex(usernames, keys)
+        for prefix in ["", "a", "b", "ab", "cab", "abca", "bbbb", "cccccc", "d"]:
+            for limit in (1, 3, 10):
+                assert index.search(prefix, limit) == brute_force(usernames, keys, prefix, limit), (seed, prefix, limit)
+
+def test_best_match_outside_the_alphabetical_first_candidates():
+    usernames = [f"hik{i:05d}" for i in range(20000)] + ["hikzz", "hikzy"]
+    keys = [rank_key(None, 0)] * 20000 + [rank_key(1, 5), rank_key(1, 50)]
+    index = SearchIndex(usernames, keys)
+    assert index.search("hik", 3) == ["hikzy", "hikzz", "hik00000"]
+
+def test_rows_read_per_query_are_bounded():
+    usernames = [f"p{i:06d}" for i in range(100000)]
+    keys = [rank_key(random.randint(1, 6), random.randint(0, 1000)) for _ in usernames]
+    index = SearchIndex(usernames, keys)
+    expected = brute_force(usernames, keys, "p", 10)
+    index.keys = CountingKeys(index.keys)
+    CountingKeys.reads = 0
+    assert index.search("p", 10) == expected
+    # Two partial blocks plus top entries from O(log n) tree nodes, each key read
+    # a few times by the heap, instead of one read per matching player
+    assert CountingKeys.reads < 20 * (2 * BLOCK + 2 * 10 * 11)
+    assert CountingKeys.reads < len(usernames) / 10
+
+def test_indexes_keep_serving_while_building(monkeypatch):
+    built = []
+    monkeypatch.setattr(SearchIndex, "load", classmethod(lambda cls, driver: built.append(driver) or cls(["a"], [0])))
+    indexes = SearchIndexes(max_age_seconds=600, min_rebuild_seconds=0)
+    indexes.building = True
+    assert indexes.current("driver") is None and built == []
+    indexes.building = False
+    indexes._build("driver")
+    index = indexes.current("driver")
+    assert index.search("a") == ["a"] and built == ["driver"]
+    indexes.expire()
+    indexes.building = True
+    assert indexes.current("driver") is index
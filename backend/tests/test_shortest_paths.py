@@ -0,0 +1,103 @@
+import random
+from collections import deque
+from graph_engine import GraphEngine
+from path_filters import PathFilter
+from shortest_paths import ShortestPaths, describe_score, find_all_paths, score_key
+
+def graph(players: int, edges: int, seed: int) -> GraphEngine:
+    rng = random.Random(seed)
+    usernames = [f"p{i}" for i in range(players)]
+    rows = []
+    for n in range(edges):
+        a, b = rng.sample(usernames, 2)
+        kinds = [f"2024/{rng.randint(1, 12):02d}|{rng.choice(('blitz', 'rapid'))}|rated"]
+        rows.append((a, b, {"url": str(n), "date": None, "end_time": rng.randint(1, 10**6), "games": 1, "kinds": kinds}))
+    titles = [rng.choice(("GM", "IM", None, None, None)) for _ in usernames]
+    return GraphEngine.from_edges([(u, None, t) for u, t in zip(usernames, titles)], rows)
+
+def all_shortest(engine: GraphEngine, source: int, target: int):
+    """Every shortest path as [(node, edge into node)], by BFS layers from the source"""
+    distance = {source: 0}
+    queue = deque([source])
+    while queue:
+        node = queue.popleft()
+        for i in range(engine.offsets[node], engine.offsets[node + 1]):
+            if engine.neighbors[i] not in distance:
+                distance[engine.neighbors[i]] = distance[node] + 1
+                queue.append(engine.neighbors[i])
+    if target not in distance:
+        return []
+
+    def walks(node):
+        if node == source:
+            yield [(source, -1)]
+            return
+        for i in range(engine.offsets[node], engine.offsets[node + 1]):
+            previous = engine.neighbors[i]
+            if distance.get(previous) == distance[node] - 1:
+                for walk in walks(previous):
+                    yield walk + [(node, engine.edge_ids[i])]
+    return list(walks(target))
+
+def score(engine: GraphEngine, hops, rank: str):
+    titled = sum(1 for node, _ in hops[1:-1] if engine.titles[node])
+    return score_key(titled, [engine.games[edge]["end_time"] for _, edge in hops[1:]], rank)
+
+def test_counts_enumeration_and_best_match_brute_force():
+    engine = graph(120, 260, seed=1)
+    rng = random.Random(2)
+    for source, target in ((rng.randrange(120), rng.randrange(120)) for _ in range(150)):
+        expected = all_shortest(engine, source, target)
+        search = ShortestPaths(engine, source, target, max_depth=50)
+        assert search.count == len(expected)
+        if not expected:
+            assert search.best("titled") is None
+            continue
+        assert search.length == len(expected[0]) - 1
+
+        listed = search.paths(len(expected) + 5)
+        assert sorted(listed) == sorted(expected)
+        assert search.paths(3) == listed[:3]
+
+        for rank in ("titled", "recent"):
+            hops, described = search.best(rank)
+            assert hops in expected
+            assert score(engine, hops, rank) == max(score(engine, path, rank) for path in expected)
+            titled = sum(1 for node, _ in hops[1:-1] if engine.titles[node])
+            assert described == describe_score(titled, [engine.games[edge]["end_time"] for _, edge in hops[1:]])
+
+def test_path_count_grows_without_enumerating():
+    # A chain of diamonds: 2^layers shortest paths from one end to the other
+    layers = 24
+    players, edges = ["n0"], []
+    for layer in range(layers):
+        top, bottom, end = f"t{layer}", f"b{layer}", f"n{layer + 1}"
+        players += [top, bottom, end]
+        for a, b in ((f"n{layer}", top), (f"n{layer}", bottom), (top, end), (bottom, end)):
+            edges.append((a, b, {"url": f"{a}-{b}", "date": None, "end_time": 1, "games": 1}))
+    engine = GraphEngine.from_edges([(p, None, None) for p in players], edges)
+    search = ShortestPaths(engine, engine.ids["n0"], engine.ids[f"n{layers}"], max_depth=2 * layers)
+    assert search.count == 2 ** layers
+    assert search.length == 2 * layers
+    assert len(search.paths(10)) == 10
+
+def test_find_all_paths_payload_and_filter():
+    engine = GraphEngine.from_edges(
+        [("a", None, None), ("b", None, "GM"), ("c", None, None), ("d", None, None)],
+        [("a", "b", {"url": "ab", "date": None, "end_time": 5, "kinds": ["2024/01|blitz|rated"]}),
+         ("b", "d", {"url": "bd", "date": None, "end_time": 5, "kinds": ["2024/01|blitz|rated"]}),
+         ("a", "c", {"url": "ac", "date": None, "end_time": 9, "kinds": ["2024/01|rapid|rated"]}),
+         ("c", "d", {"url": "cd", "date": None, "end_time": 9, "kinds": ["2024/01|rapid|rated"]})]
+    )
+    result = find_all_paths(engine, "a", "d", k=5, rank="titled")
+    assert (result["count"], result["length"], result["count_capped"]) == (2, 2, False)
+    assert [hop["username"] for hop in result["best"]["path"]] == ["a", "b", "d"]
+    assert result["best"]["score"]["titled_intermediaries"] == 1
+    recent = find_all_paths(engine, "a", "d", k=1, rank="recent")
+    assert len(recent["paths"]) == 1
+    assert [hop["username"] for hop in recent["best"]["path"]] == ["a", "c", "d"]
+
+    rapid = find_all_paths(engine, "a", "d", k=5, path_filter=PathFilter(["rapid"]))
+    assert rapid["count"] == 1 and rapid["paths"][0]["games"][0]["matched"]["time_classes"] == ["rapid"]
+    assert find_all_paths(engine, "a", "d", k=5, path_filter=PathFilter(["bullet"])) is None
+    assert find_all_paths(engine, "a", "zz", k=5) is None
@@ -0,0 +1,97 @@
+import os
+import struct
+import time
+import pytest
+import graph_engine
+from graph_engine import GraphEngine, get_engine
+from path_filters import PathFilter
+from snapshot import HEADER, Snapshot, SnapshotError, write_snapshot
+
+def sample_engine() -> GraphEngine:
+    players = [("alice", "a.png", "GM"), ("bob", None, None), ("magnuscarlsen", "m.png", "GM"), ("élodie", "", "WFM")]
+    edges = [
+        ("alice", "bob", {"url": "g1", "date": None, "end_time": 1700000000, "games": 3,
+                          "kinds": ["2023/11|blitz|rated", "2023/10|bullet|casual"]}),
+        ("bob", "magnuscarlsen", {"url": "g2", "date": None, "end_time": 1710000000, "games": 1,
+                                  "kinds": ["2024/03|rapid|rated"]}),
+        ("élodie", "alice", {"url": "g3", "date": None, "end_time": None, "games": None, "kinds": None}),
+    ]
+    return GraphEngine.from_edges(players, edges)
+
+def write(engine: GraphEngine, path: str, kinds: bool = True) -> int:
+    return write_snapshot(str(path), engine.usernames, engine.avatars, engine.titles,
+                          engine.offsets, engine.neighbors, engine.edge_ids, engine.games, 1234.5,
+                          engine.kind_offsets if kinds else None, engine.kind_codes if kinds else None,
+                          engine.kind_partitions if kinds else None)
+
+def test_round_trip(tmp_path):
+    engine = sample_engine()
+    size = write(engine, tmp_path / "graph.snapshot")
+    assert size == os.path.getsize(tmp_path / "graph.snapshot")
+
+    mapped = GraphEngine.from_snapshot(str(tmp_path / "graph.snapshot"))
+    assert list(mapped.usernames) == engine.usernames
+    assert list(mapped.avatars) == ["a.png", "", "m.png", ""]
+    assert list(mapped.titles) == ["GM", "", "GM", "WFM"]
+    assert list(mapped.offsets) == list(engine.offsets)
+    assert list(mapped.neighbors) == list(engine.neighbors)
+    assert list(mapped.edge_ids) == list(engine.edge_ids)
+    assert list(mapped.kind_codes) == list(engine.kind_codes)
+    assert sorted(mapped.kind_partitions) == sorted(engine.kind_partitions)
+    for slot, columns in engine.kind_partitions.items():
+        assert [list(column) for column in mapped.kind_partitions[slot]] == [list(column) for column in columns]
+    assert mapped.find_path("alice", "magnuscarlsen", path_filter=PathFilter(["rapid"])) is None
+    assert len(mapped.find_path("bob", "magnuscarlsen", path_filter=PathFilter(["rapid"]))["path"]) == 2
+    assert mapped.refreshed_at == 1234.5
+    assert mapped.games[0]["url"] == "g1" and mapped.games[0]["games"] == 3
+    assert mapped.games[2] == {"url": "g3", "date": None, "end_time": None, "games": 1}
+    assert mapped.find_path("élodie") == {
+        "path": [{"username": u, "avatar": a, "title": t} for u, a, t in
+                 [("élodie", "", "WFM"), ("alice", "a.png", "GM"), ("bob", "", ""), ("magnuscarlsen", "m.png", "GM")]],
+        "games": [{"url": g["url"], "date": g["date"]} for g in (mapped.games[2], mapped.games[0], mapped.games[1])]
+    }
+
+def test_snapshot_without_kinds_cannot_filter(tmp_path):
+    write(sample_engine(), tmp_path / "graph.snapshot", kinds=False)
+    mapped = GraphEngine.from_snapshot(str(tmp_path / "graph.snapshot"))
+    assert mapped.kind_offsets is None and mapped.kind_partitions is None
+    assert mapped.find_path("alice") is not None
+
+def test_engine_ages_from_when_the_snapshot_was_taken(tmp_path, monkeypatch):
+    path = tmp_path / "graph.snapshot"
+    monkeypatch.setattr(time, "time", lambda: 1_000_000.0)
+    write(sample_engine(), path)
+    monkeypatch.undo()
+    assert GraphEngine.from_snapshot(str(path)).loaded_at == 1_000_000.0
+
+    # A snapshot older than the max age is replaced from Neo4j straight away
+    monkeypatch.setattr(graph_engine, "_engine", None)
+    fresh = sample_engine()
+    monkeypatch.setattr(GraphEngine, "load", staticmethod(lambda driver: fresh))
+    assert get_engine("driver", 3600, str(path)) is fresh
+
+    write(sample_engine(), path)
+    monkeypatch.setattr(graph_engine, "_engine", None)
+    assert get_engine("driver", 3600, str(path)) is not fresh
+
+def test_rejects_bad_files(tmp_path):
+    path = tmp_path / "graph.snapshot"
+    path.write_bytes(b"short")
+    with pytest.raises(SnapshotError, match="too short"):
+        Snapshot(str(path))
+
+    path.write_bytes(b"X" * 200)
+    with pytest.raises(SnapshotError, match="not a graph snapshot"):
+        Snapshot(str(path))
+
+    write(sample_engine(), path)
+    data = bytearray(path.read_bytes())
+    struct.pack_into("<I", data, 8, 99)
+    path.write_bytes(bytes(data))
+    with pytest.raises(SnapshotError, match="version 99"):
+        Snapshot(str(path))
+
+    write(sample_engine(), path)
+    path.write_bytes(path.read_bytes()[:HEADER.size + 100])
+    with pytest.raises(SnapshotError, match="truncated"):
+        Snapshot(str(path))
@@ -0,0 +1,98 @@
+import random
+import threading
+import time
+import target_trees
+from target_trees import BYTES_PER_PLAYER, TargetTree, TargetTrees
+from test_graph_engine import distances, random_graph
+
+def test_tree_paths_are_shortest():
+    engine = random_graph(400, 700)
+    target = 7
+    tree = TargetTree(engine, target, max_players=10_000, max_depth=100)
+    expected = distances(engine, target)
+    assert tree.complete and len(tree) == len(expected)
+    assert tree.nbytes == len(tree) * BYTES_PER_PLAYER
+    for source in range(len(engine)):
+        hops = tree.path(source)
+        if source not in expected:
+            assert hops is None
+            continue
+        assert len(hops) - 1 == expected[source]
+        assert hops[0] == (source, -1) and hops[-1][0] == target
+
+def test_truncated_tree_answers_what_it_holds():
+    engine = random_graph(400, 700)
+    tree = TargetTree(engine, 7, max_players=50)
+    assert not tree.complete and len(tree) == 50
+    expected = distances(engine, 7)
+    for player in tree.players:
+        assert len(tree.path(player)) - 1 == expected[player]
+
+def test_service_falls_back_to_bfs_outside_a_truncated_tree():
+    engine = random_graph(400, 700)
+    expected = distances(engine, 7)
+    target = engine.usernames[7]
+    trees = TargetTrees(max_bytes_per_tree=50 * BYTES_PER_PLAYER, max_bytes=10_000, hot_after=2)
+
+    assert trees.find_path(engine, "p1", target) is not None
+    assert trees.stats()["trees"] == {}   # Cold: one request so far
+    rng = random.Random(3)
+    for username in rng.sample(engine.usernames, 100):
+        payload = trees.find_path(engine, username, target)
+        node = engine.ids[username]
+        if expected.get(node, 99) <= trees.max_depth:
+            assert len(payload["path"]) - 1 == expected[node]
+        else:
+            assert payload is None
+    assert trees.stats()["trees"][target] == {"players": 50, "bytes": 50 * BYTES_PER_PLAYER, "complete": False}
+
+def test_lru_is_bounded_and_reset_with_the_engine():
+    engine = random_graph(100, 300)
+    trees = TargetTrees(max_bytes_per_tree=100 * BYTES_PER_PLAYER, max_bytes=150 * BYTES_PER_PLAYER, hot_after=1)
+    batch = trees.find_paths(engine, ["p1", "p2", "nobody"], "p3")
+    assert batch["nobody"] is None and batch["p1"] is not None
+    trees.find_path(engine, "p1", "p4")
+    assert list(trees.stats()["trees"]) == ["p4"]   # p3's tree was evicted to stay under max_bytes
+    assert trees.stats()["bytes"] <= trees.max_bytes
+
+    trees.find_path(random_graph(100, 300, seed=9), "p1", "p5")
+    assert list(trees.stats()["trees"]) == ["p5"]
+
+def test_per_tree_cap_is_clamped_to_the_cache():
+    trees = TargetTrees(max_bytes_per_tree=1000 * BYTES_PER_PLAYER, max_bytes=60 * BYTES_PER_PLAYER, hot_after=1)
+    assert trees.max_players == 60
+    engine = random_graph(400, 700)
+    trees.find_path(engine, "p1", "p7")
+    assert trees.stats()["trees"]["p7"]["players"] == 60   # Built at the cap and kept
+
+def test_one_thread_builds_a_target(monkeypatch):
+    engine = random_graph(400, 700)
+    expected = distances(engine, 7)
+    builds = []
+
+    def slow_tree(*args):
+        builds.append(args)
+        time.sleep(0.2)
+        return TargetTree(*args)
+    monkeypatch.setattr(target_trees, "TargetTree", slow_tree)
+
+    trees = TargetTrees(max_bytes_per_tree=10_000, max_bytes=10_000, hot_after=1)
+    sources = [f"p{i}" for i in range(20)]
+    results = {}
+
+    def request(username):
+        if username == "p0":
+            results.update(trees.find_paths(engine, sources, "p7"))
+        else:
+            results.setdefault(username, trees.find_path(engine, username, "p7"))
+    threads = [threading.Thread(target=request, args=(username,)) for username in sources]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(builds) == 1 and "p7" in trees.stats()["trees"]
+    for username in sources:
+        node = engine.ids[username]
+        if expected.get(node, 99) <= trees.max_depth:
+            assert len(results[username]["path"]) - 1 == expected[node]
@@ -0,0 +1,49 @@
+from datetime import datetime, timezone
+from writer import GraphWriter
+
+def epoch(year, month, day, hour=12):
+    return int(datetime(year, month, day, hour, tzinfo=timezone.utc).timestamp())
+
+def game(white, black, end_time, url, time_class="blitz", rated=True):
+    return {"white": white, "black": black, "end_time": end_time, "url": url, "result": "win",
+            "time_control": "180", "time_class": time_class, "rated": rated}
+
+def test_games_fold_into_one_row_per_pair_and_month():
+    writer = GraphWriter(driver=None)
+    writer.add_game(game("bob", "alice", epoch(2024, 3, 5), "g1"))
+    writer.add_game(game("alice", "bob", epoch(2024, 3, 1), "g2", time_class="bullet", rated=False))
+    writer.add_game(game("alice", "bob", epoch(2024, 3, 9), "g3"))
+    writer.add_game(game("alice", "bob", epoch(2024, 4, 2), "g4"))
+    writer.add_game(game("alice", "bob", None, "g5"))   # Cannot be dated or de-duplicated
+
+    assert sorted(writer.games) == [("alice", "bob", "2024/03"), ("alice", "bob", "2024/04")]
+    march = writer.games[("alice", "bob", "2024/03")]
+    assert march["urls"] == ["g1", "g2", "g3"]
+    assert march["classes"] == ["blitz", "bullet", "blitz"]
+    assert march["kinds"] == ["2024/03|blitz|rated", "2024/03|bullet|casual"]
+    assert (march["first_url"], march["first_end_time"]) == ("g2", epoch(2024, 3, 1))
+    assert (march["url"], march["last_end_time"], march["white"]) == ("g3", epoch(2024, 3, 9), "alice")
+
+    # The pair's most recent game is what tree repair links them by
+    assert writer.edges_written[("alice", "bob")]["url"] == "g4"
+
+def test_months_split_in_utc():
+    writer = GraphWriter(driver=None)
+    writer.add_game(game("a", "b", epoch(2024, 1, 31, hour=23), "late"))
+    writer.add_game(game("a", "b", epoch(2024, 2, 1, hour=0), "early"))
+    assert sorted(month for _, _, month in writer.games) == ["2024/01", "2024/02"]
+
+def test_players_merge_into_one_row():
+    writer = GraphWriter(driver=None)
+    writer.add_player("alice", {"title": "GM"})
+    writer.add_player("alice", {"avatar": "a.png"}, touch=True)
+    writer.add_player("alice")
+    assert writer.players["alice"] == {"username": "alice", "props": {"title": "GM", "avatar": "a.png"}, "touch": True}
+    assert writer.pending() == 1
+
+def test_count_credits_added_games_to_both_levels():
+    writer = GraphWriter(driver=None)
+    calls = []
+    writer.graph_stats.add = lambda **counts: calls.append(counts)
+    writer._count(2, [{"added": 3, "a_level": 1, "b_level": None}, {"added": 2, "a_level": 1, "b_level": 2}])
+    assert calls == [{"games": 5, "players": {None: 2}, "level_games": {1: 5, None: 3, 2: 2}}]
@@ -0,0 +1,204 @@
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Set, Tuple
+import logging
+from graph_stats import GraphStats
+from path_filters import kind_token
+from metrics import ROWS_WRITTEN, WRITE_ROWS_PER_SECOND, query, span
+
+logger = logging.getLogger(__name__)
+
+PLAYER_QUERY = """
+UNWIND $rows AS row
+MERGE (p:Player {username: row.username})
+SET p += row.props
+WITH p, row WHERE row.touch
+SET p.last_updated = datetime()
+"""
+
+# One PLAYED edge per player pair, directed from the lexicographically smaller
+# username, aggregating every game the pair played. Each row carries one pair's
+# games from one calendar month (UTC). A month already recorded on the edge only
+# contributes games newer than the latest one counted, so the same games seen
+# again (from the opponent's archive, or a re-run) are not counted twice. Rows
+# that added games return the count and the endpoints' distance tree levels,
+# for the running totals in graph_stats.
+EDGE_QUERY = """
+UNWIND $rows AS row
+MATCH (a:Player {username: row.a}), (b:Player {username: row.b})
+MERGE (a)-[r:PLAYED]->(b)
+WITH a, b, r, row,
+     row.month IN coalesce(r.months, []) AS seen,
+     coalesce(r.last_end_time, 0) AS last_end_time,
+     coalesce(r.legacy_urls, []) AS legacy_urls
+WITH a, b, r, row,
+     [i IN range(0, size(row.end_times) - 1)
+      WHERE (NOT seen OR row.end_times[i] > last_end_time) AND NOT row.urls[i] IN legacy_urls
+      | row.classes[i]] AS fresh,
+     r.first_end_time IS NULL OR row.first_end_time < r.first_end_time AS earlier,
+     r.last_end_time IS NULL OR row.last_end_time >= r.last_end_time AS later
+SET r.games = coalesce(r.games, 0) + size(fresh),
+    r.bullet_games = coalesce(r.bullet_games, 0) + size([c IN fresh WHERE c = 'bullet']),
+    r.blitz_games = coalesce(r.blitz_games, 0) + size([c IN fresh WHERE c = 'blitz']),
+    r.rapid_games = coalesce(r.rapid_games, 0) + size([c IN fresh WHERE c = 'rapid']),
+    r.daily_games = coalesce(r.daily_games, 0) + size([c IN fresh WHERE c = 'daily']),
+    r.months = CASE WHEN row.month IN coalesce(r.months, []) THEN r.months
+                    ELSE coalesce(r.months, []) + row.month END,
+    r.kinds = coalesce(r.kinds, []) + [k IN row.kinds WHERE NOT k IN coalesce(r.kinds, [])],
+    r.first_url = CASE WHEN earlier THEN row.first_url ELSE r.first_url END,
+    r.first_date = CASE WHEN earlier THEN row.first_date ELSE r.first_date END,
+    r.first_end_time = CASE WHEN earlier THEN row.first_end_time ELSE r.first_end_time END,
+    r.url = CASE WHEN later THEN row.url ELSE r.url END,
+    r.date = CASE WHEN later THEN row.date ELSE r.date END,
+    r.white = CASE WHEN later THEN row.white ELSE r.white END,
+    r.result = CASE WHEN later THEN row.result ELSE r.result END,
+    r.time_control = CASE WHEN later THEN row.time_control ELSE r.time_control END,
+    r.rated = CASE WHEN later THEN row.rated ELSE r.rated END,
+    r.last_end_time = CASE WHEN later THEN row.last_end_time ELSE r.last_end_time END
+WITH a, b, size(fresh) AS added WHERE added > 0
+RETURN added,
+       CASE WHEN a.parent IS NOT NULL OR a.distance_from_magnus = 0 THEN a.distance_from_magnus END AS a_level,
+       CASE WHEN b.parent IS NOT NULL OR b.distance_from_magnus = 0 THEN b.distance_from_magnus END AS b_level
+"""
+
+class GraphWriter:
+    """Collects Player nodes and PLAYED edges and writes them as UNWIND batches.
+
+    Games are folded into one row per player pair and month and flushed in
+    explicit write transactions of at most `batch_size` rows, nodes before
+    edges so the edge batches can MATCH their endpoints. Rows are only written
+    on flush() or at exit, so callers streaming archives flush between
+    archives (maybe_flush) and never split a pair's month across two writes.
+    Each flush also updates the GraphStats counters with the games and players
+    it added.
+    """
+
+    def __init__(self, driver, batch_size: int = 1000, on_flush: Optional[Callable[[], None]] = None):
+        self.driver = driver
+        self.graph_stats = GraphStats(driver)
+        self.batch_size = batch_size
+        self.on_flush = on_flush
+        self.players: Dict[str, Dict] = {}
+        self.games: Dict[Tuple[str, str, str], Dict] = {}
+        # Player pairs linked and players written, for tree repair and path cache invalidation
+        self.edges_written: Dict[Tuple[str, str], Dict] = {}
+        self.players_written: Set[str] = set()
+        self.rows_written = 0
+        self.seconds = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+
+    def pending(self) -> int:
+        return len(self.players) + len(self.games)
+
+    def add_player(self, username: str, props: Optional[Dict] = None, touch: bool = False):
+        """Queue a Player MERGE; repeated calls for one username are merged into one row"""
+        row = self.players.setdefault(username, {"username": username, "props": {}, "touch": False})
+        self.players_written.add(username)
+        if props:
+            row["props"].update(props)
+        row["touch"] = row["touch"] or touch
+
+    def add_game(self, game: Dict):
+        """Fold a reduced game record into its pair's PLAYED edge row for the game's month"""
+        end_time = game.get("end_time")
+        if not end_time:
+            return   # Without an end time the game cannot be placed or de-duplicated
+        a, b = sorted((game["white"], game["black"]))
+        month = datetime.fromtimestamp(end_time, timezone.utc).strftime("%Y/%m")
+        date = datetime.fromtimestamp(end_time)
+        url = game.get("url", "")
+
+        row = self.games.get((a, b, month))
+        if row is None:
+            row = self.games[(a, b, month)] = {
+                "a": a, "b": b, "month": month, "end_times": [], "urls": [], "classes": [], "kinds": [],
+                "first_end_time": end_time, "first_url": url, "first_date": date, "last_end_time": 0
+            }
+        row["end_times"].append(end_time)
+        row["urls"].append(url)
+        row["classes"].append(game.get("time_class", ""))
+        kind = kind_token(end_time, game.get("time_class", ""), game.get("rated", False))
+        if kind not in row["kinds"]:
+            row["kinds"].append(kind)
+        if end_time < row["first_end_time"]:
+            row.update(first_end_time=end_time, first_url=url, first_date=date)
+        if end_time >= row["last_end_time"]:
+            row.update(
+                last_end_time=end_time,
+                url=url,
+                date=date,
+                white=game["white"],
+                result=game.get("result", ""),
+                time_control=game.get("time_control", ""),
+                rated=game.get("rated", False)
+            )
+            latest = self.edges_written.get((a, b))
+            if latest is None or end_time >= latest["end_time"]:
+                self.edges_written[(a, b)] = {"url": url, "date": date, "end_time": end_time}
+
+    def maybe_flush(self):
+        """Flush once a batch worth of rows is queued; call between archives"""
+        if self.pending() >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending():
+            return
+
+        start = time.perf_counter()
+        rows = len(self.players) + len(self.games)
+        with span("graph_write", players=len(self.players), edges=len(self.games)):
+            with self.driver.session() as session:
+                created, _ = self._write(session, "write_players", PLAYER_QUERY, list(self.players.values()))
+                _, added = self._write(session, "write_edges", EDGE_QUERY, list(self.games.values()))
+            self._count(created, added)
+        elapsed = time.perf_counter() - start
+
+        self.players = {}
+        self.games = {}
+        self.rows_written += rows
+        self.seconds += elapsed
+        if elapsed:
+            WRITE_ROWS_PER_SECOND.set(round(rows / elapsed, 1))
+        logger.debug(f"Flushed {rows} rows in {elapsed:.2f}s ({rows / elapsed if elapsed else 0:.0f} rows/s)")
+        if self.on_flush is not None:
+            self.on_flush()
+
+    def _write(self, session, name: str, cypher: str, rows: List[Dict]) -> Tuple[int, List[Dict]]:
+        """Run the batches; returns the nodes created and the records returned"""
+        def work(tx, batch):
+            result = tx.run(cypher, rows=batch)
+            records = [record.data() for record in result]
+            return result.consume().counters.nodes_created, records
+
+        created, records = 0, []
+        for i in range(0, len(rows), self.batch_size):
+            batch = rows[i:i + self.batch_size]
+            with query(name):
+                batch_created, batch_records = session.execute_write(work, batch)
+            created += batch_created
+            records.extend(batch_records)
+            ROWS_WRITTEN.inc(len(batch), query=name)
+        return created, records
+
+    def _count(self, created: int, added: List[Dict]):
+        """New players start unreached; each added game counts towards both players' levels"""
+        level_games: Dict[Optional[int], int] = {}
+        for record in added:
+            for level in (record["a_level"], record["b_level"]):
+                level_games[level] = level_games.get(level, 0) + record["added"]
+        self.graph_stats.add(games=sum(record["added"] for record in added),
+                             players={None: created}, level_games=level_games)
+
+    def stats(self) -> Dict:
+        return {
+            "rows_written": self.rows_written,
+            "seconds": round(self.seconds, 3),
+            "rows_per_second": round(self.rows_written / self.seconds, 1) if self.seconds else 0.0,
+        }